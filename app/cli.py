@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import AsyncIterator, BinaryIO
+
+from app import config
+from app.services.batcher import MicroBatcher
+from app.services.bulk import classify_ndjson, iter_lines
+from app.services.classifier import build_classifier
+
+
+async def read_chunks(stream: BinaryIO, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    # File reads run in a worker thread so the classification tasks keep running meanwhile
+    while True:
+        chunk = await asyncio.to_thread(stream.read, chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def classify_file(args) -> Counter:
+    classifier = build_classifier()
+    batcher = None
+    if config.CLASSIFY_MICROBATCH_WINDOW_MS > 0:
+        batcher = MicroBatcher(
+            classifier.classify_batch,
+            max_batch_size=config.CLASSIFY_MICROBATCH_MAX_SIZE,
+            max_wait_ms=config.CLASSIFY_MICROBATCH_WINDOW_MS,
+        )
+
+    async def classify(text: str):
+        if batcher is not None and not classifier.is_long(text):
+            return await batcher.submit(text, args.prompt_type)
+        return (await classifier.classify_long(text, args.prompt_type))[:3]
+
+    counts: Counter = Counter()
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        async for result in classify_ndjson(iter_lines(read_chunks(source)), classify, args.concurrency):
+            counts[result.get("class", "error")] += 1
+            sink.write(json.dumps(result) + "\n")
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="Classify an NDJSON file of texts, writing one NDJSON result per line as it finishes.",
+    )
+    parser.add_argument("input", help='NDJSON file of {"id": ..., "text": ...} records or JSON strings ("-" for stdin)')
+    parser.add_argument("-o", "--output", default="-", help='where to write results (default "-" for stdout)')
+    parser.add_argument("-c", "--concurrency", type=int, default=config.BULK_CONCURRENCY)
+    parser.add_argument("-p", "--prompt-type", choices=["baseline", "advanced", "cascade", "dynamic"], default="advanced")
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    counts = asyncio.run(classify_file(args))
+    elapsed = time.time() - start_time
+    total = sum(counts.values())
+    print(
+        f"classified {total} records in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s): {dict(counts)}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(APP_DIR, "data"))
+
+# Logging
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")                            # "size" or "time"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))      # size rotation threshold
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")                  # time rotation interval (TimedRotatingFileHandler)
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))                  # records waiting for the writer thread; extra are dropped
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1"))  # fraction of per-request success logs kept
+
+# LLM client
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")                          # "gemini" or "fake" (local model for load tests)
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "32"))                # concurrent provider calls
+LLM_RATE_LIMIT_PER_S = float(os.getenv("LLM_RATE_LIMIT_PER_S", "50"))        # token-bucket rate, match to provider quota
+LLM_MIN_RATE_PER_S = float(os.getenv("LLM_MIN_RATE_PER_S", "1"))             # floor for the AIMD backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))                     # retries on 429/5xx/timeouts
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "8"))
+LLM_REQUEST_DEADLINE_S = float(os.getenv("LLM_REQUEST_DEADLINE_S", "30"))    # total budget per classification incl. retries
+
+# Fake provider (LLM_PROVIDER=fake)
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))         # median call latency
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))   # log-normal spread, 0 = constant
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))           # fraction of calls failing with a 503
+
+# Batch classification
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "20"))          # texts packed into one LLM call
+CLASSIFY_BATCH_MAX_ITEMS = int(os.getenv("CLASSIFY_BATCH_MAX_ITEMS", "500"))  # texts accepted per /classify/batch request
+
+# Long texts (token counts are estimated locally, ~4 characters per token)
+CLASSIFY_CHUNK_TOKENS = int(os.getenv("CLASSIFY_CHUNK_TOKENS", "1000"))            # longer texts are classified as chunks of this size; 0 disables
+CLASSIFY_CHUNK_OVERLAP_TOKENS = int(os.getenv("CLASSIFY_CHUNK_OVERLAP_TOKENS", "50"))  # repeated between neighbouring chunks
+CLASSIFY_CHUNK_COMBINE = os.getenv("CLASSIFY_CHUNK_COMBINE", "any_toxic")           # any_toxic, majority or max_confidence
+CLASSIFY_MAX_INPUT_TOKENS = int(os.getenv("CLASSIFY_MAX_INPUT_TOKENS", "20000"))    # longer texts are rejected with 413; 0 disables
+
+# Prompt routing
+CLASSIFY_DEFAULT_PROMPT = os.getenv("CLASSIFY_DEFAULT_PROMPT", "advanced")   # prompt for /classify: baseline, advanced or cascade
+CASCADE_SAMPLE_RATE = float(os.getenv("CASCADE_SAMPLE_RATE", "0.02"))        # share of confident baseline answers re-checked with advanced
+CASCADE_ESCALATE_LABELS = [label.strip().lower() for label in os.getenv("CASCADE_ESCALATE_LABELS", "").split(",") if label.strip()]  # baseline labels always re-checked
+
+# Dynamic few-shot prompt (prompt_type "dynamic")
+DYNAMIC_EXAMPLES_ENABLED = os.getenv("DYNAMIC_EXAMPLES_ENABLED", "true").lower() == "true"
+DYNAMIC_EXAMPLES_K = int(os.getenv("DYNAMIC_EXAMPLES_K", "4"))          # examples retrieved per text
+DYNAMIC_EXAMPLES_DIM = int(os.getenv("DYNAMIC_EXAMPLES_DIM", "512"))    # hashed n-gram vector size; changing it rebuilds the index
+DYNAMIC_EXAMPLES_DIR = os.getenv("DYNAMIC_EXAMPLES_DIR", os.path.join(DATA_DIR, "example_index"))  # memory-mapped snapshot
+
+# Token accounting and budgets
+LLM_PRICE_INPUT_PER_1M = float(os.getenv("LLM_PRICE_INPUT_PER_1M", "0.10"))    # USD per million input tokens (gemini-2.0-flash list price)
+LLM_PRICE_OUTPUT_PER_1M = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", "0.40"))  # USD per million output tokens
+TOKEN_BUDGETS = {  # tokens per window by prompt type and/or "total", e.g. "advanced=200000,total=1000000"; empty = unlimited
+    name.strip().lower(): int(value)
+    for name, _, value in (item.partition("=") for item in os.getenv("TOKEN_BUDGETS", "").split(","))
+    if name.strip() and value.strip()
+}
+TOKEN_BUDGET_WINDOW_S = float(os.getenv("TOKEN_BUDGET_WINDOW_S", "60"))
+TOKEN_BUDGET_ACTION = os.getenv("TOKEN_BUDGET_ACTION", "downgrade")  # "downgrade" to the baseline prompt first, or "shed" right away
+
+# Confidence-scored classification (/classify/scores)
+CLASSIFY_EXTRA_LABELS = [label.strip().lower() for label in os.getenv("CLASSIFY_EXTRA_LABELS", "").split(",") if label.strip()]
+CLASSIFY_SCORE_THRESHOLD = float(os.getenv("CLASSIFY_SCORE_THRESHOLD", "0.5"))  # min confidence for a label to be reported
+
+# Result cache
+CLASSIFY_CACHE_ENABLED = os.getenv("CLASSIFY_CACHE_ENABLED", "true").lower() == "true"
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "10000"))           # entries kept in memory (LRU)
+CLASSIFY_CACHE_TTL_S = float(os.getenv("CLASSIFY_CACHE_TTL_S", "3600"))        # 0 disables expiry
+CLASSIFY_CACHE_DB = os.getenv("CLASSIFY_CACHE_DB", "")                         # SQLite file; empty keeps the cache in memory only
+
+# Near-duplicate tier (SimHash over words with URLs/numbers masked)
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() == "true"
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))  # max differing fingerprint bits (of 64) to reuse a label
+NEAR_DUP_SIZE = int(os.getenv("NEAR_DUP_SIZE", "50000"))              # fingerprints kept (LRU), ~650 bytes each
+NEAR_DUP_MIN_WORDS = int(os.getenv("NEAR_DUP_MIN_WORDS", "5"))        # shorter texts are never matched
+
+# Micro-batching of single /classify requests
+CLASSIFY_MICROBATCH_WINDOW_MS = float(os.getenv("CLASSIFY_MICROBATCH_WINDOW_MS", "10"))  # 0 disables micro-batching
+CLASSIFY_MICROBATCH_MAX_SIZE = int(os.getenv("CLASSIFY_MICROBATCH_MAX_SIZE", "16"))      # flush early once this many texts wait
+
+# Local pre-classifier tier
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.9"))  # min rule confidence to answer without the LLM
+
+# Streaming NDJSON bulk classification (/classify/stream and app.cli)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "16"))          # texts classified at once per stream
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "64"))  # upper bound a client may request
+
+# Admission control: priority lanes in front of the classifier
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "96"))  # requests classified at once across all lanes
+# The bulk lane fits one stream at BULK_MAX_CONCURRENCY and leaves the rest of the capacity to live traffic
+ADMISSION_LANES = {  # lane=concurrency:queue depth, highest priority first
+    name.strip().lower(): tuple(int(part) for part in value.split(":", 1))
+    for name, _, value in (item.partition("=") for item in os.getenv(
+        "ADMISSION_LANES", f"interactive=96:256,bulk={BULK_MAX_CONCURRENCY}:{BULK_MAX_CONCURRENCY * 2},evaluation=8:64"
+    ).split(","))
+    if name.strip() and ":" in value
+}
+
+# Tail latency: hedged requests and circuit breaker
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))          # fire a second call once the first is slower than this
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))          # latencies needed before hedging starts
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = float(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "0.5"))  # failure rate that opens the circuit
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "50"))                # recent calls the failure rate is computed over
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "20"))
+CIRCUIT_OPEN_S = float(os.getenv("CIRCUIT_OPEN_S", "30"))              # how long to fail fast before probing again
+CIRCUIT_FALLBACK = os.getenv("CIRCUIT_FALLBACK", "none")               # "heuristic" answers with the local rules while open
+
+# Feedback storage (append-only JSONL)
+FEEDBACK_PATH = os.getenv("FEEDBACK_PATH", os.path.join(DATA_DIR, "feedback_data.jsonl"))
+FEEDBACK_LEGACY_JSON_PATH = os.path.join(DATA_DIR, "feedback_data.json")  # imported once if FEEDBACK_PATH doesn't exist yet
+FEEDBACK_FSYNC_INTERVAL_S = float(os.getenv("FEEDBACK_FSYNC_INTERVAL_S", "1"))
+
+# Cross-worker telemetry (uvicorn --workers N)
+TELEMETRY_BACKEND = os.getenv("TELEMETRY_BACKEND", "local")                 # "local" (per process) or "sqlite" (merged per host)
+TELEMETRY_DB = os.getenv("TELEMETRY_DB", os.path.join(DATA_DIR, "telemetry.db"))
+TELEMETRY_PUBLISH_INTERVAL_S = float(os.getenv("TELEMETRY_PUBLISH_INTERVAL_S", "1"))  # how stale other workers' numbers may be
+TELEMETRY_RUN_ID = os.getenv("TELEMETRY_RUN_ID", "")  # set by `python -m app.main --workers N` for its workers; groups their snapshots
+
+# Offline evaluation
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))   # examples scored at once, across all prompt types
+EVAL_PREDICTION_CACHE = os.getenv("EVAL_PREDICTION_CACHE", os.path.join(DATA_DIR, "eval_predictions.db"))  # empty disables
+EVAL_RESULTS_DIR = os.getenv("EVAL_RESULTS_DIR", os.path.join(DATA_DIR, "eval_results"))      # stored job results
+EVAL_DATASETS_DIR = os.getenv("EVAL_DATASETS_DIR", os.path.join(DATA_DIR, "eval_datasets"))   # datasets jobs may name
+EVAL_MAX_CONCURRENT_JOBS = int(os.getenv("EVAL_MAX_CONCURRENT_JOBS", "1"))
+EVAL_LLM_RATE_LIMIT_PER_S = float(os.getenv("EVAL_LLM_RATE_LIMIT_PER_S", "10"))  # evaluation's own slice of provider quota
@@ -1,14 +1,33 @@
 import asyncio
-from typing import Dict
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support, classification_report
+import hashlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import time
+from app import config
+from app.prompts.prompt_library import PROMPT_REGISTRY
+from app.services.cache import ClassificationCache, cache_key
 from app.services.classifier import TextClassifier
+from app.services.examples import read_labelled_file
 
 class ModelEvaluator:
     """Handles evaluation of text classification models"""
     
-    def __init__(self):
-        self.classifier = TextClassifier()
+    def __init__(
+        self,
+        classifier: Optional[TextClassifier] = None,
+        dataset_path: Optional[str] = None,
+        concurrency: int = config.EVAL_CONCURRENCY,
+        prediction_cache_path: Optional[str] = config.EVAL_PREDICTION_CACHE or None,
+        on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+    ):
+        self.classifier = classifier or TextClassifier()
+        self.dataset_path = dataset_path
+        self.concurrency = max(1, concurrency)
+        self.on_progress = on_progress
+        # Per-(prompt, model, text) predictions survive between runs; no eviction or expiry
+        self.prediction_cache = None
+        if prediction_cache_path:
+            self.prediction_cache = ClassificationCache(max_size=10000, ttl_seconds=0, db_path=prediction_cache_path)
+        self._prompt_fingerprints: Dict[str, str] = {}
         self.test_dataset = [
             {"text": "Great product, highly recommend!", "label": "safe"},
             {"text": "You're an idiot and should die", "label": "toxic"},
@@ -32,38 +51,93 @@ class ModelEvaluator:
             # {"text": "Thank you for your help", "label": "safe"}
         ]
     
-    async def evaluate_single_prompt(self, prompt_type: str) -> Dict:
-        """Evaluate a single prompt type"""
-        print(f"Evaluating {prompt_type} prompt...")
-        
-        predictions = []
-        true_labels = []
-        latencies = []
-        errors = []
-        
-        for i, item in enumerate(self.test_dataset):
-            try:
-                start_time = time.time()
-                classification,used_prompt, latency_ms = await self.classifier.classify(
-                    item["text"], 
-                    prompt_type=prompt_type
-                )
-                actual_latency = int((time.time() - start_time) * 1000)
-                
-                predictions.append(classification)
-                true_labels.append(item["label"])
-                latencies.append(actual_latency)
-                
-                print(f"  [{i+1:2d}/{len(self.test_dataset)}] {classification:5} | {item['label']:5} | {actual_latency:3d}ms | {item['text'][:50]}")
-                
-            except Exception as e:
-                error_msg = f"Item {i}: {str(e)}"
-                errors.append(error_msg)
-                predictions.append("safe")  # Default fallback
+    def iter_dataset(self) -> Iterator[Dict]:
+        """Labelled examples, streamed from dataset_path (JSONL or CSV) or the built-in list"""
+        if self.dataset_path is None:
+            yield from self.test_dataset
+            return
+        for text, label in read_labelled_file(self.dataset_path):
+            yield {"text": text, "label": label}
+
+    def _prediction_key(self, prompt_type: str, text: str) -> str:
+        # Keyed on the rendered prompt template, so editing one prompt only invalidates its own predictions
+        if prompt_type not in self._prompt_fingerprints:
+            template = PROMPT_REGISTRY[f"{prompt_type}_classification"].format(text="{text}")
+            self._prompt_fingerprints[prompt_type] = hashlib.sha256(template.encode("utf-8")).hexdigest()
+        return cache_key(text, self._prompt_fingerprints[prompt_type], self.classifier.model_name)
+
+    async def _predict(self, prompt_type: str, text: str) -> Tuple[str, int, bool]:
+        """Returns (classification, latency_ms, from_cache)"""
+        key = self._prediction_key(prompt_type, text) if self.prediction_cache is not None else None
+        if key is not None:
+            cached = await self.prediction_cache.get(key)
+            if cached is not None:
+                label, _, latency = cached.partition(":")
+                return label, int(latency or 0), True
+
+        start_time = time.time()
+        classification, _, _ = await self.classifier.classify(text, prompt_type=prompt_type)
+        latency_ms = int((time.time() - start_time) * 1000)
+        if key is not None:
+            await self.prediction_cache.set(key, f"{classification}:{latency_ms}")
+        return classification, latency_ms, False
+
+    async def evaluate_prompts(self, prompt_types: List[str]) -> Dict[str, Dict]:
+        """Evaluate several prompt types in one pass over the dataset, with bounded concurrency"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        outcomes: Dict[str, Dict[int, Tuple[str, int, Optional[str], bool]]] = {p: {} for p in prompt_types}
+        true_labels: List[str] = []
+        progress = {"done": 0, "total": None}
+
+        async def produce():
+            for index, item in enumerate(self.iter_dataset()):
                 true_labels.append(item["label"])
-                latencies.append(1000)  # Penalty latency for errors
-                print(f"  [{i+1:2d}/{len(self.test_dataset)}] ERROR: {error_msg}")
-        
+                for prompt_type in prompt_types:
+                    await queue.put((prompt_type, index, item["text"]))
+            progress["total"] = len(true_labels) * len(prompt_types)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                prompt_type, index, text = job
+                try:
+                    classification, latency_ms, from_cache = await self._predict(prompt_type, text)
+                    outcomes[prompt_type][index] = (classification, latency_ms, None, from_cache)
+                except Exception as e:
+                    # Default fallback with a penalty latency, as before
+                    outcomes[prompt_type][index] = ("safe", 1000, f"Item {index}: {str(e)}", False)
+                progress["done"] += 1
+                if self.on_progress is not None:
+                    self.on_progress(progress["done"], progress["total"])
+
+        workers = [asyncio.ensure_future(work()) for _ in range(self.concurrency)]
+        try:
+            await produce()
+            await asyncio.gather(*workers)
+        finally:
+            # A dataset that fails to parse stops produce() before the workers are told to finish
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return {
+            prompt_type: self._score(prompt_type, true_labels, outcomes[prompt_type])
+            for prompt_type in prompt_types
+        }
+
+    def _score(self, prompt_type: str, true_labels: List[str], outcomes: Dict) -> Dict:
+        # scikit-learn is slow to import and only needed here, so the API doesn't load it at startup
+        from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
+
+        ordered = [outcomes[i] for i in range(len(true_labels))]
+        predictions = [outcome[0] for outcome in ordered]
+        latencies = [outcome[1] for outcome in ordered]
+        errors = [outcome[2] for outcome in ordered if outcome[2]]
+        cached = sum(1 for outcome in ordered if outcome[3])
+
         # Calculate metrics
         accuracy = accuracy_score(true_labels, predictions)
         precision, recall, f1, _ = precision_recall_fscore_support(
@@ -81,36 +155,42 @@ class ModelEvaluator:
             "precision": round(precision, 3),
             "recall": round(recall, 3),
             "f1_score": round(f1, 3),
-            "avg_latency_ms": round(sum(latencies) / len(latencies), 2),
-            "total_examples": len(self.test_dataset),
+            "avg_latency_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            "total_examples": len(true_labels),
             "errors_count": len(errors),
+            "cached_predictions": cached,
             "class_report": class_report,
             "predictions": predictions,
             "true_labels": true_labels,
             "latencies": latencies,
             "errors": errors if errors else None
         }
+
+    async def evaluate_single_prompt(self, prompt_type: str) -> Dict:
+        """Evaluate a single prompt type"""
+        print(f"Evaluating {prompt_type} prompt...")
+        return (await self.evaluate_prompts([prompt_type]))[prompt_type]
     
     async def run_full_evaluation(self) -> Dict:
         """Run evaluation on both baseline and advanced prompts"""
         print("="*60)
         print("Starting Model Evaluation")
         print("="*60)
-        print(f"Dataset: {len(self.test_dataset)} examples")
-        print(f"Classes: {set(item['label'] for item in self.test_dataset)}")
+        print(f"Dataset: {self.dataset_path or f'{len(self.test_dataset)} built-in examples'}")
+        print(f"Concurrency: {self.concurrency}")
         print("-"*60)
         
-        results = {}
-        
-        # Evaluate both prompt types
+        # Evaluate both prompt types in one concurrent pass
+        results = await self.evaluate_prompts(["baseline", "advanced"])
+        true_labels = results["baseline"]["true_labels"]
         for prompt_type in ["baseline", "advanced"]:
-            results[prompt_type] = await self.evaluate_single_prompt(prompt_type)
             print(f"\n{prompt_type.upper()} RESULTS:")
             print(f"  Accuracy:  {results[prompt_type]['accuracy']:.3f}")
             print(f"  Precision: {results[prompt_type]['precision']:.3f}")
             print(f"  Recall:    {results[prompt_type]['recall']:.3f}")
             print(f"  F1 Score:  {results[prompt_type]['f1_score']:.3f}")
             print(f"  Avg Latency: {results[prompt_type]['avg_latency_ms']:.1f}ms")
+            print(f"  Cached Predictions: {results[prompt_type]['cached_predictions']}")
             if results[prompt_type]['errors_count'] > 0:
                 print(f"  Errors: {results[prompt_type]['errors_count']}")
             print("-"*60)
@@ -144,11 +224,11 @@ class ModelEvaluator:
         return {
             "status": "completed",
             "dataset_info": {
-                "total_examples": len(self.test_dataset),
+                "total_examples": len(true_labels),
                 "class_breakdown": {
-                    "safe": len([x for x in self.test_dataset if x["label"] == "safe"]),
-                    "toxic": len([x for x in self.test_dataset if x["label"] == "toxic"]), 
-                    "spam": len([x for x in self.test_dataset if x["label"] == "spam"])
+                    "safe": true_labels.count("safe"),
+                    "toxic": true_labels.count("toxic"),
+                    "spam": true_labels.count("spam")
                 }
             },
             "baseline_results": results["baseline"],
@@ -163,5 +243,12 @@ class ModelEvaluator:
     
 
 if __name__ =="__main__":
-    model_evaluator = ModelEvaluator()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the baseline and advanced prompts on a labelled dataset")
+    parser.add_argument("--dataset", help="JSONL or CSV file with text and label fields (default: built-in examples)")
+    parser.add_argument("--concurrency", type=int, default=config.EVAL_CONCURRENCY)
+    args = parser.parse_args()
+
+    model_evaluator = ModelEvaluator(dataset_path=args.dataset, concurrency=args.concurrency)
     result=asyncio.run(model_evaluator.run_full_evaluation())
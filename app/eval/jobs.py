@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from app.telemetry.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+
+class EvaluationJobManager:
+    """Runs evaluations in a background worker and keeps their results on disk.
+
+    `evaluator_factory(dataset_path, on_progress)` builds the ModelEvaluator for one job; the
+    factory decides which classifier (and therefore which LLM concurrency budget) jobs use.
+    """
+
+    def __init__(
+        self,
+        evaluator_factory: Callable,
+        results_dir: str,
+        max_concurrent_jobs: int = 1,
+        max_cached_results: int = 10,
+    ):
+        self.evaluator_factory = evaluator_factory
+        self.results_dir = results_dir
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.max_cached_results = max_cached_results
+        self.jobs: Dict[str, Dict] = {}
+        self._results: Dict[str, Dict] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        await asyncio.to_thread(self._load_finished_jobs)
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.max_concurrent_jobs)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _load_finished_jobs(self):
+        os.makedirs(self.results_dir, exist_ok=True)
+        for name in os.listdir(self.results_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.results_dir, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)["job"]
+            except (OSError, json.JSONDecodeError, KeyError) as e:
+                log.warning(f"skipping unreadable evaluation result {name}: {e}")
+                continue
+            self.jobs[job["id"]] = job
+
+    def submit(self, dataset_path: Optional[str] = None) -> Dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "dataset_path": dataset_path,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"done": 0, "total": None},
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def latest_completed(self) -> Optional[Dict]:
+        completed = [job for job in self.jobs.values() if job["status"] == COMPLETED and job["dataset_path"] is None]
+        return max(completed, key=lambda job: job["finished_at"], default=None)
+
+    def active(self) -> Optional[Dict]:
+        return next((job for job in self.jobs.values() if job["status"] in (QUEUED, RUNNING)), None)
+
+    async def result(self, job_id: str) -> Optional[Dict]:
+        if job_id not in self._results:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] != COMPLETED:
+                return None
+            self._remember(job_id, await asyncio.to_thread(self._load_result, job_id))
+        return self._results[job_id]
+
+    def _load_result(self, job_id: str) -> Dict:
+        with open(self._result_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)["result"]
+
+    def _remember(self, job_id: str, result: Dict):
+        # Keep a handful of results in memory; older ones are re-read from disk on demand
+        self._results[job_id] = result
+        while len(self._results) > self.max_cached_results:
+            del self._results[next(iter(self._results))]
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """Job snapshots each time it changes, ending once it has finished"""
+        while True:
+            job = self.jobs[job_id]
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            changed.clear()
+            yield dict(job, progress=dict(job["progress"]))
+            if job["status"] in (COMPLETED, FAILED):
+                return
+            await changed.wait()
+
+    def _notify(self, job_id: str):
+        event = self._changed.get(job_id)
+        if event is not None:
+            event.set()
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.results_dir, f"{job_id}.json")
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs[job_id]
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            self._notify(job_id)
+
+            def on_progress(done: int, total: Optional[int]):
+                job["progress"] = {"done": done, "total": total}
+                self._notify(job_id)
+
+            try:
+                evaluator = self.evaluator_factory(job["dataset_path"], on_progress)
+                result = await evaluator.run_full_evaluation()
+                job["finished_at"] = time.time()
+                # Only report completion once the result can be read back
+                await asyncio.to_thread(self._save, dict(job, status=COMPLETED), result)
+                self._remember(job_id, result)
+                job["status"] = COMPLETED
+            except Exception as e:
+                log.error(f"evaluation job {job_id} failed: {e}")
+                job["status"] = FAILED
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+                await asyncio.to_thread(self._save, job, None)
+            self._notify(job_id)
+
+    def _save(self, job: Dict, result: Optional[Dict]):
+        os.makedirs(self.results_dir, exist_ok=True)
+        path = self._result_path(job["id"])
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"job": job, "result": result}, f)
+        os.replace(path + ".tmp", path)
@@ -1,53 +1,374 @@
-import uvicorn
-from fastapi import FastAPI, HTTPException
-from app.services.classifier import TextClassifier
-from app.telemetry.telemetry import TelemetryService
-from app.eval.evalution import ModelEvaluator
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app.services.admission import BULK, EVALUATION, INTERACTIVE, AdmissionController, AdmissionRejectedError, LaneClassifier
+from app.services.batcher import MicroBatcher
+from app.services.budget import TokenBudgetExceededError
+from app.services.bulk import classify_ndjson, iter_lines
+from app.services.chunking import InputTooLongError
+from app.services.llm_client import LLMClient, LLMUnavailableError
+from app.telemetry.openmetrics import CONTENT_TYPE as OPENMETRICS_CONTENT_TYPE
+from app.telemetry.telemetry import TelemetryService, build_aggregator
+from app.eval.jobs import EvaluationJobManager
+from app import config
 from pydantic import BaseModel, Field
-from typing import  Dict
+from typing import  TYPE_CHECKING, Any, Dict, List, Literal, Optional, Union
+
+if TYPE_CHECKING:
+    from app.eval.evalution import ModelEvaluator
+    from app.services.classifier import TextClassifier
 
 class ClassifyRequest(BaseModel):
     text: str
+    prompt_type: Optional[Literal["baseline", "advanced", "cascade", "dynamic"]] = Field(
+        None, description="Defaults to CLASSIFY_DEFAULT_PROMPT"
+    )
+
+class ScoresRequest(BaseModel):
+    text: str
 
 class ClassifyResponse(BaseModel):
     class_: str = Field(..., alias="class") 
     prompt_used: str
     latency_ms: int
+    chunks: int = Field(1, description="Chunks a long text was split into and classified as")
+    class Config:
+        populate_by_name = True
+
+class ScoredClassifyResponse(BaseModel):
+    class_: str = Field(..., alias="class")
+    labels: List[str] = Field(..., description="Every label at or above CLASSIFY_SCORE_THRESHOLD")
+    scores: Dict[str, float]
+    prompt_used: str
+    latency_ms: int
     class Config:
         populate_by_name = True
 
+class BatchClassifyRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=config.CLASSIFY_BATCH_MAX_ITEMS)
+    prompt_type: Literal["baseline", "advanced", "cascade", "dynamic"] = "advanced"
+
+class BatchItemError(BaseModel):
+    error: str
+
+class BatchClassifyResponse(BaseModel):
+    results: List[Union[ClassifyResponse, BatchItemError]]
+    latency_ms: int
+
 class FeedbackRequest(BaseModel):
     text: str
     predicted: str
     correct: str
 
+class EvaluationJobRequest(BaseModel):
+    dataset: Optional[str] = Field(None, description="File name inside EVAL_DATASETS_DIR; built-in examples if omitted")
+
 class MetricsResponse(BaseModel):
     total_requests: int
     class_distribution: Dict[str, int]
     feedback_counts: Dict[str, int]
+    cache: Dict[str, float]
+    near_duplicate: Dict[str, float]
+    prefilter: Dict[str, float]
+    coalesced_requests: int
+    resilience: Dict[str, Any]
+    routing: Dict[str, Dict[str, int]]
+    tokens: Dict[str, Dict[str, float]]
+    llm_spend: Dict[str, float]
+    budget: Dict[str, int]
+    chunking: Dict[str, int]
     latency: Dict[str, float]
+    latency_by_prompt: Dict[str, Dict[str, float]]
+    latency_by_class: Dict[str, Dict[str, float]]
+    latency_by_stage: Dict[str, Dict[str, float]]
+    workers: int
+    llm_client: Dict[str, float]
+    token_budget: Optional[Dict[str, Dict[str, int]]] = None
+    admission: Optional[Dict[str, Dict[str, int]]] = None
+
+telemetry = TelemetryService(aggregator=build_aggregator())
+# Built in lifespan startup, so importing the app stays cheap
+classifier: Optional["TextClassifier"] = None
+batcher: Optional[MicroBatcher] = None
+# Live traffic, bulk work and evaluation jobs get separate shares, so the latter can't queue up ahead of the former
+admission = AdmissionController(config.ADMISSION_LANES, capacity=config.ADMISSION_CAPACITY) if config.ADMISSION_ENABLED else None
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that leaves receive() to the request body until it has been fully read.
+
+    Starlette listens for client disconnects on the same receive channel, which would swallow
+    request body chunks while the response is already streaming.
+    """
+    def __init__(self, content, body_read: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive):
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+# Evaluation runs on its own classifier and LLM client so it can't eat into live traffic's budget
+eval_classifier: Optional["TextClassifier"] = None
+
+def make_evaluator(dataset_path: Optional[str], on_progress) -> "ModelEvaluator":
+    # Deferred: the evaluator pulls in scikit-learn, which only evaluation jobs need
+    from app.eval.evalution import ModelEvaluator
+    from app.services.classifier import TextClassifier
+
+    global eval_classifier
+    if eval_classifier is None:
+        llm = classifier.client.llm
+        eval_classifier = TextClassifier(client=LLMClient(
+            llm, max_in_flight=config.EVAL_CONCURRENCY, rate_per_s=config.EVAL_LLM_RATE_LIMIT_PER_S
+        ))
+    lane_classifier = LaneClassifier(eval_classifier, admission, EVALUATION) if admission is not None else eval_classifier
+    return ModelEvaluator(classifier=lane_classifier, dataset_path=dataset_path, on_progress=on_progress)
+
+eval_jobs = EvaluationJobManager(
+    make_evaluator, results_dir=config.EVAL_RESULTS_DIR, max_concurrent_jobs=config.EVAL_MAX_CONCURRENT_JOBS
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global classifier, batcher, eval_classifier
+    # Deferred: LangChain and the provider SDK dominate cold-start time
+    from app.services.classifier import build_classifier
+
+    classifier = build_classifier(telemetry)
+    examples = classifier.examples
+    if examples is not None:
+        # Corrections become few-shot examples for the dynamic prompt straight away
+        telemetry.on_feedback = lambda record: examples.add_many([(record["text"], record["correct"])])
+    if config.CLASSIFY_MICROBATCH_WINDOW_MS > 0:
+        batcher = MicroBatcher(
+            classifier.classify_batch,
+            max_batch_size=config.CLASSIFY_MICROBATCH_MAX_SIZE,
+            max_wait_ms=config.CLASSIFY_MICROBATCH_WINDOW_MS,
+        )
+    await telemetry.start()
+    await eval_jobs.start()
+    yield
+    await eval_jobs.stop()
+    if batcher is not None:
+        await batcher.drain()
+    await telemetry.stop()
+    # Feedback after shutdown is still logged, just no longer indexed
+    telemetry.on_feedback = None
+    if examples is not None and examples.changed:
+        # Next startup maps this snapshot instead of re-embedding the feedback log
+        await asyncio.to_thread(examples.save, config.DYNAMIC_EXAMPLES_DIR)
+    classifier, batcher, eval_classifier = None, None, None
+
+app = FastAPI(title="LLM Text Classification API", version="1.0.0", lifespan=lifespan)
+
+def require_classifier():
+    # Before lifespan startup (or after shutdown) there is nothing to classify with yet
+    if classifier is None:
+        raise HTTPException(status_code=503, detail="classifier is not started", headers={"Retry-After": "1"})
+
+def unavailable(e: LLMUnavailableError) -> HTTPException:
+    # Provider throttling/outage is retryable for the client, unlike a 500
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+def over_budget(e: TokenBudgetExceededError) -> HTTPException:
+    # Our own token quota, not the provider's: shed until the budget window frees up
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+def too_long(e: InputTooLongError) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+def shed(e: AdmissionRejectedError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
 
-classifier = TextClassifier()
-telemetry = TelemetryService()
+def admit(lane: str, defer: bool = False):
+    return admission.admit(lane, defer) if admission is not None else nullcontext()
 
-app = FastAPI(title="LLM Text Classification API", version="1.0.0")
+async def classify_one(text: str, prompt_type: str = config.CLASSIFY_DEFAULT_PROMPT):
+    # Single texts go through the micro-batcher when it's enabled; long ones are split into chunks instead
+    if batcher is not None and not classifier.is_long(text):
+        return (*await batcher.submit(text, prompt_type), 1)
+    return await classifier.classify_long(text, prompt_type)
+
+async def classify_many(texts: List[str], prompt_type: str):
+    """(label, prompt_used, latency_ms, chunks) per text, or the exception that text alone ran
+    into: long texts are chunked on their own, the rest packed into shared LLM calls"""
+    for text in texts:
+        classifier.check_length(text)
+    long_ids = [i for i, text in enumerate(texts) if classifier.is_long(text)]
+    short_ids = [i for i, text in enumerate(texts) if not classifier.is_long(text)]
+
+    async def packed():
+        return await classifier.classify_batch([texts[i] for i in short_ids], prompt_type) if short_ids else []
+
+    packed_results, long_results = await asyncio.gather(
+        packed(),
+        asyncio.gather(*(classifier.classify_long(texts[i], prompt_type) for i in long_ids), return_exceptions=True),
+    )
+    results = [None] * len(texts)
+    for i, result in zip(short_ids, packed_results):
+        results[i] = result if isinstance(result, Exception) else (*result, 1)
+    for i, result in zip(long_ids, long_results):
+        results[i] = result
+    return results
+
+async def classify_streamed(text: str, prompt_type: str, lane: str):
+    """classify_one for classify_ndjson, admitted per text and recording telemetry per text.
+    Records wait for a slot rather than being shed: the stream's own concurrency bounds how many
+    of them queue, and the client couldn't retry a single shed line"""
+    async with admit(lane, defer=True):
+        classification, prompt_used, latency_ms, _ = await classify_one(text, prompt_type)
+    telemetry.record_classification(classification, latency_ms, prompt_used)
+    return classification, prompt_used, latency_ms
 
 @app.post("/classify", response_model=ClassifyResponse)
 async def classify_text(request: ClassifyRequest):
+    require_classifier()
     try:
-        classification, prompt_used, latency_ms = await classifier.classify(request.text)
+        async with admit(INTERACTIVE):
+            classification, prompt_used, latency_ms, chunks = await classify_one(
+                request.text, request.prompt_type or config.CLASSIFY_DEFAULT_PROMPT
+            )
         
         # Record metrics
-        telemetry.record_classification(classification, latency_ms)
+        telemetry.record_classification(classification, latency_ms, prompt_used)
         
         return ClassifyResponse(
             **{"class": classification},
             prompt_used=prompt_used,
-            latency_ms=latency_ms
+            latency_ms=latency_ms,
+            chunks=chunks,
         )
+    except LLMUnavailableError as e:
+        raise unavailable(e)
+    except TokenBudgetExceededError as e:
+        raise over_budget(e)
+    except InputTooLongError as e:
+        raise too_long(e)
+    except AdmissionRejectedError as e:
+        raise shed(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/classify/scores", response_model=ScoredClassifyResponse)
+async def classify_scores(request: ScoresRequest):
+    """Confidence per label (multi-label) from one LLM call"""
+    require_classifier()
+    try:
+        async with admit(INTERACTIVE):
+            scores, prompt_used, latency_ms = await classifier.classify_with_scores(request.text)
+    except LLMUnavailableError as e:
+        raise unavailable(e)
+    except TokenBudgetExceededError as e:
+        raise over_budget(e)
+    except InputTooLongError as e:
+        raise too_long(e)
+    except AdmissionRejectedError as e:
+        raise shed(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    classification = max(scores, key=scores.get)
+    telemetry.record_classification(classification, latency_ms, prompt_used)
+    return ScoredClassifyResponse(
+        **{"class": classification},
+        labels=[label for label, score in scores.items() if score >= config.CLASSIFY_SCORE_THRESHOLD],
+        scores=scores,
+        prompt_used=prompt_used,
+        latency_ms=latency_ms,
+    )
+
+@app.post("/classify/batch", response_model=BatchClassifyResponse)
+async def classify_batch(request: BatchClassifyRequest):
+    require_classifier()
+    start_time = time.time()
+    try:
+        # The whole request holds one bulk slot; its texts are packed into shared LLM calls
+        async with admit(BULK):
+            results = await classify_many(request.texts, request.prompt_type)
+        # The provider being down or the budget spent is retryable for the whole request; anything
+        # else one text ran into is reported for that text only
+        failed = next((result for result in results if isinstance(result, (LLMUnavailableError, TokenBudgetExceededError))), None)
+        if failed is not None:
+            raise failed
+    except LLMUnavailableError as e:
+        raise unavailable(e)
+    except TokenBudgetExceededError as e:
+        raise over_budget(e)
+    except InputTooLongError as e:
+        raise too_long(e)
+    except AdmissionRejectedError as e:
+        raise shed(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    items = []
+    for result in results:
+        if isinstance(result, Exception):
+            items.append(BatchItemError(error=str(result)))
+            continue
+        classification, prompt_used, latency_ms, chunks = result
+        telemetry.record_classification(classification, latency_ms, prompt_used)
+        items.append(ClassifyResponse(**{"class": classification}, prompt_used=prompt_used, latency_ms=latency_ms, chunks=chunks))
+
+    return BatchClassifyResponse(
+        results=items,
+        latency_ms=int((time.time() - start_time) * 1000),
+    )
+
+@app.post("/classify/stream")
+async def classify_stream(
+    request: Request,
+    prompt_type: Literal["baseline", "advanced", "cascade", "dynamic"] = "advanced",
+    concurrency: int = Query(config.BULK_CONCURRENCY, ge=1, le=config.BULK_MAX_CONCURRENCY),
+):
+    """Body: NDJSON, one {"id": ..., "text": ...} object (or bare JSON string) per line.
+    Results are streamed back as NDJSON in completion order."""
+    require_classifier()
+    body_read = asyncio.Event()
+
+    async def request_chunks():
+        try:
+            async for chunk in request.stream():
+                yield chunk
+        finally:
+            body_read.set()
+
+    async def body():
+        async for result in classify_ndjson(
+            iter_lines(request_chunks()), lambda text: classify_streamed(text, prompt_type, BULK), concurrency
+        ):
+            yield json.dumps(result) + "\n"
+
+    return DuplexStreamingResponse(body(), body_read, media_type="application/x-ndjson")
+
+@app.websocket("/ws/classify")
+async def classify_websocket(
+    websocket: WebSocket,
+    prompt_type: Literal["baseline", "advanced", "cascade", "dynamic"] = "advanced",
+    concurrency: int = Query(config.BULK_CONCURRENCY, ge=1, le=config.BULK_MAX_CONCURRENCY),
+):
+    """One long-lived connection for a stream of texts: each message is a {"id": ..., "text": ...}
+    object (or bare JSON string) and each result comes back as soon as it is ready, tagged with
+    that id. At most `concurrency` texts are classified at once; beyond a small buffer the
+    server stops reading, so a client sending faster than it is answered gets backpressure."""
+    if classifier is None:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="classifier is not started")
+        return
+    await websocket.accept()
+    try:
+        async for result in classify_ndjson(
+            websocket.iter_text(), lambda text: classify_streamed(text, prompt_type, INTERACTIVE), concurrency
+        ):
+            await websocket.send_text(json.dumps(result))
+    except WebSocketDisconnect:
+        # Client went away mid-stream; classify_ndjson cancels what is still in flight
+        pass
+
 @app.post("/feedback")
 async def submit_feedback(request: FeedbackRequest):
     telemetry.record_feedback(request.text, request.predicted, request.correct)
@@ -55,19 +376,120 @@ async def submit_feedback(request: FeedbackRequest):
 
 @app.get("/metrics", response_model=MetricsResponse)
 async def get_metrics():
-    return telemetry.get_metrics()
+    require_classifier()
+    # Telemetry covers every worker; LLM client and breaker state are this worker's own
+    metrics = {**telemetry.get_metrics(await telemetry.collect_state()), "llm_client": classifier.client.get_stats()}
+    if classifier.breaker is not None:
+        metrics["resilience"] = {**metrics["resilience"], "circuit_breaker": classifier.breaker.get_stats()}
+    if classifier.budget is not None:
+        metrics["token_budget"] = classifier.budget.get_stats()
+    if admission is not None:
+        metrics["admission"] = admission.get_stats()
+    return metrics
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """The same counters plus per-stage latency histograms, in OpenMetrics text for scraping"""
+    require_classifier()
+    client_stats = classifier.client.get_stats()
+    counters = {
+        "llm_calls": ("LLM provider call attempts", client_stats["calls"]),
+        "llm_retries": ("LLM calls retried after a retryable error", client_stats["retries"]),
+        "llm_throttled": ("LLM calls rejected with 429/503", client_stats["throttled"]),
+        "llm_failures": ("LLM requests that failed after all retries", client_stats["failures"]),
+    }
+    gauges = {
+        "llm_in_flight": ("LLM calls currently in flight", client_stats["in_flight"]),
+        "llm_rate_limit_per_second": ("Current adaptive LLM request rate limit", client_stats["rate_limit_per_s"]),
+    }
+    if classifier.breaker is not None:
+        breaker = classifier.breaker.get_stats()
+        gauges["circuit_breaker_open"] = ("1 while the LLM circuit breaker is open or half-open", int(breaker["state"] != "closed"))
+        gauges["circuit_breaker_failure_rate"] = ("LLM failure rate over the breaker window", breaker["failure_rate"])
+    if classifier.budget is not None:
+        gauges["token_budget_remaining"] = ("Tokens left in each budget's window", [
+            ({"budget": name}, budget["remaining"]) for name, budget in classifier.budget.get_stats().items()
+        ])
+    if admission is not None:
+        lanes = admission.get_stats().items()
+        counters["admission_shed"] = ("Requests shed by each admission lane", [({"lane": name}, lane["shed"]) for name, lane in lanes])
+        gauges["admission_active"] = ("Requests running in each admission lane", [({"lane": name}, lane["active"]) for name, lane in lanes])
+        gauges["admission_queued"] = ("Requests waiting in each admission lane", [({"lane": name}, lane["queued"]) for name, lane in lanes])
+    return PlainTextResponse(
+        telemetry.render_openmetrics(counters=counters, gauges=gauges, state=await telemetry.collect_state()),
+        media_type=OPENMETRICS_CONTENT_TYPE,
+    )
 
 @app.get("/evaluation")
 async def get_evaluation():
-    model_evaluator = ModelEvaluator()  # Create instance (no await needed)
-    result = await model_evaluator.run_full_evaluation()  # Await the async method
+    """Latest completed evaluation of the built-in dataset; starts one (202) if there is none yet"""
+    require_classifier()
+    latest = eval_jobs.latest_completed()
+    if latest is not None:
+        return await eval_jobs.result(latest["id"])
+    job = eval_jobs.active() or eval_jobs.submit()
+    return JSONResponse(status_code=202, content=job)
+
+@app.post("/evaluation/jobs", status_code=202)
+async def start_evaluation(request: Optional[EvaluationJobRequest] = None):
+    require_classifier()
+    dataset_path = None
+    if request is not None and request.dataset:
+        # Only bare file names inside the datasets directory, never arbitrary paths
+        if os.path.basename(request.dataset) != request.dataset:
+            raise HTTPException(status_code=400, detail="dataset must be a file name")
+        dataset_path = os.path.join(config.EVAL_DATASETS_DIR, request.dataset)
+        if not os.path.isfile(dataset_path):
+            raise HTTPException(status_code=404, detail=f"dataset {request.dataset} not found")
+    return eval_jobs.submit(dataset_path)
+
+@app.get("/evaluation/jobs/{job_id}")
+async def get_evaluation_job(job_id: str):
+    job = eval_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+@app.get("/evaluation/jobs/{job_id}/result")
+async def get_evaluation_result(job_id: str):
+    job = eval_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    result = await eval_jobs.result(job_id)
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"job is {job['status']}")
     return result
 
+@app.get("/evaluation/jobs/{job_id}/events")
+async def stream_evaluation_job(job_id: str):
+    """NDJSON stream of job snapshots (status and progress) until the job finishes"""
+    if eval_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    async def body():
+        async for snapshot in eval_jobs.events(job_id):
+            yield json.dumps(snapshot) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
 @app.get("/healthz")
 async def health_check():
     return {"status": "healthy"}
 
 
 if __name__ == "__main__":
-    
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import argparse
+    import uuid
+    import uvicorn
+
+    parser = argparse.ArgumentParser(prog="python -m app.main")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    if args.workers > 1:
+        # Workers inherit the environment: one id per run groups their telemetry snapshots
+        os.environ.setdefault("TELEMETRY_RUN_ID", uuid.uuid4().hex)
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
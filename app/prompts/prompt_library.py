@@ -1,5 +1,24 @@
+from typing import Iterable, Tuple
+
 from langchain_core.prompts import ChatPromptTemplate
 
+# Static few-shot examples of the advanced prompts; they also seed the example index that
+# the dynamic prompts retrieve from
+ADVANCED_EXAMPLES = [
+    ("Great article! Thanks for sharing this helpful information.", "safe"),
+    ("You're worthless and nobody likes you. Kill yourself.", "toxic"),
+    ("🚨 URGENT! Make $5000/week working from home! Click this link now! Limited time offer!!!", "spam"),
+    ("I disagree with your opinion, but I respect your right to have it.", "safe"),
+    ("F*ck you, you stupid piece of sh*t!", "toxic"),
+    ("Buy cheap viagra now! No prescription needed! www.sketchy-pills.com", "spam"),
+]
+
+
+def format_examples(examples: Iterable[Tuple[str, str]]) -> str:
+    # One line per text, so an example can't inject extra "Classification:" lines
+    return "\n\n".join(f'Text: "{" ".join(text.split())}"\nClassification: {label}' for text, label in examples)
+
+
 # Baseline (Zero-shot) prompt for text classification
 baseline_classification_prompt = ChatPromptTemplate.from_template("""
 You are a content moderation system. Classify the following text into exactly one of these categories: toxic, spam, or safe.
@@ -21,23 +40,58 @@ Classification Guidelines:
 - SAFE: Normal, appropriate content that doesn't violate community standards
 
 Examples:
-Text: "Great article! Thanks for sharing this helpful information."
-Classification: safe
+""" + format_examples(ADVANCED_EXAMPLES) + """
 
-Text: "You're worthless and nobody likes you. Kill yourself."
-Classification: toxic
+Now classify this text:
+Text: {text}
+
+Respond with only one word: toxic, spam, or safe.
 
-Text: "🚨 URGENT! Make $5000/week working from home! Click this link now! Limited time offer!!!"
-Classification: spam
+Classification:
+""")
 
-Text: "I disagree with your opinion, but I respect your right to have it."
-Classification: safe
+# Batch (numbered-list) variants: several texts are packed into one call and
+# the model answers with one "<number>. <label>" line per text
+baseline_batch_classification_prompt = ChatPromptTemplate.from_template("""
+You are a content moderation system. Classify each of the following {count} texts into exactly one of these categories: toxic, spam, or safe.
 
-Text: "F*ck you, you stupid piece of sh*t!"
-Classification: toxic
+Texts to classify:
+{texts}
 
-Text: "Buy cheap viagra now! No prescription needed! www.sketchy-pills.com"
-Classification: spam
+Respond with exactly {count} lines, one per text, in the format "<number>. <category>" where category is one word: toxic, spam, or safe.
+
+Classifications:
+""")
+
+advanced_batch_classification_prompt = ChatPromptTemplate.from_template("""
+You are an expert content moderator with years of experience in online safety. Your job is to classify user-generated content to maintain a healthy community environment.
+
+Classification Guidelines:
+- TOXIC: Content that is harmful, abusive, hateful, threatening, or promotes violence
+- SPAM: Promotional content, repetitive messages, phishing attempts, or commercial solicitation
+- SAFE: Normal, appropriate content that doesn't violate community standards
+
+Examples:
+""" + format_examples(ADVANCED_EXAMPLES) + """
+
+Now classify each of these {count} texts independently:
+{texts}
+
+Respond with exactly {count} lines, one per text, in the format "<number>. <category>" where category is one word: toxic, spam, or safe.
+
+Classifications:
+""")
+
+# Dynamic few-shot variants: {examples} holds the labelled texts most similar to the input(s),
+# retrieved per request from the example index instead of a fixed list
+dynamic_classification_prompt = ChatPromptTemplate.from_template("""
+You are a content moderator. Classify the text into exactly one of these categories:
+- toxic: harmful, abusive, hateful, threatening, or promotes violence
+- spam: promotional content, repetitive messages, phishing attempts, or commercial solicitation
+- safe: normal, appropriate content
+
+Similar texts and their categories:
+{examples}
 
 Now classify this text:
 Text: {text}
@@ -47,8 +101,49 @@ Respond with only one word: toxic, spam, or safe.
 Classification:
 """)
 
+dynamic_batch_classification_prompt = ChatPromptTemplate.from_template("""
+You are a content moderator. Classify each of the following {count} texts into exactly one of these categories:
+- toxic: harmful, abusive, hateful, threatening, or promotes violence
+- spam: promotional content, repetitive messages, phishing attempts, or commercial solicitation
+- safe: normal, appropriate content
+
+Similar texts and their categories:
+{examples}
+
+Now classify each of these {count} texts independently:
+{texts}
+
+Respond with exactly {count} lines, one per text, in the format "<number>. <category>" where category is one word: toxic, spam, or safe.
+
+Classifications:
+""")
+
+# Confidence-scored (multi-label) variant: one JSON object with an independent
+# 0-1 confidence per label, so callers can act only on confident answers
+scores_classification_prompt = ChatPromptTemplate.from_template("""
+You are an expert content moderator. Rate how strongly the text below belongs to each of these categories: {labels}.
+
+Category meanings:
+- toxic: harmful, abusive, hateful, threatening, or promotes violence
+- spam: promotional content, repetitive messages, phishing attempts, or commercial solicitation
+- safe: normal, appropriate content that doesn't violate community standards
+Any other category means what its name says.
+
+A text can belong to more than one category, so rate each one independently.
+
+Text to classify: {text}
+
+Respond with only a JSON object mapping every category to a confidence between 0 and 1, for example:
+{{"toxic": 0.05, "spam": 0.9, "safe": 0.1}}
+""")
+
 # Central dictionary to register prompts
 PROMPT_REGISTRY = {
     "baseline_classification": baseline_classification_prompt,
     "advanced_classification": advanced_classification_prompt,
+    "baseline_batch_classification": baseline_batch_classification_prompt,
+    "advanced_batch_classification": advanced_batch_classification_prompt,
+    "dynamic_classification": dynamic_classification_prompt,
+    "dynamic_batch_classification": dynamic_batch_classification_prompt,
+    "scores_classification": scores_classification_prompt,
 }
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Mapping, Tuple
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+EVALUATION = "evaluation"
+
+
+class AdmissionRejectedError(Exception):
+    """The lane's queue is full; the request is shed instead of waiting"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Lane:
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed = 0
+        self.avg_s = 0.0  # moving average of how long admitted work holds its slot
+
+
+class AdmissionController:
+    """Priority lanes sharing `capacity` slots of classification work.
+
+    `lanes` maps name -> (concurrency, max_queue), highest priority first. A lane never holds
+    more than its concurrency share; when a slot frees up it goes to the highest-priority lane
+    with waiting work, so lower lanes only get what the higher ones leave. A request that finds
+    its lane's queue full is shed with AdmissionRejectedError, unless it was admitted with
+    `defer` (records of a stream, which the client can't retry one by one): those always wait.
+    Lanes not configured are not limited. Limits are per worker process.
+    """
+
+    def __init__(self, lanes: Mapping[str, Tuple[int, int]], capacity: int = 64):
+        self.lanes: Dict[str, Lane] = {
+            name: Lane(name, concurrency, max_queue) for name, (concurrency, max_queue) in lanes.items()
+        }
+        self.capacity = max(1, capacity)
+        self.active = 0
+
+    def _has_slot(self, lane: Lane) -> bool:
+        return self.active < self.capacity and lane.active < lane.concurrency
+
+    def _start(self, lane: Lane):
+        self.active += 1
+        lane.active += 1
+        lane.admitted += 1
+
+    async def acquire(self, name: str, defer: bool = False):
+        lane = self.lanes[name]
+        # Waiters only exist while their lane has no slot, so an empty queue means no one is ahead
+        if not lane.waiters and self._has_slot(lane):
+            self._start(lane)
+            return
+        if not defer and len(lane.waiters) >= lane.max_queue:
+            lane.shed += 1
+            raise AdmissionRejectedError(
+                f"{name} lane is saturated ({lane.active} running, {len(lane.waiters)} queued)",
+                retry_after=self.retry_after(name),
+            )
+        future = asyncio.get_running_loop().create_future()
+        lane.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as the caller went away: hand it on
+                self.release(name)
+            else:
+                lane.waiters.remove(future)
+            raise
+
+    def release(self, name: str, held_s: float = 0.0):
+        lane = self.lanes[name]
+        self.active -= 1
+        lane.active -= 1
+        if held_s:
+            lane.avg_s = held_s if not lane.avg_s else 0.9 * lane.avg_s + 0.1 * held_s
+        self._dispatch()
+
+    def _dispatch(self):
+        for lane in self.lanes.values():
+            while lane.waiters and self._has_slot(lane):
+                self._start(lane)
+                lane.waiters.popleft().set_result(None)
+
+    @asynccontextmanager
+    async def admit(self, name: str, defer: bool = False) -> AsyncIterator[None]:
+        """Hold a slot in lane `name` for the body; waits in the lane's queue or raises
+        AdmissionRejectedError when that is full (with `defer`, waits regardless)"""
+        if name not in self.lanes:
+            yield
+            return
+        await self.acquire(name, defer)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(name, time.monotonic() - start)
+
+    def retry_after(self, name: str) -> float:
+        """Rough seconds until the lane's current queue has drained"""
+        lane = self.lanes[name]
+        return max(1, math.ceil((len(lane.waiters) + 1) * lane.avg_s / lane.concurrency))
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                "concurrency": lane.concurrency,
+                "active": lane.active,
+                "queued": len(lane.waiters),
+                "admitted": lane.admitted,
+                "shed": lane.shed,
+            }
+            for name, lane in self.lanes.items()
+        }
+
+
+class LaneClassifier:
+    """A classifier whose `classify` calls wait for a slot in one lane first; lets evaluation
+    jobs run their own classifier at evaluation priority"""
+
+    def __init__(self, classifier, admission: AdmissionController, lane: str = EVALUATION):
+        self.classifier = classifier
+        self.admission = admission
+        self.lane = lane
+        self.model_name = classifier.model_name
+
+    async def classify(self, text: str, prompt_type: str = "advanced") -> Tuple[str, str, int]:
+        # A shed prediction would fail the whole job, so evaluation always waits its turn
+        async with self.admission.admit(self.lane, defer=True):
+            return await self.classifier.classify(text, prompt_type)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Set, Tuple, Union
+
+# One result per text: (classification, prompt_used, latency_ms) or the exception that text raised
+BatchFn = Callable[[List[str], str], Awaitable[List[Union[Tuple[str, str, int], Exception]]]]
+
+
+class MicroBatcher:
+    """Collects single-text requests for a short window and classifies each group with one batch call"""
+
+    def __init__(self, classify_batch: BatchFn, max_batch_size: int = 16, max_wait_ms: float = 10):
+        self.classify_batch = classify_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str, prompt_type: str = "advanced") -> Tuple[str, str, int]:
+        """Queue one text; resolves with (classification, prompt_used, latency_ms) as seen by this caller"""
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        # Texts are only grouped with others that use the same prompt
+        pending = self._pending.setdefault(prompt_type, [])
+        pending.append((text, future))
+        if len(pending) >= self.max_batch_size:
+            self._flush(prompt_type)
+        elif len(pending) == 1:
+            self._timers[prompt_type] = loop.call_later(self.max_wait_ms / 1000, self._flush, prompt_type)
+
+        classification, prompt_used, _ = await future
+        return classification, prompt_used, int((time.time() - start_time) * 1000)
+
+    def _flush(self, prompt_type: str):
+        timer = self._timers.pop(prompt_type, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(prompt_type, [])
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(batch, prompt_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]], prompt_type: str):
+        try:
+            results = await self.classify_batch([text for text, _ in batch], prompt_type)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away (client disconnect) while the batch was running
+            if future.done():
+                continue
+            # A text that failed on its own fails only its caller, not the rest of the window
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def drain(self):
+        """Flush anything still waiting for its window and wait for in-flight batches"""
+        for prompt_type in list(self._pending):
+            self._flush(prompt_type)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
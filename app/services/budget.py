@@ -0,0 +1,92 @@
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Mapping, Tuple
+
+TOTAL = "total"  # budget shared by all prompt types
+
+# Where an over-budget prompt can go instead; the scores prompt has no cheaper equivalent
+CHEAPER_PROMPT = {"advanced": "baseline", "dynamic": "baseline"}
+
+
+class TokenBudgetExceededError(Exception):
+    """The prompt's token budget for the current window is spent; the request is shed"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBudget:
+    """Provider tokens (input + output) each prompt type may spend per rolling window, plus an
+    optional "total" over all of them. Limits are per worker process.
+
+    Over budget, `choose` moves a prompt to its cheaper equivalent when `downgrade` is set
+    and that one still has room; `check` raises TokenBudgetExceededError for the rest.
+    """
+
+    def __init__(self, limits: Mapping[str, int], window_s: float = 60, downgrade: bool = True):
+        self.limits = dict(limits)
+        self.window_s = window_s
+        self.downgrade = downgrade
+        self._spent: Dict[str, Deque[Tuple[float, int]]] = {name: deque() for name in self.limits}
+        self._used: Dict[str, int] = {name: 0 for name in self.limits}
+
+    def _expire(self, name: str, now: float):
+        spent = self._spent[name]
+        while spent and spent[0][0] <= now - self.window_s:
+            self._used[name] -= spent.popleft()[1]
+
+    def _budgets(self, prompt_type: str):
+        return [name for name in (prompt_type, TOTAL) if name in self.limits]
+
+    def consume(self, prompt_type: str, tokens: int):
+        now = time.monotonic()
+        for name in self._budgets(prompt_type):
+            self._expire(name, now)
+            self._spent[name].append((now, tokens))
+            self._used[name] += tokens
+
+    def exhausted(self, prompt_type: str) -> bool:
+        now = time.monotonic()
+        for name in self._budgets(prompt_type):
+            self._expire(name, now)
+            if self._used[name] >= self.limits[name]:
+                return True
+        return False
+
+    def choose(self, prompt_type: str) -> str:
+        """`prompt_type`, or its cheaper equivalent when downgrading and the former is spent"""
+        cheaper = CHEAPER_PROMPT.get(prompt_type)
+        if self.downgrade and cheaper is not None and self.exhausted(prompt_type) and not self.exhausted(cheaper):
+            return cheaper
+        return prompt_type
+
+    def check(self, prompt_type: str):
+        if self.exhausted(prompt_type):
+            raise TokenBudgetExceededError(
+                f"token budget for {prompt_type} prompts is spent", retry_after=self.retry_after(prompt_type)
+            )
+
+    def retry_after(self, prompt_type: str) -> float:
+        """Seconds until every budget covering `prompt_type` is back under its limit"""
+        now = time.monotonic()
+        wait = 0.0
+        for name in self._budgets(prompt_type):
+            self._expire(name, now)
+            used = self._used[name]
+            for spent_at, tokens in self._spent[name]:
+                if used < self.limits[name]:
+                    break
+                used -= tokens
+                wait = max(wait, spent_at + self.window_s - now)
+        return max(1.0, float(math.ceil(wait)))
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        now = time.monotonic()
+        stats = {}
+        for name, limit in self.limits.items():
+            self._expire(name, now)
+            stats[name] = {"limit": limit, "used": self._used[name], "remaining": max(0, limit - self._used[name])}
+        return stats
+
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+ClassifyFn = Callable[[str], Awaitable[Tuple[str, str, int]]]
+
+_DONE = object()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = 1_000_000) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without holding more than one line in memory"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"NDJSON line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+def parse_record(line: str, line_number: int) -> Tuple[object, str]:
+    """Accept {"id": ..., "text": ...} objects or bare JSON strings; id defaults to the line number"""
+    record = json.loads(line)
+    if isinstance(record, str):
+        return line_number, record
+    if isinstance(record, dict) and isinstance(record.get("text"), str):
+        return record.get("id", line_number), record["text"]
+    raise ValueError('expected a JSON string or an object with a "text" field')
+
+
+async def classify_ndjson(
+    lines: AsyncIterator[str],
+    classify: ClassifyFn,
+    concurrency: int = 16,
+) -> AsyncIterator[Dict]:
+    """Classify NDJSON records with bounded concurrency, yielding results in completion order.
+
+    Input is only read as fast as results are consumed: both queues are bounded, so memory
+    stays flat regardless of how large the input is.
+    """
+    concurrency = max(1, concurrency)
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def read():
+        line_number = 0
+        try:
+            async for line in lines:
+                line_number += 1
+                if line.strip():
+                    await inbox.put((line_number, line))
+        except Exception as e:
+            await outbox.put({"id": None, "error": f"input stream failed: {e}"})
+        for _ in range(concurrency):
+            await inbox.put(_DONE)
+
+    async def work():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                await outbox.put(_DONE)
+                return
+            line_number, line = item
+            record_id: Optional[object] = line_number
+            try:
+                record_id, text = parse_record(line, line_number)
+                classification, prompt_used, latency_ms = await classify(text)
+                result = {"id": record_id, "class": classification, "prompt_used": prompt_used, "latency_ms": latency_ms}
+            except Exception as e:
+                result = {"id": record_id, "error": str(e)}
+            await outbox.put(result)
+
+    tasks = [asyncio.ensure_future(read())] + [asyncio.ensure_future(work()) for _ in range(concurrency)]
+    try:
+        finished_workers = 0
+        while finished_workers < concurrency:
+            result = await outbox.get()
+            if result is _DONE:
+                finished_workers += 1
+            else:
+                yield result
+    finally:
+        # Consumer went away (e.g. client disconnected): stop reading and classifying
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
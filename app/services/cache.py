@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Fold case, unicode forms and whitespace so trivially different copies share a key"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split())
+
+
+def cache_key(text: str, prompt_type: str, model_name: str) -> str:
+    raw = f"{model_name}\x00{prompt_type}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """Two-tier result cache: in-process LRU with TTL, optionally backed by SQLite"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 3600, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS classification_cache "
+                "(key TEXT PRIMARY KEY, label TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        label, created_at = entry
+        if self._expired(created_at):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return label
+
+    def _put_memory(self, key: str, label: str, created_at: float):
+        self._entries[key] = (label, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _get_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT label, created_at FROM classification_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return row[0], row[1]
+
+    def _put_disk(self, key: str, label: str, created_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO classification_cache (key, label, created_at) VALUES (?, ?, ?)",
+                (key, label, created_at),
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        label = self._get_memory(key)
+        if label is None and self._db is not None:
+            row = await asyncio.to_thread(self._get_disk, key)
+            if row is not None:
+                label = row[0]
+                self._put_memory(key, label, row[1])
+        return label
+
+    async def set(self, key: str, label: str):
+        created_at = time.time()
+        self._put_memory(key, label, created_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, key, label, created_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
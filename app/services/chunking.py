@@ -0,0 +1,62 @@
+from collections import Counter
+from typing import List, Sequence
+
+from app.services.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+COMBINE_RULES = ("any_toxic", "majority", "max_confidence")
+
+# Most severe first: "any_toxic" reports the worst label any chunk got, and ties go to it too
+SEVERITY = ("toxic", "spam", "safe")
+
+
+class InputTooLongError(ValueError):
+    """Text over the hard token limit; rejected before any LLM call"""
+
+    def __init__(self, tokens: int, max_tokens: int):
+        super().__init__(f"text is ~{tokens} tokens, over the limit of {max_tokens}")
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+
+
+def split_chunks(text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """Windows of about `chunk_tokens` (estimated) tokens, each repeating the last
+    `overlap_tokens` of the previous one so a phrase cut at a boundary is still seen whole.
+    Cuts fall on whitespace where there is any in the second half of a window; the overlap is
+    capped at a quarter of a chunk so every window moves the text forward."""
+    chunk_chars = max(1, chunk_tokens) * CHARS_PER_TOKEN
+    overlap_chars = min(max(0, overlap_tokens) * CHARS_PER_TOKEN, chunk_chars // 4)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_chars
+        if end < len(text):
+            space = text.rfind(" ", start + chunk_chars // 2, end + 1)
+            end = space if space > start else end
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = max(end - overlap_chars, start + 1)
+        # Start the next window on a word, not inside one
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 and overlap_chars else next_start
+    return chunks
+
+
+def severity(label: str) -> int:
+    # Labels outside SEVERITY (extra score labels) rank below "safe"
+    return SEVERITY.index(label) if label in SEVERITY else len(SEVERITY)
+
+
+def combine_labels(labels: Sequence[str], rule: str) -> str:
+    """One label for a text from its chunks' labels: the most severe ("any_toxic") or the most
+    common, ties to the more severe ("majority")"""
+    if rule == "majority":
+        counts = Counter(labels)
+        return min(counts, key=lambda label: (-counts[label], severity(label)))
+    return min(labels, key=severity)
+
+
+def needs_chunking(text: str, chunk_tokens: int) -> bool:
+    return chunk_tokens > 0 and estimate_tokens(text) > chunk_tokens
@@ -1,52 +1,763 @@
+import asyncio
+import json
+import random
+import re
 import time
 import sys
-from typing import Tuple
-from langchain_google_genai import  ChatGoogleGenerativeAI
-from app.prompts.prompt_library import PROMPT_REGISTRY
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from app.prompts.prompt_library import ADVANCED_EXAMPLES, PROMPT_REGISTRY, format_examples
 from app.telemetry.custom_exception import customException
 from app.telemetry.custom_logger import CustomLogger
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-os.environ["GOOGLE_API_KEY"]=os.getenv("GOOGLE_API_KEY")
+from app.services.cache import ClassificationCache, cache_key
+from app.services.chunking import InputTooLongError, combine_labels, needs_chunking, severity, split_chunks
+from app.services.coalescing import SingleFlight
+from app.services.examples import ExampleIndex, build_example_index
+from app.services.near_duplicate import NearDuplicateIndex
+from app.services.prefilter import HeuristicPreClassifier
+from app.services.llm_client import LLMClient, LLMUnavailableError
+from app.services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, hedged, is_provider_failure
+from app.services.tokens import estimate_tokens, token_usage
+from app.services.budget import TokenBudget, TokenBudgetExceededError
+from app import config
 
 log=CustomLogger().get_logger(__name__)
 
+LABELS = ("toxic", "spam", "safe")
+PREFILTER_PROMPT = "local_prefilter"
+DEGRADED_PROMPT = "degraded_fallback"
+SCORES_PROMPT = "scores"
+# (classification, prompt_used, latency_ms), or the error that text alone ran into
+BatchResult = Union[Tuple[str, str, int], Exception]
+
+NEAR_DUPLICATE_PROMPT = "near_duplicate"  # label reused from an earlier, nearly identical text
+CASCADE_PROMPT = "cascade"  # baseline first, advanced only when needed
+DYNAMIC_PROMPT = "dynamic"  # few-shot examples retrieved per text
+
+# Whole words (keeping "isn't"), so "nontoxic" or "spammy" don't count and negations can be seen
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_NEGATIONS = {"not", "no", "non", "never", "nor", "isn't", "isnt"}
+# Words plus clause punctuation: a negation reaches at most this many words back, and not past
+# punctuation or another label, so "not a toxic message" is negated but "not toxic, spam" isn't
+_CLAUSE_RE = re.compile(r"[a-z]+(?:'[a-z]+)?|[.,;:!?]")
+_NEGATION_WINDOW = 3
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# "3. spam", "3) spam", "3: Spam" ...
+_BATCH_LINE_RE = re.compile(r"^\s*(\d+)\s*[.):\-]\s*\**\s*([a-zA-Z]+)")
+
 class TextClassifier:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
-        
-    async def classify(self, text: str, prompt_type: str = "advanced") -> Tuple[str, float, str, int]:
+    def __init__(
+        self,
+        llm=None,
+        client: Optional[LLMClient] = None,
+        batch_size: int = config.CLASSIFY_BATCH_SIZE,
+        cache: Optional[ClassificationCache] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        prefilter: Optional[HeuristicPreClassifier] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        fallback: Optional[HeuristicPreClassifier] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_delay_ms: float = 50,
+        hedge_min_samples: int = 20,
+        cascade_sample_rate: float = 0.0,
+        cascade_escalate_labels: Sequence[str] = (),
+        examples: Optional[ExampleIndex] = None,
+        examples_k: int = 4,
+        budget: Optional[TokenBudget] = None,
+        chunk_tokens: int = 0,
+        chunk_overlap_tokens: int = 0,
+        chunk_combine: str = "any_toxic",
+        max_input_tokens: int = 0,
+        telemetry=None,
+    ):
+        # Part of every cache key, so fake-provider answers never mix with real ones
+        self.model_name = "fake" if config.LLM_PROVIDER == "fake" else config.LLM_MODEL
+        if client is None:
+            client = LLMClient(llm or build_llm())
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self.prefilter = prefilter
+        self.breaker = breaker
+        self.fallback = fallback
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.hedge_min_samples = hedge_min_samples
+        self.cascade_sample_rate = cascade_sample_rate
+        self.cascade_escalate_labels = set(cascade_escalate_labels)
+        self.examples = examples
+        self.examples_k = examples_k
+        self.budget = budget
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.chunk_combine = chunk_combine
+        self.max_input_tokens = max_input_tokens
+        self.latencies = LatencyTracker()
+        self.telemetry = telemetry
+        if telemetry is not None and self.client.on_stage is None:
+            self.client.on_stage = telemetry.record_stage
+        self._inflight = SingleFlight()
+
+    async def classify(self, text: str, prompt_type: str = "advanced") -> Tuple[str, str, int]:
+        start_time = time.time()
+
+        local_label = self._prefilter(text)
+        if local_label is not None:
+            return local_label, PREFILTER_PROMPT, int((time.time() - start_time) * 1000)
+
+        prompt_type = self._budgeted(prompt_type)
+        key, cached = await self._lookup_cache(text, prompt_type)
+        if cached is not None:
+            return (*self._cached_answer(cached, prompt_type), int((time.time() - start_time) * 1000))
+
+        near_label = self._near_duplicate(text, prompt_type)
+        if near_label is not None:
+            return near_label, NEAR_DUPLICATE_PROMPT, int((time.time() - start_time) * 1000)
+
+        # Identical requests already on their way to the LLM share that call
+        key = key or cache_key(text, prompt_type, self.model_name)
+        (classification, prompt_used, _), shared = await self._inflight.do(
+            key, lambda: self._classify_and_store(text, prompt_type, key)
+        )
+        if shared and self.telemetry is not None:
+            self.telemetry.record_coalesced()
+        return classification, prompt_used, int((time.time() - start_time) * 1000)
+
+    def is_long(self, text: str) -> bool:
+        """Whether classify_long has work to do for the text (split it, or reject it as too long)
+        instead of classifying it whole"""
+        too_long = self.max_input_tokens > 0 and estimate_tokens(text) > self.max_input_tokens
+        return too_long or needs_chunking(text, self.chunk_tokens)
+
+    def check_length(self, text: str):
+        """Raise InputTooLongError for texts over max_input_tokens"""
+        tokens = estimate_tokens(text)
+        if self.max_input_tokens > 0 and tokens > self.max_input_tokens:
+            if self.telemetry is not None:
+                self.telemetry.record_chunking(rejected=True)
+            raise InputTooLongError(tokens, self.max_input_tokens)
+
+    async def classify_long(self, text: str, prompt_type: str = "advanced") -> Tuple[str, str, int, int]:
+        """`classify` for texts of any length; returns (label, prompt_used, latency_ms, chunks).
+
+        Texts over chunk_tokens are split into overlapping chunks, classified concurrently
+        (each through the usual tiers), and combined by chunk_combine: the most severe label
+        ("any_toxic"), the most common ("majority"), or the single most confident label of
+        any chunk's scores ("max_confidence"). prompt_used is that of a chunk with the result.
+        """
         start_time = time.time()
-        
+        self.check_length(text)
+        if not needs_chunking(text, self.chunk_tokens):
+            return (*await self.classify(text, prompt_type), 1)
+
+        chunks = split_chunks(text, self.chunk_tokens, self.chunk_overlap_tokens)
+        if self.chunk_combine == "max_confidence":
+            scored = await asyncio.gather(*(self.classify_with_scores(chunk, LABELS) for chunk in chunks))
+            _, classification, prompt_used = max(
+                ((score, label, prompt_used) for scores, prompt_used, _ in scored for label, score in scores.items()),
+                key=lambda candidate: (candidate[0], -severity(candidate[1])),
+            )
+        else:
+            results = await asyncio.gather(*(self.classify(chunk, prompt_type) for chunk in chunks))
+            classification = combine_labels([label for label, _, _ in results], self.chunk_combine)
+            prompt_used = next(used for label, used, _ in results if label == classification)
+        if self.telemetry is not None:
+            self.telemetry.record_chunking(chunks=len(chunks))
+        return classification, prompt_used, int((time.time() - start_time) * 1000), len(chunks)
+
+    async def _classify_and_store(self, text: str, prompt_type: str, key: str) -> Tuple[str, str, int]:
+        result = await self._classify_llm(text, prompt_type, time.time())
+        if result[1] != DEGRADED_PROMPT:
+            await self._store_cache(key, json.dumps(result[:2]))
+            self._remember(text, prompt_type, result[0])
+        return result
+
+    async def _invoke_llm(self, messages, prompt_type: str, hedge: bool = True):
+        """One provider call behind the circuit breaker, hedged after the running latency percentile.
+        The client times its stages (queue, provider call, retry backoff) under `prompt_type`"""
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError("circuit breaker open, skipping LLM call", retry_after=self.breaker.retry_after())
+
+        async def timed_call():
+            call_start = time.monotonic()
+            response = await self.client.ainvoke(messages, prompt_type=prompt_type)
+            # Only single-text calls are hedged; slower packed calls would push their delay out
+            if hedge:
+                self.latencies.record(time.monotonic() - call_start)
+            return response
+
         try:
-                # Get prompt
-            prompt_key = f"{prompt_type}_classification"
-            prompt = PROMPT_REGISTRY[prompt_key]
-            
-            # Create chain and invoke
-            chain = prompt | self.llm
-            response = await chain.ainvoke({"text": text})
-            
-            # Parse response
-            classification = self._parse_classification(response.content)
+            response, hedge_fired = await hedged(timed_call, self._hedge_delay() if hedge else None)
+        except asyncio.CancelledError:
+            if self.breaker is not None:
+                self.breaker.abandon()
+            raise
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record(not is_provider_failure(e))
+            raise
+        if self.breaker is not None:
+            self.breaker.record(True)
+        if hedge_fired and self.telemetry is not None:
+            self.telemetry.record_hedge()
+        return response
+
+    def _stage(self, stage: str, prompt_type: str):
+        if self.telemetry is None:
+            return nullcontext({"outcome": "ok"})
+        return self.telemetry.time_stage(stage, prompt_type)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_percentile is None or len(self.latencies) < self.hedge_min_samples:
+            return None
+        # A throttled provider doesn't need duplicate traffic
+        if self.client.bucket.rate < self.client.max_rate:
+            return None
+        return max(self.hedge_min_delay_ms / 1000, self.latencies.percentile(self.hedge_percentile))
+
+    def _degraded(self, text: str, error: LLMUnavailableError, start_time: float) -> Tuple[str, str, int]:
+        if self.fallback is None:
+            raise error
+        if self.telemetry is not None:
+            self.telemetry.record_degraded()
+        log.warning(f"LLM unavailable, answering with degraded classifier: {error}")
+        return self.fallback.best_guess(text), DEGRADED_PROMPT, int((time.time() - start_time) * 1000)
+
+    def _prefilter(self, text: str) -> Optional[str]:
+        prediction = self._prefilter_prediction(text)
+        return prediction[0] if prediction else None
+
+    def _prefilter_prediction(self, text: str) -> Optional[Tuple[str, float]]:
+        if self.prefilter is None:
+            return None
+        prediction = self.prefilter.predict(text)
+        if self.telemetry is not None:
+            self.telemetry.record_prefilter(prediction is not None)
+        return prediction
+
+    async def _lookup_cache(self, text: str, prompt_type: str) -> Tuple[Optional[str], Optional[str]]:
+        if self.cache is None:
+            return None, None
+        key = cache_key(text, prompt_type, self.model_name)
+        label = await self.cache.get(key)
+        if self.telemetry is not None:
+            self.telemetry.record_cache_lookup(label is not None)
+        return key, label
+
+    async def _store_cache(self, key: Optional[str], value: str):
+        if self.cache is not None and key is not None:
+            await self.cache.set(key, value)
+
+    @staticmethod
+    def _cached_answer(cached: str, prompt_type: str) -> Tuple[str, str]:
+        """(label, prompt that answered) of a cached classification: a cascade entry was answered
+        by baseline or advanced. Entries cached before the prompt was stored hold only the label"""
+        try:
+            label, prompt_used = json.loads(cached)
+        except ValueError:
+            return cached, prompt_type
+        return label, prompt_used
+
+    def _near_duplicate(self, text: str, prompt_type: str) -> Optional[str]:
+        """Label of an already classified text that differs only by a few SimHash bits"""
+        if self.near_duplicates is None:
+            return None
+        match = self.near_duplicates.lookup(text, prompt_type)
+        if self.telemetry is not None:
+            self.telemetry.record_near_duplicate(match is not None)
+        return match[0] if match else None
+
+    def _remember(self, text: str, prompt_type: str, label: str):
+        if self.near_duplicates is not None:
+            self.near_duplicates.add(text, label, prompt_type)
+
+    async def _classify_llm(self, text: str, prompt_type: str, start_time: float) -> Tuple[str, str, int]:
+        try:
+            if prompt_type == CASCADE_PROMPT:
+                classification, prompt_used = await self._classify_cascade(text)
+            else:
+                answer = await self._ask(text, prompt_type)
+                with self._stage("parse", prompt_type):
+                    classification = self._parse_classification(answer)
+                prompt_used = prompt_type
             latency_ms = int((time.time() - start_time) * 1000)
             
             
-            log.info("classification has done")
-            return classification, prompt_type, latency_ms
-            
+            log.info("classification has done", sampled=True, prompt_type=prompt_used, latency_ms=latency_ms)
+            return classification, prompt_used, latency_ms
+
+        except LLMUnavailableError as e:
+            return self._degraded(text, e, start_time)
+        except TokenBudgetExceededError:
+            raise
         except Exception as e:
             log.error(f"error during classification {e}")
             raise customException("error during classification",sys)
     
-    def _parse_classification(self, response: str) -> str:
-        # Extract classification from response
-        response = response.lower().strip()
-        if "toxic" in response:
-            return "toxic"
-        elif "spam" in response:
-            return "spam"
+    async def _ask(self, text: str, prompt_type: str) -> str:
+        """Render the single-text prompt, call the LLM and return its raw answer"""
+        prompt = PROMPT_REGISTRY[f"{prompt_type}_classification"]
+        self._check_budget(prompt_type)
+        with self._stage("render", prompt_type):
+            messages = prompt.format_messages(text=text, **self._prompt_vars(prompt_type, [text]))
+        response = await self._invoke_llm(messages, prompt_type)
+        self._record_tokens(prompt_type, messages, response)
+        return response.content
+
+    def _prompt_vars(self, prompt_type: str, texts: List[str]) -> Dict[str, str]:
+        """Extra template variables: the retrieved few-shot examples of the dynamic prompt"""
+        if prompt_type != DYNAMIC_PROMPT:
+            return {}
+        examples = []
+        if self.examples is not None:
+            if len(texts) == 1:
+                found = self.examples.search(texts[0], self.examples_k)
+            else:
+                # One shared block for a packed call, capped so it stays shorter than the static list
+                found = self.examples.search_many(texts, self.examples_k, limit=2 * self.examples_k)
+            examples = [(text, label) for text, label, _ in found]
+        return {"examples": format_examples(examples or ADVANCED_EXAMPLES)}
+
+    async def _classify_cascade(self, text: str) -> Tuple[str, str]:
+        """Baseline prompt first; the ~6x longer advanced prompt only runs for answers that
+        aren't a clean label, for labels configured to be double-checked, or when sampled"""
+        answer = await self._ask(text, "baseline")
+        with self._stage("parse", "baseline"):
+            label = self._parse_strict(answer)
+        reason = self._escalation_reason(label)
+        if reason is None:
+            self._record_route("baseline", "confident")
+            return label, "baseline"
+        if self._budgeted("advanced") == "baseline":
+            # No advanced budget left: the baseline answer stands
+            self._record_route("baseline", "budget")
+            return label or self._parse_classification(answer), "baseline"
+        self._record_route("advanced", reason)
+        answer = await self._ask(text, "advanced")
+        with self._stage("parse", "advanced"):
+            return self._parse_classification(answer), "advanced"
+
+    def _escalation_reason(self, label: Optional[str]) -> Optional[str]:
+        if label is None:
+            return "unparsed"
+        if label in self.cascade_escalate_labels:
+            return "flagged"
+        if self.cascade_sample_rate and random.random() < self.cascade_sample_rate:
+            return "sampled"
+        return None
+
+    def _record_route(self, route: str, reason: str):
+        if self.telemetry is not None:
+            self.telemetry.record_route(route, reason)
+
+    def _budgeted(self, prompt_type: str) -> str:
+        """The prompt to use given the token budget: `prompt_type` or its cheaper equivalent"""
+        if self.budget is None:
+            return prompt_type
+        chosen = self.budget.choose(prompt_type)
+        if chosen != prompt_type and self.telemetry is not None:
+            self.telemetry.record_budget("downgraded")
+        return chosen
+
+    def _check_budget(self, prompt_type: str):
+        if self.budget is None:
+            return
+        try:
+            self.budget.check(prompt_type)
+        except TokenBudgetExceededError:
+            if self.telemetry is not None:
+                self.telemetry.record_budget("shed")
+            raise
+
+    def _record_tokens(self, prompt_type: str, messages, response, budget_prompt: Optional[str] = None):
+        input_tokens, output_tokens = token_usage(messages, response)
+        if self.telemetry is not None:
+            self.telemetry.record_tokens(prompt_type, input_tokens, output_tokens)
+        if self.budget is not None:
+            self.budget.consume(budget_prompt or prompt_type, input_tokens + output_tokens)
+
+    async def classify_with_scores(
+        self, text: str, labels: Optional[Sequence[str]] = None
+    ) -> Tuple[Dict[str, float], str, int]:
+        """Independent 0-1 confidence for every label from a single JSON-answering LLM call.
+
+        Labels default to toxic/spam/safe plus config.CLASSIFY_EXTRA_LABELS. Returns
+        (scores, prompt_used, latency_ms); callers pick the top label or apply a threshold.
+        """
+        start_time = time.time()
+        self.check_length(text)
+        labels = list(dict.fromkeys(labels or (*LABELS, *config.CLASSIFY_EXTRA_LABELS)))
+
+        if self._prefilter_prediction(text) is not None:
+            return self._heuristic_scores(self.prefilter, text, labels), PREFILTER_PROMPT, int((time.time() - start_time) * 1000)
+
+        score_key = f"{SCORES_PROMPT}:{','.join(labels)}"
+        key, cached = await self._lookup_cache(text, score_key)
+        if cached is not None:
+            return json.loads(cached), SCORES_PROMPT, int((time.time() - start_time) * 1000)
+
+        key = key or cache_key(text, score_key, self.model_name)
+
+        async def score_and_store():
+            result = await self._classify_scores_llm(text, labels, time.time())
+            if result[1] != DEGRADED_PROMPT:
+                await self._store_cache(key, json.dumps(result[0]))
+            return result
+
+        (scores, prompt_used, _), shared = await self._inflight.do(key, score_and_store)
+        if shared and self.telemetry is not None:
+            self.telemetry.record_coalesced()
+        return scores, prompt_used, int((time.time() - start_time) * 1000)
+
+    async def _classify_scores_llm(self, text: str, labels: List[str], start_time: float) -> Tuple[Dict[str, float], str, int]:
+        try:
+            prompt = PROMPT_REGISTRY["scores_classification"]
+            self._check_budget(SCORES_PROMPT)
+            with self._stage("render", SCORES_PROMPT):
+                messages = prompt.format_messages(labels=", ".join(labels), text=text)
+            response = await self._invoke_llm(messages, SCORES_PROMPT)
+            self._record_tokens(SCORES_PROMPT, messages, response)
+            with self._stage("parse", SCORES_PROMPT) as stage:
+                scores = self._parse_scores(response.content, labels)
+                if scores is None:
+                    # Not valid JSON: fall back to reading a plain label answer
+                    stage["outcome"] = "fallback"
+                    log.warning("score response was not a JSON object, using the plain label")
+                    label = self._parse_classification(response.content)
+                    scores = {name: float(name == label) for name in labels}
+            log.info("scored classification has done", sampled=True, latency_ms=int((time.time() - start_time) * 1000))
+            return scores, SCORES_PROMPT, int((time.time() - start_time) * 1000)
+        except LLMUnavailableError as e:
+            _, prompt_used, latency_ms = self._degraded(text, e, start_time)
+            return self._heuristic_scores(self.fallback, text, labels), prompt_used, latency_ms
+        except TokenBudgetExceededError:
+            raise
+        except Exception as e:
+            log.error(f"error during scored classification {e}")
+            raise customException("error during scored classification", sys)
+
+    @staticmethod
+    def _heuristic_scores(rules: HeuristicPreClassifier, text: str, labels: List[str]) -> Dict[str, float]:
+        rule_scores = rules.score(text)
+        scores = {label: rule_scores.get(label, 0.0) for label in labels}
+        if "safe" in scores:
+            scores["safe"] = round(1 - max(rule_scores.values()), 4)
+        return scores
+
+    @staticmethod
+    def _parse_scores(response: str, labels: List[str]) -> Optional[Dict[str, float]]:
+        match = _JSON_OBJECT_RE.search(response)
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        data = {str(name).strip().lower(): value for name, value in data.items()}
+        if not any(label in data for label in labels):
+            return None
+        scores = {}
+        for label in labels:
+            try:
+                scores[label] = round(min(1.0, max(0.0, float(data.get(label, 0.0)))), 4)
+            except (TypeError, ValueError):
+                scores[label] = 0.0
+        return scores
+
+    async def classify_batch(self, texts: List[str], prompt_type: str = "advanced") -> List[BatchResult]:
+        """Classify many texts, packing up to batch_size texts into each LLM call. A text whose
+        classification fails gets its exception in place of a result, so it doesn't fail the others"""
+        start_time = time.time()
+        prompt_type = self._budgeted(prompt_type)
+        results: List[Optional[BatchResult]] = [None] * len(texts)
+        keys: List[str] = []
+        for i, text in enumerate(texts):
+            local_label = self._prefilter(text)
+            if local_label is not None:
+                keys.append("")
+                results[i] = (local_label, PREFILTER_PROMPT, int((time.time() - start_time) * 1000))
+                continue
+            key, cached = await self._lookup_cache(text, prompt_type)
+            keys.append(key or cache_key(text, prompt_type, self.model_name))
+            if cached is not None:
+                results[i] = (*self._cached_answer(cached, prompt_type), int((time.time() - start_time) * 1000))
+                continue
+            near_label = self._near_duplicate(text, prompt_type)
+            if near_label is not None:
+                results[i] = (near_label, NEAR_DUPLICATE_PROMPT, int((time.time() - start_time) * 1000))
+
+        # Distinct cache misses that aren't already on their way to the LLM get packed into new calls
+        to_send: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if results[i] is None and key not in to_send and not self._inflight.pending(key):
+                to_send[key] = i
+        send = list(to_send.values())
+        packed_calls: Dict[str, Tuple[asyncio.Future, int]] = {}
+        for offset in range(0, len(send), self.batch_size):
+            chunk = send[offset:offset + self.batch_size]
+            packed = asyncio.ensure_future(self._classify_packed([texts[i] for i in chunk], prompt_type))
+            for position, i in enumerate(chunk):
+                packed_calls[keys[i]] = (packed, position)
+
+        async def resolve(i: int) -> Tuple[str, str, int]:
+            key = keys[i]
+
+            async def from_packed():
+                packed, position = packed_calls[key]
+                result = (await asyncio.shield(packed))[position]
+                if isinstance(result, Exception):
+                    raise result
+                if result[1] != DEGRADED_PROMPT:
+                    await self._store_cache(key, json.dumps(result[:2]))
+                    self._remember(texts[i], prompt_type, result[0])
+                return result
+
+            if key in packed_calls:
+                fn = from_packed
+            else:
+                fn = lambda: self._classify_and_store(texts[i], prompt_type, key)
+            (classification, prompt_used, _), shared = await self._inflight.do(key, fn)
+            if shared and self.telemetry is not None:
+                self.telemetry.record_coalesced()
+            return classification, prompt_used, int((time.time() - start_time) * 1000)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        for i, result in zip(pending, await asyncio.gather(*(resolve(i) for i in pending), return_exceptions=True)):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result  # cancellation, not a failure of this text
+            results[i] = result
+        return results
+
+    async def _classify_packed(self, texts: List[str], prompt_type: str) -> List[BatchResult]:
+        start_time = time.time()
+        if prompt_type == CASCADE_PROMPT and len(texts) > 1:
+            return await self._classify_packed_cascade(texts, start_time)
+        if len(texts) == 1:
+            return [await self._classify_llm(texts[0], prompt_type, start_time)]
+
+        labels: List[Optional[str]] = [None] * len(texts)
+        try:
+            labels = await self._packed_labels(texts, prompt_type)
+        except KeyError:
+            raise customException(f"unknown prompt type {prompt_type}", sys)
+        except LLMUnavailableError as e:
+            # Falling back to one call per text would only add load to a struggling provider
+            return [self._degraded(text, e, start_time) for text in texts]
+        except TokenBudgetExceededError:
+            raise
+        except Exception as e:
+            log.error(f"error during batch classification {e}")
+        latency_ms = int((time.time() - start_time) * 1000)
+
+        # Anything the model skipped or garbled is retried one text at a time
+        missing = [i for i, label in enumerate(labels) if label is None]
+        if missing:
+            log.warning(f"batch parse incomplete, falling back to single calls for {len(missing)}/{len(texts)} texts")
+            # One text the provider refuses (a 400, a safety block) only fails that text
+            fallbacks = await asyncio.gather(
+                *(self._classify_llm(texts[i], prompt_type, time.time()) for i in missing), return_exceptions=True
+            )
         else:
-            return "safe"
\ No newline at end of file
+            fallbacks = []
+        fallback_by_index = dict(zip(missing, fallbacks))
+
+        log.info("batch classification has done", sampled=True, batch_size=len(texts), fallbacks=len(missing))
+        return [
+            fallback_by_index[i] if label is None else (label, prompt_type, latency_ms)
+            for i, label in enumerate(labels)
+        ]
+
+    async def _packed_labels(self, texts: List[str], prompt_type: str) -> List[Optional[str]]:
+        """One numbered-list call for all texts; None where the answer has no usable line"""
+        stage_prompt = f"{prompt_type}_batch"
+        prompt = PROMPT_REGISTRY[f"{prompt_type}_batch_classification"]
+        self._check_budget(prompt_type)
+        with self._stage("render", stage_prompt):
+            messages = prompt.format_messages(
+                count=len(texts), texts=self._format_numbered(texts), **self._prompt_vars(prompt_type, texts)
+            )
+        response = await self._invoke_llm(messages, stage_prompt, hedge=False)
+        self._record_tokens(stage_prompt, messages, response, budget_prompt=prompt_type)
+        with self._stage("parse", stage_prompt) as stage:
+            labels = self._parse_batch_classification(response.content, len(texts))
+            if None in labels:
+                stage["outcome"] = "partial"
+        return labels
+
+    async def _classify_packed_cascade(self, texts: List[str], start_time: float) -> List[BatchResult]:
+        try:
+            labels = await self._packed_labels(texts, "baseline")
+        except LLMUnavailableError as e:
+            return [self._degraded(text, e, start_time) for text in texts]
+        except TokenBudgetExceededError:
+            raise
+        except Exception as e:
+            log.error(f"error during batch classification {e}")
+            labels = [None] * len(texts)
+        latency_ms = int((time.time() - start_time) * 1000)
+
+        results: List[Optional[BatchResult]] = [None] * len(texts)
+        reasons = {}
+        for i, label in enumerate(labels):
+            reason = self._escalation_reason(label)
+            if reason is None:
+                self._record_route("baseline", "confident")
+                results[i] = (label, "baseline", latency_ms)
+            else:
+                reasons[i] = reason
+        if not reasons:
+            return results
+
+        # Without advanced budget, answered texts keep their baseline label and only the
+        # unparsed ones are asked again
+        target = self._budgeted("advanced")
+        escalate = []
+        for i, reason in reasons.items():
+            if target == "baseline" and labels[i] is not None:
+                self._record_route("baseline", "budget")
+                results[i] = (labels[i], "baseline", latency_ms)
+            else:
+                self._record_route(target, reason if target == "advanced" else "budget")
+                escalate.append(i)
+        if escalate:
+            escalated = await self._classify_packed([texts[i] for i in escalate], target)
+            for i, result in zip(escalate, escalated):
+                results[i] = result
+        return results
+
+    @staticmethod
+    def _format_numbered(texts: List[str]) -> str:
+        # One text per line so a newline inside a text can't shift the numbering
+        return "\n".join(f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, start=1))
+
+    def _parse_batch_classification(self, response: str, count: int) -> List[Optional[str]]:
+        labels: List[Optional[str]] = [None] * count
+        for line in response.splitlines():
+            match = _BATCH_LINE_RE.match(line)
+            if not match:
+                continue
+            index, label = int(match.group(1)) - 1, match.group(2).lower()
+            if 0 <= index < count and label in LABELS and labels[index] is None:
+                labels[index] = label
+        return labels
+
+    def _parse_strict(self, response: str) -> Optional[str]:
+        """The label when the answer is just that label (optionally after "Classification:"), else None"""
+        words = _WORD_RE.findall(response.lower())
+        if words[:1] == ["classification"]:
+            words = words[1:]
+        return words[0] if len(words) == 1 and words[0] in LABELS else None
+
+    def _parse_classification(self, response: str) -> str:
+        # First label mentioned as a whole word and not negated, so "not toxic", "not really
+        # toxic" or "non-toxic, safe" no longer come out as toxic
+        tokens = _CLAUSE_RE.findall(response.lower())
+        for i, token in enumerate(tokens):
+            if token in LABELS and not self._negated(tokens, i):
+                return token
+        return "safe"
+
+    @staticmethod
+    def _negated(tokens: List[str], i: int) -> bool:
+        for token in reversed(tokens[max(0, i - _NEGATION_WINDOW):i]):
+            if token in _NEGATIONS:
+                return True
+            if token in LABELS or not token[0].isalpha():
+                return False
+        return False
+
+
+def build_llm():
+    """Chat model for config.LLM_PROVIDER; retries are left to LLMClient"""
+    if config.LLM_PROVIDER == "fake":
+        from app.services.fake_llm import FakeChatModel
+
+        return FakeChatModel(
+            latency_ms=config.FAKE_LLM_LATENCY_MS,
+            latency_sigma=config.FAKE_LLM_LATENCY_SIGMA,
+            error_rate=config.FAKE_LLM_ERROR_RATE,
+        )
+    # Imported on first use: the Gemini SDK is the slowest import in the app
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=config.LLM_MODEL, temperature=0, max_retries=1)
+
+
+def build_classifier(telemetry=None) -> TextClassifier:
+    """TextClassifier with the cache, near-duplicate and pre-classifier tiers and the example
+    index configured from app.config"""
+    cache = None
+    if config.CLASSIFY_CACHE_ENABLED:
+        cache = ClassificationCache(
+            max_size=config.CLASSIFY_CACHE_SIZE,
+            ttl_seconds=config.CLASSIFY_CACHE_TTL_S,
+            db_path=config.CLASSIFY_CACHE_DB or None,
+        )
+    examples = None
+    if config.DYNAMIC_EXAMPLES_ENABLED:
+        examples = build_example_index(
+            config.DYNAMIC_EXAMPLES_DIR,
+            config.DYNAMIC_EXAMPLES_DIM,
+            ADVANCED_EXAMPLES,
+            config.EVAL_DATASETS_DIR,
+            telemetry.feedback_store.iter_records if telemetry is not None else tuple,
+        )
+    near_duplicates = None
+    if config.NEAR_DUP_ENABLED:
+        near_duplicates = NearDuplicateIndex(
+            max_distance=config.NEAR_DUP_MAX_DISTANCE,
+            max_size=config.NEAR_DUP_SIZE,
+            min_words=config.NEAR_DUP_MIN_WORDS,
+        )
+    prefilter = HeuristicPreClassifier(threshold=config.PREFILTER_THRESHOLD) if config.PREFILTER_ENABLED else None
+    client = LLMClient(
+        build_llm(),
+        max_in_flight=config.LLM_MAX_IN_FLIGHT,
+        rate_per_s=config.LLM_RATE_LIMIT_PER_S,
+        min_rate_per_s=config.LLM_MIN_RATE_PER_S,
+        max_retries=config.LLM_MAX_RETRIES,
+        backoff_base_s=config.LLM_BACKOFF_BASE_S,
+        backoff_max_s=config.LLM_BACKOFF_MAX_S,
+        deadline_s=config.LLM_REQUEST_DEADLINE_S,
+    )
+    breaker = None
+    if config.CIRCUIT_BREAKER_ENABLED:
+        breaker = CircuitBreaker(
+            failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+            window=config.CIRCUIT_WINDOW,
+            min_calls=config.CIRCUIT_MIN_CALLS,
+            open_seconds=config.CIRCUIT_OPEN_S,
+        )
+    fallback = HeuristicPreClassifier() if config.CIRCUIT_FALLBACK == "heuristic" else None
+    budget = None
+    if config.TOKEN_BUDGETS:
+        budget = TokenBudget(
+            config.TOKEN_BUDGETS,
+            window_s=config.TOKEN_BUDGET_WINDOW_S,
+            downgrade=config.TOKEN_BUDGET_ACTION == "downgrade",
+        )
+    return TextClassifier(
+        client=client,
+        cache=cache,
+        near_duplicates=near_duplicates,
+        prefilter=prefilter,
+        breaker=breaker,
+        fallback=fallback,
+        hedge_percentile=config.HEDGE_PERCENTILE if config.HEDGE_ENABLED else None,
+        hedge_min_delay_ms=config.HEDGE_MIN_DELAY_MS,
+        hedge_min_samples=config.HEDGE_MIN_SAMPLES,
+        cascade_sample_rate=config.CASCADE_SAMPLE_RATE,
+        cascade_escalate_labels=config.CASCADE_ESCALATE_LABELS,
+        examples=examples,
+        examples_k=config.DYNAMIC_EXAMPLES_K,
+        budget=budget,
+        chunk_tokens=config.CLASSIFY_CHUNK_TOKENS,
+        chunk_overlap_tokens=config.CLASSIFY_CHUNK_OVERLAP_TOKENS,
+        chunk_combine=config.CLASSIFY_CHUNK_COMBINE,
+        max_input_tokens=config.CLASSIFY_MAX_INPUT_TOKENS,
+        telemetry=telemetry,
+    )
@@ -0,0 +1,245 @@
+import csv
+import glob
+import itertools
+import json
+import os
+import uuid
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.cache import normalize_text
+from app.telemetry.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# meta.json names the current snapshot's files; replacing it is what publishes a new snapshot,
+# so concurrent savers (several workers) can't leave vectors and texts from different snapshots
+META_FILE = "meta.json"
+
+
+def _ngrams(text: str) -> Iterator[str]:
+    # Character 3-grams inside word boundaries plus whole words: robust to typos and
+    # obfuscation ("fr33 m0ney") while still rewarding shared vocabulary
+    text = normalize_text(text)
+    padded = f" {text} "
+    for i in range(len(padded) - 2):
+        yield padded[i:i + 3]
+    for word in text.split():
+        yield f"w:{word}"
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    """L2-normalised hashed n-gram vector; crc32 rather than hash() so stored vectors stay valid
+    across processes"""
+    hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in _ngrams(text)), dtype=np.uint32)
+    if not len(hashes):
+        return np.zeros(dim, dtype=np.float32)
+    # The top bit picks the sign, so colliding n-grams cancel out instead of piling up
+    signs = np.where(hashes >> 31, 1.0, -1.0)
+    vector = np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ExampleIndex:
+    """Labelled examples searchable by n-gram similarity, for dynamic few-shot prompts.
+
+    A snapshot saved by `save` is memory-mapped by `load`, so startup doesn't re-embed every
+    example; `add` appends to an in-memory tail (or relabels a text already present).
+    `replay` indexes append-only sources (datasets, the feedback log) and remembers how far into
+    each it got, so the next startup only reads what was appended since.
+    Examples with the same normalised text as the query are never returned, so a text isn't
+    shown its own answer (e.g. when evaluating on the data the index was built from).
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.texts: List[str] = []
+        self.labels: List[str] = []
+        self._rows: Dict[str, int] = {}  # normalised text -> row
+        self._base = np.zeros((0, dim), dtype=np.float32)  # memory-mapped snapshot rows
+        self._tail = np.zeros((64, dim), dtype=np.float32)  # rows added since, grown by doubling
+        self._tail_size = 0
+        # Per source, the replayed prefix: {"records": count, "digest": crc32 of those records}
+        self.sources: Dict[str, Dict[str, int]] = {}
+        self.changed = False  # since the last snapshot
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, text: str, label: str):
+        key = normalize_text(text)
+        if not key or not label:
+            return
+        row = self._rows.get(key)
+        self.changed = True
+        if row is not None:
+            # Newest label wins, so feedback corrections replace what was there
+            self.labels[row] = label
+            return
+        if self._tail_size == len(self._tail):
+            self._tail = np.concatenate([self._tail, np.zeros_like(self._tail)])
+        self._tail[self._tail_size] = embed(text, self.dim)
+        self._tail_size += 1
+        self._rows[key] = len(self.texts)
+        self.texts.append(text)
+        self.labels.append(label)
+
+    def add_many(self, examples: Iterable[Tuple[str, str]]):
+        for text, label in examples:
+            self.add(text, label)
+
+    def replay(self, source: str, rows: Iterable[Tuple[str, str]]) -> bool:
+        """Index the rows of `source` past the prefix indexed before. False, with nothing indexed,
+        when that prefix isn't what the source starts with any more (the file was rewritten).
+
+        Only replayed rows move the position: a feedback record added live is also in the shared
+        log, after rows other workers may have written, so it is replayed again (a no-op
+        relabel) rather than counted where it isn't."""
+        seen = self.sources.get(source, {"records": 0, "digest": 0})
+        rows = iter(rows)
+        records, digest = 0, 0
+        for text, label in itertools.islice(rows, seen["records"]):
+            records, digest = records + 1, _digest(text, label, digest)
+        if records != seen["records"] or digest != seen["digest"]:
+            return False
+        for text, label in rows:
+            self.add(text, label)
+            records, digest = records + 1, _digest(text, label, digest)
+        if records != seen["records"]:
+            self.sources[source] = {"records": records, "digest": digest}
+            self.changed = True
+        return True
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        return np.concatenate([self._base @ query, self._tail[:self._tail_size] @ query])
+
+    def search(self, text: str, k: int) -> List[Tuple[str, str, float]]:
+        """Up to k (text, label, similarity) examples, most similar first"""
+        if not self.texts or k <= 0:
+            return []
+        scores = self._scores(embed(text, self.dim))
+        own_row = self._rows.get(normalize_text(text))
+        if own_row is not None:
+            scores[own_row] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.texts[i], self.labels[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def search_many(self, texts: Sequence[str], k: int, limit: int) -> List[Tuple[str, str, float]]:
+        """The best of each text's top k, for a prompt shared by several texts; at most `limit`"""
+        best: Dict[int, Tuple[str, str, float]] = {}
+        for text in texts:
+            for example in self.search(text, k):
+                row = self._rows[normalize_text(example[0])]
+                if row not in best or best[row][2] < example[2]:
+                    best[row] = example
+        return sorted(best.values(), key=lambda example: -example[2])[:limit]
+
+    def save(self, directory: str):
+        """Write a snapshot `load` can memory-map and drop the one it replaces"""
+        os.makedirs(directory, exist_ok=True)
+        previous = _read_meta(directory)
+        snapshot = uuid.uuid4().hex[:12]
+        vectors_file, examples_file = f"vectors-{snapshot}.npy", f"examples-{snapshot}.jsonl"
+        with open(os.path.join(directory, vectors_file), "wb") as f:
+            np.save(f, np.concatenate([self._base, self._tail[:self._tail_size]]))
+        with open(os.path.join(directory, examples_file), "w", encoding="utf-8") as f:
+            for text, label in zip(self.texts, self.labels):
+                f.write(json.dumps({"text": text, "label": label}) + "\n")
+        meta = {"dim": self.dim, "count": len(self.texts), "sources": self.sources,
+                "vectors": vectors_file, "examples": examples_file}
+        with open(os.path.join(directory, META_FILE + ".tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(directory, META_FILE + ".tmp"), os.path.join(directory, META_FILE))
+        self.changed = False
+        if previous:
+            for name in (previous.get("vectors"), previous.get("examples")):
+                if name:
+                    # Processes that mapped the old vectors keep reading them until they exit
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+    @classmethod
+    def load(cls, directory: str, dim: int) -> Optional["ExampleIndex"]:
+        """The snapshot in `directory`, or None if there is none (or it was built with another dim)"""
+        meta = _read_meta(directory)
+        if meta is None:
+            return None
+        try:
+            vectors = np.load(os.path.join(directory, meta["vectors"]), mmap_mode="r")
+            with open(os.path.join(directory, meta["examples"]), "r", encoding="utf-8") as f:
+                examples = [json.loads(line) for line in f]
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"example index snapshot in {directory} is unreadable, rebuilding: {e}")
+            return None
+        if meta.get("dim") != dim or vectors.shape != (len(examples), dim) or meta.get("count") != len(examples):
+            log.warning(f"example index snapshot in {directory} doesn't match, rebuilding")
+            return None
+        index = cls(dim)
+        index._base = vectors
+        index.texts = [example["text"] for example in examples]
+        index.labels = [example["label"] for example in examples]
+        index._rows = {normalize_text(text): row for row, text in enumerate(index.texts)}
+        index.sources = meta.get("sources", {})
+        if not all(isinstance(position, dict) for position in index.sources.values()):
+            log.warning(f"example index snapshot in {directory} predates source digests, rebuilding")
+            return None
+        return index
+
+
+def _digest(text: str, label: str, digest: int) -> int:
+    return zlib.crc32(json.dumps([text, label]).encode("utf-8"), digest)
+
+
+def _read_meta(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_labelled_file(path: str) -> Iterator[Tuple[str, str]]:
+    """(text, label) rows of a JSONL or CSV dataset, in the evaluation dataset format"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if path.lower().endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if row.get("text") and row.get("label"):
+                yield row["text"], row["label"].strip().lower()
+
+
+def build_example_index(
+    directory: str,
+    dim: int,
+    seed_examples: Sequence[Tuple[str, str]],
+    datasets_dir: Optional[str],
+    feedback_records: Callable[[], Iterable[Dict]],
+) -> ExampleIndex:
+    """Load the snapshot in `directory` and index only what was appended to the sources since;
+    everything when there is no snapshot or a source no longer starts with what the snapshot
+    indexed. Saves a new snapshot when anything was added"""
+    sources: List[Tuple[str, Callable[[], Iterable[Tuple[str, str]]]]] = [("seed", lambda: seed_examples)]
+    if datasets_dir:
+        paths = glob.glob(os.path.join(datasets_dir, "*.jsonl")) + glob.glob(os.path.join(datasets_dir, "*.csv"))
+        sources += [(f"dataset:{os.path.basename(path)}", lambda path=path: read_labelled_file(path)) for path in sorted(paths)]
+    sources.append(("feedback", lambda: ((record.get("text", ""), record.get("correct", "")) for record in feedback_records())))
+
+    index = ExampleIndex.load(directory, dim)
+    if index is not None and not all(index.replay(source, rows()) for source, rows in sources):
+        log.warning(f"example index snapshot in {directory} doesn't match its sources, rebuilding")
+        index = None
+    if index is None:
+        index = ExampleIndex(dim)
+        for source, rows in sources:
+            index.replay(source, rows())
+
+    if index.changed:
+        index.save(directory)
+    log.info(f"example index ready with {len(index)} examples")
+    return index
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from app.services.prefilter import HeuristicPreClassifier
+
+_BATCH_COUNT_RE = re.compile(r"Respond with exactly (\d+) lines")
+_NUMBERED_RE = re.compile(r"^(\d+)\. (.*)$", re.MULTILINE)
+_SCORES_LABELS_RE = re.compile(r"each of these categories: (.+?)\.\n")
+_TEXT_MARKERS = ("Text to classify:", "Text:")
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure; carries a status code so the LLM client treats it like a real 5xx"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"fake provider error {status_code}")
+        self.status_code = status_code
+
+
+class FakeChatModel(BaseChatModel):
+    """Local stand-in for the provider, for load tests and offline runs.
+
+    Latency is log-normal around `latency_ms` (`latency_sigma=0` makes it constant) and a
+    fraction `error_rate` of calls fail with `error_status`. Labels come from the heuristic
+    rules; numbered batch prompts get one "N. label" line per text and score prompts a JSON object.
+    """
+
+    latency_ms: float = 300.0
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr()
+    _rules: HeuristicPreClassifier = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+        self._rules = HeuristicPreClassifier()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-classifier"
+
+    def _latency_s(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        # Median at latency_ms with a long right tail, like real provider latencies
+        return self.latency_ms * self._rng.lognormvariate(0, self.latency_sigma) / 1000
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        if self._rng.random() < self.error_rate:
+            raise FakeProviderError(self.error_status)
+        prompt = messages[-1].content
+        request, _, _ = prompt.rpartition("Respond with")
+        count = _BATCH_COUNT_RE.search(prompt)
+        if count:
+            # The texts are the last `count` numbered lines; few-shot examples come before them
+            texts = [text for _, text in _NUMBERED_RE.findall(request)][-int(count.group(1)):]
+            content = "\n".join(f"{i}. {self._rules.best_guess(text)}" for i, text in enumerate(texts, start=1))
+        else:
+            text = request
+            for marker in _TEXT_MARKERS:
+                if marker in request:
+                    text = request.rsplit(marker, 1)[1]
+                    break
+            score_labels = _SCORES_LABELS_RE.search(prompt)
+            if score_labels:
+                rule_scores = self._rules.score(text)
+                scores = {label.strip(): rule_scores.get(label.strip(), 0.0) for label in score_labels.group(1).split(",")}
+                scores["safe"] = round(1 - max(rule_scores.values()), 4)
+                content = json.dumps(scores)
+            else:
+                content = self._rules.best_guess(text)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._latency_s())
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._latency_s())
+        return self._respond(messages)
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import random
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.telemetry.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# HTTP statuses worth retrying: rate limiting and transient provider failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+# google.api_core exception names, for errors that don't carry a status code
+RETRYABLE_NAMES = {
+    "ResourceExhausted": 429,
+    "TooManyRequests": 429,
+    "ServiceUnavailable": 503,
+    "InternalServerError": 500,
+    "DeadlineExceeded": 504,
+    "GatewayTimeout": 504,
+    "TimeoutError": 408,
+}
+
+
+class LLMUnavailableError(Exception):
+    """The provider kept failing (or throttling) until the retry budget or deadline ran out"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """Best-effort HTTP status for a provider error"""
+    for attr in ("status_code", "code"):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int) and 100 <= status < 600:
+            return status
+    for cls in type(exc).__mro__:
+        if cls.__name__ in RETRYABLE_NAMES:
+            return RETRYABLE_NAMES[cls.__name__]
+    cause = exc.__cause__ or exc.__context__
+    return error_status(cause) if cause is not None else None
+
+
+class TokenBucket:
+    """Request-rate limiter; `rate` can be changed on the fly by the AIMD controller"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class LLMClient:
+    """Shared access to a chat model: bounded in-flight calls, a token-bucket limiter whose rate
+    backs off multiplicatively on 429/5xx and recovers additively, and jittered exponential
+    retries inside a per-request deadline."""
+
+    def __init__(
+        self,
+        llm,
+        max_in_flight: int = 32,
+        rate_per_s: float = 50.0,
+        min_rate_per_s: float = 1.0,
+        max_retries: int = 3,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        deadline_s: float = 30.0,
+    ):
+        self.llm = llm
+        self.max_rate = rate_per_s
+        self.min_rate = min(min_rate_per_s, rate_per_s)
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.deadline_s = deadline_s
+        self.bucket = TokenBucket(rate_per_s, capacity=max(1.0, rate_per_s))
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+        # Called with (stage, duration_ms, prompt_type, outcome) for "llm_queue" (rate limiter and
+        # in-flight slot), "llm" (the provider call alone) and "llm_backoff" (sleeps between retries)
+        self.on_stage: Optional[Callable[[str, float, str, str], None]] = None
+
+    async def ainvoke(self, messages: Any, deadline_s: Optional[float] = None, prompt_type: str = "") -> Any:
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+        attempt = 0
+        while True:
+            self.stats["calls"] += 1
+            try:
+                return await self._attempt(messages, deadline, prompt_type)
+            except Exception as e:
+                status = 408 if isinstance(e, asyncio.TimeoutError) else error_status(e)
+                if status not in RETRYABLE_STATUS:
+                    raise
+                if status in THROTTLE_STATUS:
+                    self._decrease_rate()
+
+                remaining = deadline - time.monotonic()
+                backoff = self._backoff(attempt)
+                if attempt >= self.max_retries or backoff >= remaining:
+                    self.stats["failures"] += 1
+                    raise LLMUnavailableError(
+                        f"LLM provider unavailable after {attempt + 1} attempts (last status {status}): {e}",
+                        retry_after=max(1.0, math.ceil(backoff)),
+                    ) from e
+
+                attempt += 1
+                self.stats["retries"] += 1
+                log.warning(f"LLM call failed with status {status}, retry {attempt} in {backoff:.2f}s")
+                backoff_start = time.perf_counter()
+                await asyncio.sleep(backoff)
+                self._record_stage("llm_backoff", backoff_start, prompt_type)
+
+    async def _attempt(self, messages: Any, deadline: float, prompt_type: str) -> Any:
+        async def call():
+            queued = time.perf_counter()
+            await self.bucket.acquire()
+            async with self._semaphore:
+                self._record_stage("llm_queue", queued, prompt_type)
+                self.in_flight += 1
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    response = await self.llm.ainvoke(messages)
+                    outcome = "ok"
+                    return response
+                except asyncio.CancelledError:
+                    # A hedge that lost the race, or the deadline ran out
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    self.in_flight -= 1
+                    self._record_stage("llm", started, prompt_type, outcome)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        response = await asyncio.wait_for(call(), timeout=remaining)
+        self._increase_rate()
+        return response
+
+    def _record_stage(self, stage: str, start: float, prompt_type: str, outcome: str = "ok"):
+        if self.on_stage is not None:
+            self.on_stage(stage, (time.perf_counter() - start) * 1000, prompt_type, outcome)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    def _decrease_rate(self):
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        self.stats["throttled"] += 1
+
+    def _increase_rate(self):
+        if self.bucket.rate < self.max_rate:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 100)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rate_limit_per_s": round(self.bucket.rate, 2),
+        }
@@ -0,0 +1,119 @@
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.services.cache import normalize_text
+
+FINGERPRINT_BITS = 64
+
+# What spam campaigns vary between copies: links, amounts and emoji/punctuation
+_URL_RE = re.compile(r"(https?://|www\.)\S+|\b[\w-]+\.(com|net|org|biz|info|xyz|ru|top|io)\b\S*")
+_NUMBER_RE = re.compile(r"\b\d[\d,.]*")
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def shingles(text: str) -> List[str]:
+    """Words and word pairs of the text with URLs and numbers replaced by placeholders"""
+    text = _URL_RE.sub(" _url_ ", normalize_text(text))
+    words = _TOKEN_RE.findall(_NUMBER_RE.sub(" _num_ ", text))
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def simhash(features: List[str]) -> int:
+    """64-bit SimHash: similar feature sets give fingerprints a few bits apart"""
+    digests = b"".join(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest() for feature in features)
+    # One row of 64 bits per feature; a fingerprint bit is set where most features have it set
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, FINGERPRINT_BITS)
+    return int.from_bytes(np.packbits(bits.sum(axis=0) * 2 > len(features)).tobytes(), "big")
+
+
+class NearDuplicateIndex:
+    """Labels of already-classified texts, found again for copies within `max_distance` bits
+    (Hamming distance between SimHash fingerprints).
+
+    Fingerprints are split into max_distance + 1 bands; two fingerprints that close must agree
+    exactly on at least one band, so a lookup only compares against texts sharing a band.
+    Holds at most `max_size` fingerprints and evicts the least recently used.
+    """
+
+    def __init__(self, max_distance: int = 3, max_size: int = 100000, min_words: int = 5):
+        self.max_distance = max_distance
+        self.max_size = max_size
+        self.min_words = min_words
+        self._bands = max_distance + 1
+        self._band_bits = -(-FINGERPRINT_BITS // self._bands)
+        # (namespace, fingerprint) -> label, in LRU order
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        # namespace -> band key -> fingerprint, or a list of them once several share the band;
+        # most buckets hold one, and a bare int costs a fraction of a list
+        self._tables: Dict[str, Dict[int, Union[int, List[int]]]] = {}
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """None for texts too short to fingerprint reliably"""
+        features = shingles(text)
+        words = (len(features) + 1) // 2
+        if words < self.min_words:
+            return None
+        return simhash(features)
+
+    def _band_keys(self, fingerprint: int) -> Iterator[int]:
+        mask = (1 << self._band_bits) - 1
+        for band in range(self._bands):
+            yield band << self._band_bits | fingerprint >> (band * self._band_bits) & mask
+
+    def lookup(self, text: str, namespace: str = "") -> Optional[Tuple[str, int]]:
+        """(label, distance) of the closest indexed text in `namespace`, if within max_distance"""
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return None
+        table = self._tables.get(namespace, {})
+        best: Optional[Tuple[int, int]] = None
+        for key in self._band_keys(fingerprint):
+            bucket = table.get(key, ())
+            for candidate in (bucket,) if isinstance(bucket, int) else bucket:
+                distance = (candidate ^ fingerprint).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        if best is None:
+            return None
+        entry = (namespace, best[1])
+        self._entries.move_to_end(entry)
+        return self._entries[entry], best[0]
+
+    def add(self, text: str, label: str, namespace: str = ""):
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return
+        entry = (namespace, fingerprint)
+        if entry not in self._entries:
+            table = self._tables.setdefault(namespace, {})
+            for key in self._band_keys(fingerprint):
+                bucket = table.get(key)
+                if bucket is None:
+                    table[key] = fingerprint
+                elif isinstance(bucket, int):
+                    table[key] = [bucket, fingerprint]
+                else:
+                    bucket.append(fingerprint)
+        self._entries[entry] = label
+        self._entries.move_to_end(entry)
+        while len(self._entries) > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        (namespace, fingerprint), _ = self._entries.popitem(last=False)
+        table = self._tables[namespace]
+        for key in self._band_keys(fingerprint):
+            bucket = table[key]
+            if isinstance(bucket, int):
+                del table[key]
+                continue
+            bucket.remove(fingerprint)
+            if len(bucket) == 1:
+                table[key] = bucket[0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,62 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# (pattern, weight) per label. Weights are combined noisy-OR style, so several signals add up.
+# Every weight stays below the default threshold (0.9): a phrase like "should die" or "click here"
+# also turns up in harmless text, so answering without the LLM takes two independent signals.
+
+SPAM_RULES: List[Tuple[str, float]] = [
+    (r"(https?://|www\.)\S+|\b[\w-]+\.(com|net|org|biz|info|xyz|ru|top|io)\b", 0.3),
+    (r"\bclick (here|now|this link|below)\b", 0.5),
+    (r"\b(buy|order|act|call|sign up|subscribe|apply)\b.{0,20}\bnow\b", 0.4),
+    (r"\b(viagra|cialis|cheap pills|diet pills|no prescription|casino|free iphone|free money|crypto giveaway)\b", 0.6),
+    (r"\b(make|earn)\s+\$+\s?\d*|\$\s?\d[\d,]*\s*/\s*(hour|hr|day|week|month)\b", 0.6),
+    (r"\b(limited (time )?offer|act fast|risk[- ]free|100% free|no experience needed)\b", 0.5),
+    (r"\b(urgent|winner|congratulations|free|cheap)\b", 0.25),
+    (r"!{3,}", 0.2),
+]
+
+TOXIC_RULES: List[Tuple[str, float]] = [
+    (r"\b(kill (yo)?urself|kys|go die|should die|die in a fire|hope you (die|get cancer))\b", 0.8),
+    (r"\b(idiot|moron|stupid|worthless|loser|trash|scum|retard\w*)\b", 0.55),
+    (r"\bf[\*u]ck|\bsh[\*i]t\b|\bb[\*i]tch\b|\bc[\*u]nt\b|\basshole\b", 0.5),
+    (r"\bpiece of (sh[\*i]t|crap|garbage)\b|\bnobody likes you\b", 0.5),
+]
+
+
+class HeuristicPreClassifier:
+    """Keyword/regex/URL rules that label only the obvious cases and leave the rest to the LLM"""
+
+    def __init__(self, threshold: float = 0.9, max_other_score: float = 0.5):
+        self.threshold = threshold
+        self.max_other_score = max_other_score
+        self.rules = {
+            "spam": [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in SPAM_RULES],
+            "toxic": [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in TOXIC_RULES],
+        }
+
+    def score(self, text: str) -> Dict[str, float]:
+        scores = {}
+        for label, rules in self.rules.items():
+            miss = 1.0
+            for pattern, weight in rules:
+                if pattern.search(text):
+                    miss *= 1 - weight
+            scores[label] = round(1 - miss, 4)
+        return scores
+
+    def best_guess(self, text: str) -> str:
+        """Highest-scoring label, or safe when no rule is reasonably sure; used when the LLM is unavailable"""
+        scores = self.score(text)
+        label = max(scores, key=scores.get)
+        return label if scores[label] >= self.max_other_score else "safe"
+
+    def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        """Return (label, confidence) when one label clearly wins, otherwise None"""
+        scores = self.score(text)
+        label = max(scores, key=scores.get)
+        confidence = scores[label]
+        others = [score for other, score in scores.items() if other != label]
+        if confidence >= self.threshold and all(score < self.max_other_score for score in others):
+            return label, confidence
+        return None
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from app.services.llm_client import RETRYABLE_STATUS, LLMUnavailableError, error_status
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """Errors that say something about provider health (not e.g. a rejected prompt)"""
+    if isinstance(exc, (LLMUnavailableError, asyncio.TimeoutError)):
+        return True
+    status = error_status(exc)
+    return status is None or status in RETRYABLE_STATUS
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 500, recompute_every: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._recompute_every = recompute_every
+        self._since_recompute = 0
+        self._percentiles: Dict[float, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_recompute += 1
+        if self._since_recompute >= self._recompute_every:
+            self._percentiles.clear()
+            self._since_recompute = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        if p not in self._percentiles:
+            ordered = sorted(self._samples)
+            self._percentiles[p] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+        return self._percentiles[p]
+
+
+class CircuitBreaker:
+    """Opens when the failure rate over the last `window` calls passes the threshold; after
+    `open_seconds` a single probe call is let through and its outcome closes or re-opens it."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: float = 0.5, window: int = 50, min_calls: int = 20, open_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def retry_after(self) -> float:
+        return max(1.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record(self, success: bool):
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if success:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_calls and self.failure_rate() >= self.failure_threshold:
+            self._open()
+
+    def abandon(self):
+        """A call that was let through got cancelled before it could report an outcome"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failure_rate": round(self.failure_rate(), 4)}
+
+
+async def hedged(call: Callable[[], Awaitable[Any]], delay: Optional[float]) -> Tuple[Any, bool]:
+    """Run call(); if it hasn't finished after `delay` seconds start a second one and return
+    whichever succeeds first. Returns (result, hedge_fired)."""
+    primary = asyncio.ensure_future(call())
+    if delay is None:
+        return await primary, False
+
+    pending = {primary}
+    error: Optional[BaseException] = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result(), False
+
+        pending.add(asyncio.ensure_future(call()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
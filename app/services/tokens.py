@@ -0,0 +1,18 @@
+from typing import Any, Sequence, Tuple
+
+# Rough English average; only used when the provider doesn't report usage
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def token_usage(messages: Sequence[Any], response: Any) -> Tuple[int, int]:
+    """(input_tokens, output_tokens) of one call: the provider's usage_metadata when it sends
+    it, otherwise an estimate from the rendered prompt and the answer"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    prompt = "".join(str(getattr(message, "content", message)) for message in messages)
+    return estimate_tokens(prompt), estimate_tokens(str(getattr(response, "content", "")))
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app.telemetry.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+class TelemetryAggregator(ABC):
+    """Where workers publish their telemetry snapshots so any of them can report the total.
+
+    `publish` stores this worker's latest snapshot, `collect` returns the snapshots of the
+    other live workers. Implementations only move opaque JSON-safe dicts; merging is done by
+    TelemetryService, so a new backend (shared memory, Redis, ...) only has to store them.
+    """
+
+    @abstractmethod
+    def publish(self, snapshot: Dict):
+        ...
+
+    @abstractmethod
+    def collect(self) -> List[Dict]:
+        ...
+
+    def prune(self):
+        """Forget snapshots left behind by an earlier run"""
+
+    def close(self):
+        pass
+
+
+class SQLiteAggregator(TelemetryAggregator):
+    """Snapshot-per-worker table in a local SQLite file, for several workers on one host.
+
+    Workers of one run form a group and are summed; rows from other groups are earlier runs and
+    are deleted on startup. The group is the run id the launcher hands its workers, and a worker
+    that exits keeps its row, so recycled workers don't make counters go backwards.
+
+    Without a run id the group is the parent pid, which a stable parent (a shell, systemd, PID 1)
+    keeps across restarts. `stale_after_s` then tells earlier runs apart: rows not updated for
+    that long belong to processes that are gone (live ones publish every few seconds) and are
+    deleted on startup as well.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        group: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        stale_after_s: Optional[float] = None,
+    ):
+        self.path = path
+        self.group = group or str(os.getppid())
+        self.worker_id = worker_id or f"{os.getpid()}-{int(time.time() * 1000)}"
+        self.stale_after_s = stale_after_s
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS telemetry_snapshots "
+            "(worker_id TEXT PRIMARY KEY, worker_group TEXT, updated_at REAL, data TEXT)"
+        )
+        self._db.commit()
+
+    def publish(self, snapshot: Dict):
+        data = json.dumps(snapshot)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO telemetry_snapshots (worker_id, worker_group, updated_at, data) VALUES (?, ?, ?, ?)",
+                (self.worker_id, self.group, time.time(), data),
+            )
+            self._db.commit()
+
+    def collect(self) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM telemetry_snapshots WHERE worker_group = ? AND worker_id != ?",
+                (self.group, self.worker_id),
+            ).fetchall()
+        snapshots = []
+        for (data,) in rows:
+            try:
+                snapshots.append(json.loads(data))
+            except json.JSONDecodeError as e:
+                log.warning(f"skipping unreadable telemetry snapshot: {e}")
+        return snapshots
+
+    def prune(self):
+        stale_before = time.time() - self.stale_after_s if self.stale_after_s is not None else 0
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM telemetry_snapshots WHERE worker_group != ? OR updated_at < ?", (self.group, stale_before)
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,39 +1,101 @@
 import os
+import atexit
 import logging
-from datetime import datetime
+import logging.handlers
+import queue
+import random
+from typing import List, Optional
 import structlog
+from app import config
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; drops them rather than block when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SuccessSampler:
+    """structlog processor keeping only `rate` of the events logged with sampled=True
+    (per-request success logs); everything else always goes through"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def __call__(self, logger, method_name: str, event_dict: dict) -> dict:
+        if event_dict.pop("sampled", False) and random.random() >= self.rate:
+            raise structlog.DropEvent
+        return event_dict
+
+
+def rotating_file_handler(path: str, rotation: str = "size", max_bytes: int = 10 * 1024 * 1024,
+                          when: str = "midnight", backup_count: int = 5) -> logging.Handler:
+    # delay=True: the file is only created once something is logged
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count, delay=True)
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+
+def start_queue_logging(handlers: List[logging.Handler], queue_size: int):
+    """Queue handler for the caller side plus the listener thread that feeds `handlers`"""
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return NonBlockingQueueHandler(log_queue), listener
+
 
 class CustomLogger:
-    def __init__(self, log_dir="logs"):
-        # Ensure logs directory exists
+    def __init__(self, log_dir=config.LOG_DIR):
         self.logs_dir = os.path.join(os.getcwd(), log_dir)
-        os.makedirs(self.logs_dir, exist_ok=True)
-
-        # Timestamped log file (for persistence)
-        log_file = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-        self.log_file_path = os.path.join(self.logs_dir, log_file)
+        self.log_file_path = os.path.join(self.logs_dir, "app.log")
 
     def get_logger(self, name=__file__):
         logger_name = os.path.basename(name)
+        self._configure()
+        return structlog.get_logger(logger_name)
 
-        # Configure logging for console + file (both JSON)
-        file_handler = logging.FileHandler(self.log_file_path)
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(logging.Formatter("%(message)s"))  # Raw JSON lines
+    def _configure(self):
+        # Every module creates a CustomLogger at import; only the first one sets up handlers
+        global _listener
+        if _listener is not None:
+            return
 
+        # Console + rotating file (both JSON), written by a background thread so request
+        # handlers only pay for a queue put
+        os.makedirs(self.logs_dir, exist_ok=True)
+        file_handler = rotating_file_handler(
+            self.log_file_path,
+            rotation=config.LOG_ROTATION,
+            max_bytes=config.LOG_MAX_BYTES,
+            when=config.LOG_ROTATE_WHEN,
+            backup_count=config.LOG_BACKUP_COUNT,
+        )
         console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(logging.Formatter("%(message)s"))  # Structlog renders the JSON
+        queue_handler, _listener = start_queue_logging([console_handler, file_handler], config.LOG_QUEUE_SIZE)
+        atexit.register(_listener.stop)
 
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(message)s",  # Structlog will handle JSON rendering
-            handlers=[console_handler, file_handler]
-        )
+        root = logging.getLogger()
+        root.setLevel(config.LOG_LEVEL)
+        root.addHandler(queue_handler)
 
-        # Configure structlog for JSON structured logging
+        # Configure structlog for JSON structured logging; sampled-out events are dropped
+        # before any rendering work is done
         structlog.configure(
             processors=[
+                SuccessSampler(config.LOG_SUCCESS_SAMPLE_RATE),
+                structlog.stdlib.filter_by_level,
                 structlog.processors.TimeStamper(fmt="iso", utc=True, key="timestamp"),
                 structlog.processors.add_log_level,
                 structlog.processors.EventRenamer(to="event"),
@@ -43,11 +105,9 @@ class CustomLogger:
             cache_logger_on_first_use=True,
         )
 
-        return structlog.get_logger(logger_name)
-
 
 # # --- Usage Example ---
 # if __name__ == "__main__":
 #     logger = CustomLogger().get_logger(__file__)
 #     logger.info("User uploaded a file", user_id=123, filename="report.pdf")
-#     logger.error("Failed to process PDF", error="File not found", user_id=123)
\ No newline at end of file
+#     logger.error("Failed to process PDF", error="File not found", user_id=123)
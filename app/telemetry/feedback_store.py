@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.telemetry.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+_STOP = object()
+
+
+class FeedbackStore:
+    """Append-only JSONL feedback log.
+
+    Inside the API, `append` only enqueues the record; a background task writes queued records
+    in batches and fsyncs at most every `fsync_interval_s`, so a submission costs O(1) on the
+    event loop. Without a running writer (scripts, Streamlit) records are written synchronously.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        legacy_json_path: Optional[str] = None,
+        batch_size: int = 256,
+        fsync_interval_s: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self.batch_size = batch_size
+        self.fsync_interval_s = fsync_interval_s
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._file = None
+        self._last_fsync = 0.0
+        self._unsynced = False
+        self._lock = threading.Lock()
+        # Called as on_write(duration_ms, ok) after every write, for I/O timing metrics
+        self.on_write: Optional[Callable[[float, bool], None]] = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._migrate_legacy()
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _migrate_legacy(self):
+        # One-time import of the old whole-file JSON array into the JSONL log
+        if not self.legacy_json_path or os.path.exists(self.path) or not os.path.exists(self.legacy_json_path):
+            return
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            log.warning(f"could not migrate legacy feedback file {self.legacy_json_path}: {e}")
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        log.info(f"migrated {len(records)} feedback records to {self.path}")
+
+    def _write(self, records: List[Dict], force_fsync: bool = False):
+        with self._lock:
+            self._open()
+            self._file.write("".join(json.dumps(record) + "\n" for record in records))
+            self._file.flush()
+            self._unsynced = True
+            if force_fsync or time.monotonic() - self._last_fsync >= self.fsync_interval_s:
+                self._fsync_locked()
+
+    def _fsync(self):
+        with self._lock:
+            self._fsync_locked()
+
+    def _fsync_locked(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._last_fsync = time.monotonic()
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._writer = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._writer is None:
+            return
+        await self._queue.put(_STOP)
+        await self._writer
+        self._writer = None
+        self._queue = None
+        await asyncio.to_thread(self.close)
+
+    def append(self, record: Dict):
+        if self._writer is not None and not self._writer.done() and self._running_here():
+            try:
+                self._queue.put_nowait(record)
+                return
+            except asyncio.QueueFull:
+                log.warning("feedback queue full, writing synchronously")
+        start = time.perf_counter()
+        try:
+            self._write([record], force_fsync=True)
+        except Exception:
+            self._report_write(start, False)
+            raise
+        self._report_write(start, True)
+
+    def _report_write(self, start: float, ok: bool):
+        if self.on_write is not None:
+            self.on_write((time.perf_counter() - start) * 1000, ok)
+
+    def _running_here(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.fsync_interval_s)
+            except asyncio.TimeoutError:
+                # Quiet period: make sure the tail of the last batch reaches the disk
+                if self._unsynced:
+                    await asyncio.to_thread(self._fsync)
+                continue
+            batch = []
+            item = first
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if batch or stopping:
+                start = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self._write, batch, stopping)
+                    self._report_write(start, True)
+                except Exception as e:
+                    self._report_write(start, False)
+                    log.error(f"failed to write {len(batch)} feedback records: {e}")
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Stored records in write order; a torn last line from a crash is skipped"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._fsync_locked()
+                self._file.close()
+                self._file = None
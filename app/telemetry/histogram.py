@@ -0,0 +1,118 @@
+import base64
+import math
+import zlib
+from array import array
+from typing import Any, Dict, Optional
+
+
+class LatencyHistogram:
+    """Fixed-memory streaming histogram with relative-error quantiles (DDSketch-style).
+
+    Values land in logarithmic buckets whose width is a fixed fraction of the value, so any
+    quantile is reported within `relative_accuracy` of the true value while memory stays at
+    one counter per bucket no matter how many samples are recorded. Histograms with the same
+    parameters can be merged by adding counters, which is what makes per-worker aggregation cheap.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1.0, max_value: float = 3_600_000.0):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._offset = math.floor(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 1
+        self._buckets = array("Q", bytes(8 * size))
+        self.zero_count = 0  # values below min_value (e.g. 0 ms cache hits)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        index = math.ceil(math.log(min(value, self.max_value)) / self._log_gamma) - self._offset
+        return min(max(index, 0), len(self._buckets) - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        # Midpoint (in relative terms) of the bucket's (gamma^(i-1), gamma^i] range
+        return 2 * self._gamma ** (index + self._offset) / (self._gamma + 1)
+
+    def record(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if value < self.min_value:
+            self.zero_count += 1
+        else:
+            self._buckets[self._index(value)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index, bucket_count in enumerate(self._buckets):
+            seen += bucket_count
+            if bucket_count and rank < seen:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def count_at_most(self, bound: float) -> int:
+        """Approximate number of recorded values <= bound (for cumulative bucket exports)"""
+        if bound < self.min_value:
+            return self.zero_count
+        last = self._index(bound)
+        return self.zero_count + sum(self._buckets[:last + 1])
+
+    def merge(self, other: "LatencyHistogram"):
+        if len(other._buckets) != len(self._buckets) or other._gamma != self._gamma:
+            raise ValueError("can only merge histograms with the same parameters")
+        for index, bucket_count in enumerate(other._buckets):
+            if bucket_count:
+                self._buckets[index] += bucket_count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe form for sharing between processes; mostly-empty buckets compress to little"""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "max_value": self.max_value,
+            "buckets": base64.b64encode(zlib.compress(self._buckets.tobytes(), 1)).decode("ascii"),
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(data["relative_accuracy"], data["min_value"], data["max_value"])
+        buckets = array("Q")
+        buckets.frombytes(zlib.decompress(base64.b64decode(data["buckets"])))
+        if len(buckets) != len(histogram._buckets):
+            raise ValueError("bucket layout does not match the histogram parameters")
+        histogram._buckets = buckets
+        histogram.zero_count = data["zero_count"]
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.max = data["max"]
+        return histogram
+
+    def summary(self) -> Dict[str, float]:
+        def rounded(value: Optional[float]) -> float:
+            return round(value, 2) if value is not None else 0
+
+        return {
+            "count": self.count,
+            "avg_ms": rounded(self.sum / self.count) if self.count else 0,
+            "p50_ms": rounded(self.quantile(0.50)),
+            "p95_ms": rounded(self.quantile(0.95)),
+            "p99_ms": rounded(self.quantile(0.99)),
+            "max_ms": rounded(self.max),
+        }
@@ -0,0 +1,69 @@
+from typing import Dict, Iterable, List, Tuple, Union
+
+from app.telemetry.histogram import LatencyHistogram
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Upper bounds in seconds, from sub-millisecond local stages up to slow provider calls
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Dict[str, str]
+# One unlabelled value, or (labels, value) pairs: one family whose samples differ by label
+Samples = Union[float, Iterable[Tuple[Labels, float]]]
+
+
+def as_samples(value: Samples) -> Iterable[Tuple[Labels, float]]:
+    return [({}, value)] if isinstance(value, (int, float)) else value
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class OpenMetricsWriter:
+    """Builds an OpenMetrics text exposition, one metric family at a time"""
+
+    def __init__(self, prefix: str = "textclf"):
+        self.prefix = prefix
+        self._lines: List[str] = []
+
+    def _family(self, name: str, kind: str, help_text: str) -> str:
+        name = f"{self.prefix}_{name}"
+        self._lines.append(f"# TYPE {name} {kind}")
+        self._lines.append(f"# HELP {name} {help_text}")
+        return name
+
+    def counter(self, name: str, help_text: str, samples: Iterable[Tuple[Labels, float]]):
+        name = self._family(name, "counter", help_text)
+        for labels, value in samples:
+            self._lines.append(f"{name}_total{_labels(labels)} {_number(value)}")
+
+    def gauge(self, name: str, help_text: str, samples: Iterable[Tuple[Labels, float]]):
+        name = self._family(name, "gauge", help_text)
+        for labels, value in samples:
+            self._lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, samples: Iterable[Tuple[Labels, LatencyHistogram]]):
+        """Millisecond histograms exported in seconds; bucket counts are accurate to the
+        histogram's relative accuracy around each bound"""
+        name = self._family(name, "histogram", help_text)
+        for labels, histogram in samples:
+            for bound in SECONDS_BUCKETS:
+                count = histogram.count_at_most(bound * 1000)
+                self._lines.append(f"{name}_bucket{_labels({**labels, 'le': repr(bound)})} {count}")
+            self._lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            self._lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            self._lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum / 1000)}")
+
+    def render(self) -> str:
+        return "\n".join(self._lines + ["# EOF"]) + "\n"
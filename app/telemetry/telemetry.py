@@ -1,65 +1,384 @@
-import json
-import os
-from typing import Dict
+import asyncio
+import copy
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 from datetime import datetime
+from app import config
+from app.telemetry.aggregation import SQLiteAggregator, TelemetryAggregator
+from app.telemetry.custom_logger import CustomLogger
+from app.telemetry.feedback_store import FeedbackStore
+from app.telemetry.histogram import LatencyHistogram
+from app.telemetry.openmetrics import OpenMetricsWriter, Samples, as_samples
+
+log = CustomLogger().get_logger(__name__)
+
+# Tokens/sec is averaged over this many seconds
+TOKEN_RATE_WINDOW_S = 60
+
+
+def _histogram(histograms: Dict[Any, LatencyHistogram], key: Any, min_value: float = 1.0) -> LatencyHistogram:
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = LatencyHistogram(min_value=min_value)
+    return histogram
+
+
+def _add_counts(into: Dict, other: Dict):
+    for key, value in other.items():
+        if isinstance(value, dict):
+            _add_counts(into.setdefault(key, {}), value)
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class TelemetryState:
+    """Counters and histograms of one worker, or of several merged together"""
 
-class TelemetryService:
     def __init__(self):
         self.metrics = {
             "total_requests": 0,
             "class_distribution": {"toxic": 0, "spam": 0, "safe": 0},
             "feedback_counts": {"positive": 0, "negative": 0},
-            "latencies": []
+            "cache": {"hits": 0, "misses": 0},
+            "near_duplicate": {"hits": 0, "misses": 0},
+            "prefilter": {"hits": 0, "misses": 0},
+            "coalesced_requests": 0,
+            "resilience": {"hedged_requests": 0, "degraded_responses": 0},
+            "routing": {},  # cascade route -> reason -> count
+            "tokens": {},   # prompt type -> {"input": n, "output": n}
+            # prompt type -> epoch second (str) -> tokens, for the last TOKEN_RATE_WINDOW_S;
+            # wall-clock seconds so other workers' snapshots line up
+            "token_window": {},
+            "budget": {"downgraded": 0, "shed": 0},
+            "chunking": {"chunked_texts": 0, "chunks": 0, "rejected": 0},
+        }
+        # Fixed-size histograms instead of a list of every latency seen
+        self.latency = LatencyHistogram()
+        self.latency_by_prompt: Dict[str, LatencyHistogram] = {}
+        self.latency_by_class: Dict[str, LatencyHistogram] = {}
+        # (stage, prompt_type, outcome) -> histogram; stages can take microseconds, hence min_value
+        self.stage_latency: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self.workers = 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "metrics": copy.deepcopy(self.metrics),
+            "latency": self.latency.to_dict(),
+            "latency_by_prompt": {key: h.to_dict() for key, h in list(self.latency_by_prompt.items())},
+            "latency_by_class": {key: h.to_dict() for key, h in list(self.latency_by_class.items())},
+            "stage_latency": [[*key, h.to_dict()] for key, h in list(self.stage_latency.items())],
         }
-        self.feedback_data = []
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TelemetryState":
+        state = cls()
+        _add_counts(state.metrics, data["metrics"])
+        state.latency = LatencyHistogram.from_dict(data["latency"])
+        state.latency_by_prompt = {key: LatencyHistogram.from_dict(h) for key, h in data["latency_by_prompt"].items()}
+        state.latency_by_class = {key: LatencyHistogram.from_dict(h) for key, h in data["latency_by_class"].items()}
+        state.stage_latency = {(stage, prompt_type, outcome): LatencyHistogram.from_dict(h)
+                               for stage, prompt_type, outcome, h in data["stage_latency"]}
+        return state
+
+    def merge(self, other: "TelemetryState"):
+        _add_counts(self.metrics, other.metrics)
+        self.latency.merge(other.latency)
+        for mine, theirs in ((self.latency_by_prompt, other.latency_by_prompt),
+                             (self.latency_by_class, other.latency_by_class),
+                             (self.stage_latency, other.stage_latency)):
+            for key, histogram in list(theirs.items()):
+                _histogram(mine, key, histogram.min_value).merge(histogram)
+        self.workers += other.workers
+
+
+def build_aggregator() -> Optional[TelemetryAggregator]:
+    """Aggregation backend for config.TELEMETRY_BACKEND; None keeps telemetry process-local"""
+    if config.TELEMETRY_BACKEND == "sqlite":
+        if config.TELEMETRY_RUN_ID:
+            return SQLiteAggregator(config.TELEMETRY_DB, group=config.TELEMETRY_RUN_ID)
+        # No run id to group by: snapshots nobody has refreshed for a few intervals are from earlier runs
+        return SQLiteAggregator(config.TELEMETRY_DB, stale_after_s=max(5.0, 5 * config.TELEMETRY_PUBLISH_INTERVAL_S))
+    return None
+
+
+class TelemetryService:
+    def __init__(
+        self,
+        feedback_store: Optional[FeedbackStore] = None,
+        aggregator: Optional[TelemetryAggregator] = None,
+        publish_interval_s: float = config.TELEMETRY_PUBLISH_INTERVAL_S,
+        price_input_per_1m: float = config.LLM_PRICE_INPUT_PER_1M,
+        price_output_per_1m: float = config.LLM_PRICE_OUTPUT_PER_1M,
+    ):
+        self.state = TelemetryState()
+        self.metrics = self.state.metrics
+        self.feedback_store = feedback_store or FeedbackStore(
+            config.FEEDBACK_PATH,
+            legacy_json_path=config.FEEDBACK_LEGACY_JSON_PATH,
+            fsync_interval_s=config.FEEDBACK_FSYNC_INTERVAL_S,
+        )
+        self.feedback_store.on_write = self._record_feedback_write
+        # Called with every feedback record once it's queued for storage (e.g. to update an index)
+        self.on_feedback: Optional[Callable[[Dict], None]] = None
+        # Optional cross-worker backend: this worker publishes snapshots, readers merge everyone's
+        self.aggregator = aggregator
+        self.publish_interval_s = publish_interval_s
+        self._publisher: Optional[asyncio.Task] = None
+        self.price_input_per_1m = price_input_per_1m
+        self.price_output_per_1m = price_output_per_1m
+
+    async def start(self):
+        await self.feedback_store.start()
+        if self.aggregator is not None:
+            await asyncio.to_thread(self.aggregator.prune)
+            self._publisher = asyncio.ensure_future(self._publish_periodically())
+
+    async def stop(self):
+        if self._publisher is not None:
+            self._publisher.cancel()
+            await asyncio.gather(self._publisher, return_exceptions=True)
+            self._publisher = None
+            await self.publish()
+            await asyncio.to_thread(self.aggregator.close)
+        await self.feedback_store.stop()
+
+    async def publish(self):
+        # Serialised on the event loop so the state can't change mid-snapshot
+        snapshot = self.state.to_dict()
+        await asyncio.to_thread(self.aggregator.publish, snapshot)
+
+    async def _publish_periodically(self):
+        while True:
+            try:
+                await self.publish()
+            except Exception as e:
+                log.warning(f"failed to publish telemetry snapshot: {e}")
+            await asyncio.sleep(self.publish_interval_s)
+
+    async def collect_state(self) -> TelemetryState:
+        """This worker's live state plus the latest snapshots of the other workers"""
+        if self.aggregator is None:
+            return self.state
+        snapshots = await asyncio.to_thread(self.aggregator.collect)
+        merged = TelemetryState()
+        merged.workers = 0
+        merged.merge(self.state)
+        for snapshot in snapshots:
+            try:
+                merged.merge(TelemetryState.from_dict(snapshot))
+            except (KeyError, ValueError) as e:
+                log.warning(f"skipping incompatible telemetry snapshot: {e}")
+        return merged
     
-    def record_classification(self, classification: str, latency_ms: int):
+    def record_classification(self, classification: str, latency_ms: int, prompt_used: Optional[str] = None):
+        start = time.perf_counter()
         self.metrics["total_requests"] += 1
-        self.metrics["class_distribution"][classification] += 1
-        self.metrics["latencies"].append(latency_ms)
+        distribution = self.metrics["class_distribution"]
+        distribution[classification] = distribution.get(classification, 0) + 1
+
+        self.state.latency.record(latency_ms)
+        _histogram(self.state.latency_by_class, classification).record(latency_ms)
+        if prompt_used is not None:
+            _histogram(self.state.latency_by_prompt, prompt_used).record(latency_ms)
+        self.record_stage("telemetry", (time.perf_counter() - start) * 1000, prompt_used or "", "ok")
+
+    def record_stage(self, stage: str, duration_ms: float, prompt_type: str = "", outcome: str = "ok"):
+        _histogram(self.state.stage_latency, (stage, prompt_type, outcome), min_value=0.001).record(duration_ms)
+
+    @contextmanager
+    def time_stage(self, stage: str, prompt_type: str = "") -> Iterator[Dict[str, str]]:
+        """Times the block as `stage`; the outcome is "error" if it raises, or whatever the
+        block sets on the yielded dict (default "ok")"""
+        start = time.perf_counter()
+        labels = {"outcome": "ok"}
+        try:
+            yield labels
+        except BaseException:
+            labels["outcome"] = "error"
+            raise
+        finally:
+            self.record_stage(stage, (time.perf_counter() - start) * 1000, prompt_type, labels["outcome"])
+
+    def _record_feedback_write(self, duration_ms: float, ok: bool):
+        self.record_stage("feedback_io", duration_ms, "", "ok" if ok else "error")
     
+    def record_cache_lookup(self, hit: bool):
+        self.metrics["cache"]["hits" if hit else "misses"] += 1
+
+    def record_near_duplicate(self, hit: bool):
+        self.metrics["near_duplicate"]["hits" if hit else "misses"] += 1
+
+    def record_prefilter(self, hit: bool):
+        self.metrics["prefilter"]["hits" if hit else "misses"] += 1
+
+    def record_coalesced(self):
+        self.metrics["coalesced_requests"] += 1
+
+    def record_hedge(self):
+        self.metrics["resilience"]["hedged_requests"] += 1
+
+    def record_degraded(self):
+        self.metrics["resilience"]["degraded_responses"] += 1
+
+    def record_route(self, route: str, reason: str):
+        """Which prompt a cascade request ended on, and why"""
+        reasons = self.metrics["routing"].setdefault(route, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    def record_tokens(self, prompt_type: str, input_tokens: int, output_tokens: int):
+        spend = self.metrics["tokens"].setdefault(prompt_type, {"input": 0, "output": 0})
+        spend["input"] += input_tokens
+        spend["output"] += output_tokens
+
+        second = int(time.time())
+        window = self.metrics["token_window"].setdefault(prompt_type, {})
+        if str(second) not in window:
+            # Once per second: drop what has left the rate window
+            for key in [key for key in window if int(key) <= second - TOKEN_RATE_WINDOW_S]:
+                del window[key]
+            window[str(second)] = 0
+        window[str(second)] += input_tokens + output_tokens
+
+    def record_budget(self, action: str):
+        """A request moved to a cheaper prompt ("downgraded") or refused ("shed") by the token budget"""
+        self.metrics["budget"][action] += 1
+
+    def record_chunking(self, chunks: int = 0, rejected: bool = False):
+        """A long text classified as `chunks` chunks, or rejected as over the token limit"""
+        if rejected:
+            self.metrics["chunking"]["rejected"] += 1
+            return
+        self.metrics["chunking"]["chunked_texts"] += 1
+        self.metrics["chunking"]["chunks"] += chunks
+
     def record_feedback(self, text: str, predicted: str, correct: str):
+        start = time.perf_counter()
         feedback = {
             "text": text,
             "predicted": predicted,
             "correct": correct,
             "timestamp": datetime.now().isoformat()
         }
-        
-        self.feedback_data.append(feedback)
-        feedback_file = r"app\\data\\feedback_data.json"
-
-
-        # If file exists, load old data first
-        if os.path.exists(feedback_file):
-            with open(feedback_file, "r") as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = []
-        else:
-            existing_data = []
-
-        # Append new feedback
-        existing_data.append(feedback)
-        print("executed")
-        # Write back to file
-        with open(feedback_file, "w") as f:
-            json.dump(existing_data, f, indent=4)
-            
+
+        # Appended to the JSONL log by the store's background writer
+        self.feedback_store.append(feedback)
+        if self.on_feedback is not None:
+            self.on_feedback(feedback)
+
         # Update feedback counts
         if predicted == correct:
             self.metrics["feedback_counts"]["positive"] += 1
         else:
             self.metrics["feedback_counts"]["negative"] += 1
+        self.record_stage("telemetry", (time.perf_counter() - start) * 1000, "", "ok")
     
-    def get_metrics(self) -> Dict:
-        latencies = self.metrics["latencies"]
+    def get_metrics(self, state: Optional[TelemetryState] = None) -> Dict:
+        """Metrics of this worker, or of `state` (e.g. from collect_state) when given"""
+        state = state or self.state
+        metrics = state.metrics
         return {
-            "total_requests": self.metrics["total_requests"],
-            "class_distribution": self.metrics["class_distribution"],
-            "feedback_counts": self.metrics["feedback_counts"],
-            "latency": {
-                "avg_ms": sum(latencies) / len(latencies) if latencies else 0
+            "total_requests": metrics["total_requests"],
+            "class_distribution": metrics["class_distribution"],
+            "feedback_counts": metrics["feedback_counts"],
+            "cache": self._with_hit_rate(metrics["cache"]),
+            "near_duplicate": self._with_hit_rate(metrics["near_duplicate"]),
+            "prefilter": self._with_hit_rate(metrics["prefilter"]),
+            "coalesced_requests": metrics["coalesced_requests"],
+            "resilience": metrics["resilience"],
+            "routing": metrics["routing"],
+            "tokens": self._token_spend(metrics),
+            "llm_spend": {
+                "tokens_per_s": round(sum(self._tokens_per_s(window) for window in metrics["token_window"].values()), 2),
+                "cost_usd": round(sum(self._cost(spend) for spend in metrics["tokens"].values()), 6),
+            },
+            "budget": metrics["budget"],
+            "chunking": metrics["chunking"],
+            "latency": state.latency.summary(),
+            "latency_by_prompt": {key: h.summary() for key, h in state.latency_by_prompt.items()},
+            "latency_by_class": {key: h.summary() for key, h in state.latency_by_class.items()},
+            "latency_by_stage": self._stage_summaries(state),
+            "workers": state.workers,
+        }
+
+    def _cost(self, spend: Dict[str, int]) -> float:
+        return (spend["input"] * self.price_input_per_1m + spend["output"] * self.price_output_per_1m) / 1_000_000
+
+    @staticmethod
+    def _tokens_per_s(window: Dict[str, int]) -> float:
+        now = int(time.time())
+        return sum(tokens for second, tokens in window.items() if now - TOKEN_RATE_WINDOW_S < int(second) <= now) / TOKEN_RATE_WINDOW_S
+
+    def _token_spend(self, metrics: Dict) -> Dict[str, Dict[str, float]]:
+        return {
+            prompt_type: {
+                **spend,
+                "tokens_per_s": round(self._tokens_per_s(metrics["token_window"].get(prompt_type, {})), 2),
+                "cost_usd": round(self._cost(spend), 6),
             }
-        }
\ No newline at end of file
+            for prompt_type, spend in metrics["tokens"].items()
+        }
+
+    @staticmethod
+    def _stage_summaries(state: TelemetryState) -> Dict[str, Dict[str, float]]:
+        by_stage: Dict[str, LatencyHistogram] = {}
+        for (stage, _, _), histogram in list(state.stage_latency.items()):
+            _histogram(by_stage, stage, min_value=0.001).merge(histogram)
+        return {stage: histogram.summary() for stage, histogram in by_stage.items()}
+
+    def render_openmetrics(
+        self,
+        counters: Optional[Dict[str, Tuple[str, Samples]]] = None,
+        gauges: Optional[Dict[str, Tuple[str, Samples]]] = None,
+        state: Optional[TelemetryState] = None,
+    ) -> str:
+        """Counters and histograms in OpenMetrics text format. `counters` and `gauges` map
+        name -> (help, value or [(labels, value), ...]) for values owned by other components
+        (LLM client, breaker, token budget)"""
+        state = state or self.state
+        writer = OpenMetricsWriter()
+        metrics = state.metrics
+        writer.counter("classifications", "Classifications served, by label",
+                       (({"class": label}, count) for label, count in metrics["class_distribution"].items()))
+        writer.counter("feedback", "Feedback submissions, by agreement with the prediction",
+                       (({"agreement": kind}, count) for kind, count in metrics["feedback_counts"].items()))
+        for tier, name in (("cache", "Cache"), ("near_duplicate", "Near-duplicate index"), ("prefilter", "Prefilter")):
+            writer.counter(f"{tier}_lookups", f"{name} lookups, by result",
+                           (({"result": result}, metrics[tier][key]) for key, result in (("hits", "hit"), ("misses", "miss"))))
+        writer.counter("coalesced_requests", "Requests that shared an in-flight LLM call", [({}, metrics["coalesced_requests"])])
+        writer.counter("hedged_requests", "LLM calls that fired a hedge request", [({}, metrics["resilience"]["hedged_requests"])])
+        writer.counter("degraded_responses", "Responses answered by the fallback classifier",
+                       [({}, metrics["resilience"]["degraded_responses"])])
+        writer.counter("cascade_routes", "Cascade requests by final prompt and escalation reason",
+                       (({"route": route, "reason": reason}, count)
+                        for route, reasons in sorted(metrics["routing"].items()) for reason, count in sorted(reasons.items())))
+        writer.counter("llm_tokens", "LLM tokens spent, by prompt type and direction",
+                       (({"prompt_type": prompt_type, "direction": direction}, count)
+                        for prompt_type, spend in sorted(metrics["tokens"].items()) for direction, count in spend.items()))
+        writer.counter("llm_cost_usd", "Estimated LLM spend in USD, by prompt type",
+                       (({"prompt_type": prompt_type}, round(self._cost(spend), 6)) for prompt_type, spend in sorted(metrics["tokens"].items())))
+        writer.counter("token_budget_actions", "Requests downgraded or shed by the token budget",
+                       (({"action": action}, count) for action, count in metrics["budget"].items()))
+        writer.counter("long_texts", "Texts over the chunk size, by whether they were chunked or rejected",
+                       [({"outcome": "chunked"}, metrics["chunking"]["chunked_texts"]),
+                        ({"outcome": "rejected"}, metrics["chunking"]["rejected"])])
+        writer.counter("text_chunks", "Chunks long texts were classified as", [({}, metrics["chunking"]["chunks"])])
+        writer.histogram("request_duration_seconds", "End-to-end classification latency, by prompt used",
+                         (({"prompt_type": key}, h) for key, h in list(state.latency_by_prompt.items())))
+        writer.histogram("stage_duration_seconds", "Hot-path time per stage, by prompt type and outcome",
+                         (({"stage": stage, "prompt_type": prompt_type, "outcome": outcome}, h)
+                          for (stage, prompt_type, outcome), h in sorted(state.stage_latency.items(), key=lambda item: item[0])))
+        for name, (help_text, value) in (counters or {}).items():
+            writer.counter(name, help_text, as_samples(value))
+        writer.gauge("llm_tokens_per_second", f"LLM tokens per second over the last {TOKEN_RATE_WINDOW_S}s, by prompt type",
+                     (({"prompt_type": prompt_type}, round(self._tokens_per_s(window), 2))
+                      for prompt_type, window in sorted(metrics["token_window"].items())))
+        writer.gauge("telemetry_workers", "Worker processes included in these metrics", [({}, state.workers)])
+        for name, (help_text, value) in (gauges or {}).items():
+            writer.gauge(name, help_text, as_samples(value))
+        return writer.render()
+
+    @staticmethod
+    def _with_hit_rate(counts: Dict[str, int]) -> Dict:
+        lookups = counts["hits"] + counts["misses"]
+        return {**counts, "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0}
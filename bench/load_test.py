@@ -0,0 +1,201 @@
+"""Open-loop load test of the API against the local fake LLM.
+
+Drives the FastAPI app in-process (no network, no provider) at a fixed request rate and reports
+throughput and p50/p95/p99 latency per endpoint plus event-loop lag, i.e. the service's own
+overhead. Latency is measured from each request's scheduled send time, so a stalled server
+shows up as latency instead of silently lowering the offered rate.
+
+    python bench/load_test.py --rps 200 --duration 30 --latency-ms 300 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+ENDPOINTS = ("classify", "feedback", "metrics")
+# Answers that never reach the requested prompt: local tiers and the degraded fallback
+NON_LLM_PROMPTS = {"local_prefilter", "near_duplicate", "degraded_fallback"}
+
+SAMPLE_TEXTS = {
+    "safe": [
+        "Thanks for the detailed write-up, it helped me fix my build.",
+        "I disagree with the conclusion but the data is interesting.",
+        "Does anyone know when the next release is planned?",
+    ],
+    "spam": [
+        "URGENT! Make $5000/week from home, click here now www.easy-cash.biz",
+        "Buy cheap pills now, no prescription needed! www.pills.ru",
+        "Congratulations winner! Claim your free iPhone, click this link",
+    ],
+    "toxic": [
+        "You're a worthless idiot and nobody likes you.",
+        "Shut up you stupid moron, go die.",
+        "What a piece of garbage, you absolute loser.",
+    ],
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """"classify=8,feedback=1,metrics=1" -> normalised weights"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {name!r}, expected one of {ENDPOINTS}")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def configure_fake_llm(latency_ms: float, latency_sigma: float, error_rate: float, data_dir: str):
+    """Point app.config at the fake provider; must run before app.main is imported"""
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(latency_ms),
+        "FAKE_LLM_LATENCY_SIGMA": str(latency_sigma),
+        "FAKE_LLM_ERROR_RATE": str(error_rate),
+        "DATA_DIR": data_dir,
+    })
+
+
+async def monitor_loop_lag(histogram, stop: asyncio.Event, interval_s: float = 0.01):
+    """Record how late a short sleep wakes up; anything blocking the event loop shows up here"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        histogram.record(max(0.0, (time.perf_counter() - start - interval_s) * 1000))
+
+
+async def run_load_test(
+    app,
+    rps: float,
+    duration_s: float,
+    mix: Dict[str, float],
+    prompt_type: str = "baseline",
+    unique_ratio: float = 1.0,
+    seed: int = 0,
+) -> Dict:
+    """Send `rps` requests/s for `duration_s` seconds, spread over endpoints by `mix` weights"""
+    import httpx
+
+    from app.telemetry.histogram import LatencyHistogram
+
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    latency = {name: LatencyHistogram(min_value=0.01) for name in names}
+    errors = {name: 0 for name in names}
+    loop_lag = LatencyHistogram(min_value=0.01)
+    # A cascade ends on either of its prompts; anything else means the benchmark measured the wrong prompt
+    expected_prompts = NON_LLM_PROMPTS | ({"baseline", "advanced"} if prompt_type == "cascade" else {prompt_type})
+    prompt_mismatches = {}
+
+    def sample_text() -> str:
+        label = rng.choice(list(SAMPLE_TEXTS))
+        text = rng.choice(SAMPLE_TEXTS[label])
+        # Unique suffixes defeat the result cache and request coalescing
+        return f"{text} #{rng.getrandbits(48)}" if rng.random() < unique_ratio else text
+
+    async def send(client: httpx.AsyncClient, name: str, scheduled: float):
+        try:
+            if name == "classify":
+                response = await client.post("/classify", json={"text": sample_text(), "prompt_type": prompt_type})
+                if response.status_code < 400:
+                    prompt_used = response.json()["prompt_used"]
+                    if prompt_used not in expected_prompts:
+                        prompt_mismatches[prompt_used] = prompt_mismatches.get(prompt_used, 0) + 1
+            elif name == "feedback":
+                response = await client.post("/feedback", json={"text": sample_text(), "predicted": "safe", "correct": "spam"})
+            else:
+                response = await client.get("/metrics")
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        latency[name].record((time.perf_counter() - scheduled) * 1000)
+        if not ok:
+            errors[name] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            stop = asyncio.Event()
+            monitor = asyncio.ensure_future(monitor_loop_lag(loop_lag, stop))
+            tasks = set()
+            start = time.perf_counter()
+            for i in range(int(rps * duration_s)):
+                scheduled = start + i / rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.ensure_future(send(client, rng.choices(names, weights)[0], scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await monitor
+
+    report = {"offered_rps": rps, "elapsed_s": round(elapsed, 2), "endpoints": {}}
+    for name in names:
+        report["endpoints"][name] = dict(
+            latency[name].summary(),
+            errors=errors[name],
+            throughput_rps=round(latency[name].count / elapsed, 2),
+        )
+    report["event_loop_lag"] = loop_lag.summary()
+    report["prompt_mismatches"] = prompt_mismatches
+    return report
+
+
+def print_report(report: Dict):
+    print(f"offered {report['offered_rps']} req/s for {report['elapsed_s']} s")
+    print(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<10} {stats['count']:>9} {stats['errors']:>7} {stats['throughput_rps']:>8} "
+            f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}"
+        )
+    lag = report["event_loop_lag"]
+    print(f"event loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API in-process against a fake LLM")
+    parser.add_argument("--rps", type=float, default=100, help="requests per second, all endpoints together")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--mix", default="classify=8,feedback=1,metrics=1", help="endpoint weights")
+    parser.add_argument("--prompt-type", default="baseline")
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="fraction of texts that miss the cache")
+    parser.add_argument("--latency-ms", type=float, default=300, help="median fake LLM latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of fake LLM latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake LLM calls failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        configure_fake_llm(args.latency_ms, args.latency_sigma, args.error_rate, data_dir)
+        from app.main import app
+
+        report = asyncio.run(run_load_test(
+            app, args.rps, args.duration, parse_mix(args.mix),
+            prompt_type=args.prompt_type, unique_ratio=args.unique_ratio, seed=args.seed,
+        ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if report["prompt_mismatches"]:
+        sys.exit(f"/classify answered with other prompts than {args.prompt_type}: {report['prompt_mismatches']}")
+
+
+if __name__ == "__main__":
+    main()
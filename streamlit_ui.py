@@ -20,7 +20,7 @@ execute = st.button("Execute Classification")
 if execute and text:  # only run when button clicked and text is provided
     classification, prompt_used, latency_ms = asyncio.run(classifier.classify(text))
 
-    telemetry.record_classification(classification, latency_ms)
+    telemetry.record_classification(classification, latency_ms, prompt_used)
 
     st.write(f"Class: {classification}")
     st.write(f"Prompt used: {prompt_used}")
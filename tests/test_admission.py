@@ -0,0 +1,68 @@
+import sys
+import os
+import asyncio
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.services.admission import AdmissionController, AdmissionRejectedError
+
+
+def test_lanes_keep_their_share_and_shed_past_queue_depth():
+    """Freed slots go to the highest-priority lane waiting; a full lane queue sheds at once"""
+    admission = AdmissionController({"interactive": (2, 4), "bulk": (1, 1)}, capacity=2)
+    order = []
+
+    async def work(lane, name, release):
+        async with admission.admit(lane):
+            order.append(name)
+            await release.wait()
+
+    async def run():
+        release = asyncio.Event()
+        tasks = [asyncio.ensure_future(work("bulk", "bulk-1", release))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(work("interactive", "chat-1", release)))
+        await asyncio.sleep(0)
+        # Capacity is taken: both of these queue, bulk first
+        tasks.append(asyncio.ensure_future(work("bulk", "bulk-2", release)))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(work("interactive", "chat-2", release)))
+        await asyncio.sleep(0)
+        stats = admission.get_stats()
+        try:
+            async with admission.admit("bulk"):
+                pass
+        except AdmissionRejectedError as e:
+            rejected = e
+        release.set()
+        await asyncio.gather(*tasks)
+        return stats, rejected
+
+    stats, rejected = asyncio.run(run())
+    assert stats["bulk"]["active"] == 1 and stats["bulk"]["queued"] == 1
+    assert stats["interactive"]["queued"] == 1
+    assert rejected.retry_after >= 1
+    # The waiting chat message got the next slot ahead of the earlier bulk request
+    assert order == ["bulk-1", "chat-1", "chat-2", "bulk-2"]
+    assert admission.get_stats()["bulk"]["shed"] == 1
+    assert admission.active == 0
+
+
+def test_deferred_work_waits_instead_of_being_shed():
+    """Stream records (defer=True) queue past the lane's depth and all get their turn"""
+    admission = AdmissionController({"bulk": (2, 1)}, capacity=2)
+    done = []
+
+    async def record(i):
+        async with admission.admit("bulk", defer=True):
+            await asyncio.sleep(0.001)
+            done.append(i)
+
+    async def run():
+        await asyncio.gather(*(record(i) for i in range(20)))
+
+    asyncio.run(run())
+    assert sorted(done) == list(range(20))
+    assert admission.get_stats()["bulk"]["shed"] == 0
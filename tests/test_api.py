@@ -0,0 +1,97 @@
+import sys
+import os
+import json
+import subprocess
+import textwrap
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# Each test runs the app in its own process against the fake provider, so app.config is read
+# with these settings and nothing is written outside tmp_path
+APP_SCRIPT = """
+import json
+import app.main
+from fastapi.testclient import TestClient
+
+{body}
+print(json.dumps(result))
+"""
+
+
+def run_app(tmp_path, body: str, **env_overrides):
+    """Run `body`, which starts the app with TestClient and sets `result`; returns `result`"""
+    env = {key: value for key, value in os.environ.items() if key != "GOOGLE_API_KEY"}
+    env.update({
+        "PYTHONPATH": project_root,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": "1",
+        "DATA_DIR": str(tmp_path / "data"),
+        **env_overrides,
+    })
+    script = APP_SCRIPT.format(body=textwrap.dedent(body))
+    completed = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_batch_reports_a_failing_text_without_failing_the_request(tmp_path):
+    """A text the provider refuses gets its own error; the rest of /classify/batch is answered"""
+    result = run_app(tmp_path, """
+        from langchain_core.messages import AIMessage
+
+        class Refused(Exception):
+            status_code = 400
+
+        class RefusingLLM:
+            # Leaves the second text out of the packed answer and refuses it when asked alone
+            calls = 0
+
+            async def ainvoke(self, messages):
+                self.calls += 1
+                if self.calls == 1:
+                    return AIMessage(content="1. safe\\n3. spam")
+                raise Refused("blocked by the provider")
+
+        with TestClient(app.main.app) as client:
+            app.main.classifier.client.llm = RefusingLLM()
+            response = client.post("/classify/batch", json={"texts": ["hello there", "blocked text", "buy my stuff"]})
+            result = {"status": response.status_code, "body": response.json()}
+    """, PREFILTER_ENABLED="false", CLASSIFY_CACHE_ENABLED="false")
+
+    assert result["status"] == 200
+    first, second, third = result["body"]["results"]
+    assert first["class"] == "safe" and third["class"] == "spam"
+    assert set(second) == {"error"}
+
+
+def test_feedback_after_shutdown_is_still_recorded(tmp_path):
+    """Shutdown unhooks the example index, so later feedback is logged rather than crashing"""
+    result = run_app(tmp_path, """
+        feedback = {"text": "those refund links are phishing", "predicted": "safe", "correct": "spam"}
+        with TestClient(app.main.app) as client:
+            during = client.post("/feedback", json=feedback).status_code
+        after = TestClient(app.main.app).post("/feedback", json=feedback).status_code
+        result = {"during": during, "after": after}
+    """)
+
+    assert result == {"during": 200, "after": 200}
+
+
+def test_prometheus_metrics_label_admission_lanes(tmp_path):
+    """Per-lane admission values are one labelled family each, not a family per lane"""
+    result = run_app(tmp_path, """
+        with TestClient(app.main.app) as client:
+            response = client.get("/metrics/prometheus")
+            result = {"status": response.status_code, "text": response.text}
+    """)
+
+    assert result["status"] == 200
+    text = result["text"]
+    assert text.count("# TYPE textclf_admission_queued gauge") == 1
+    assert 'textclf_admission_active{lane="interactive"}' in text
+    assert 'textclf_admission_shed_total{lane="bulk"} 0' in text
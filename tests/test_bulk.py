@@ -0,0 +1,94 @@
+import sys
+import os
+import asyncio
+import json
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.services.bulk import classify_ndjson, iter_lines
+
+
+async def byte_chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_iter_lines_reassembles_split_lines():
+    """Lines split across chunk boundaries come out whole"""
+    async def run():
+        return [line async for line in iter_lines(byte_chunks(b'"a"\n"bb"\n"ccc"', 2))]
+
+    assert asyncio.run(run()) == ['"a"', '"bb"', '"ccc"']
+
+
+def test_classify_ndjson_streams_every_record_with_bounded_concurrency():
+    """All records come back tagged with their id, never exceeding the concurrency limit"""
+    in_flight = 0
+    peak = 0
+
+    async def classify(text):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return ("spam" if "buy" in text else "safe", "advanced", 1)
+
+    records = [json.dumps({"id": f"r{i}", "text": "buy" if i % 2 else "hi"}) for i in range(200)]
+    records.insert(5, "not json")
+    records.append(json.dumps("bare string"))
+
+    async def lines():
+        for line in records:
+            yield line
+
+    async def run():
+        return [result async for result in classify_ndjson(lines(), classify, concurrency=4)]
+
+    results = asyncio.run(run())
+    by_id = {result["id"]: result for result in results}
+    assert len(results) == 202
+    assert peak <= 4
+    assert by_id["r1"]["class"] == "spam" and by_id["r2"]["class"] == "safe"
+    assert "error" in by_id[6]  # the malformed line, reported by line number
+    assert by_id[202]["class"] == "safe"
+
+
+WEBSOCKET_SCRIPT = """
+import json
+from fastapi.testclient import TestClient
+import app.main
+
+with TestClient(app.main.app) as client:
+    with client.websocket_connect("/ws/classify?concurrency=4&prompt_type=baseline") as ws:
+        for i in range(30):
+            ws.send_text(json.dumps({"id": f"m{i}", "text": f"message {i} about the weekend plans"}))
+        ws.send_text("not json")
+        results = [json.loads(ws.receive_text()) for _ in range(31)]
+print(json.dumps(results))
+"""
+
+
+def test_websocket_streams_results_tagged_with_client_ids(tmp_path):
+    """One connection carries many texts; every result comes back under the id it was sent with"""
+    import subprocess
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": project_root,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": "5",
+        "DATA_DIR": str(tmp_path / "data"),
+    }
+    completed = subprocess.run(
+        [sys.executable, "-c", WEBSOCKET_SCRIPT],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    results = json.loads(completed.stdout.strip().splitlines()[-1])
+    by_id = {result["id"]: result for result in results}
+    assert set(by_id) == {f"m{i}" for i in range(30)} | {31}
+    assert all(by_id[f"m{i}"]["class"] in ("toxic", "spam", "safe") for i in range(30))
+    assert "error" in by_id[31]  # the malformed message, reported by its position
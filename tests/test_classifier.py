@@ -0,0 +1,690 @@
+import sys
+import os
+import asyncio
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from app.services.classifier import TextClassifier
+
+
+def make_classifier(responses, **kwargs):
+    return TextClassifier(llm=FakeListChatModel(responses=responses), **kwargs)
+
+
+def test_batch_packs_texts_into_one_call():
+    """Several texts share one LLM call and keep their order"""
+    classifier = make_classifier(["1. safe\n2. spam\n3. toxic"], batch_size=3)
+    results = asyncio.run(classifier.classify_batch(["hello", "buy now", "you idiot"]))
+    assert [label for label, _, _ in results] == ["safe", "spam", "toxic"]
+    assert all(prompt_used == "advanced" for _, prompt_used, _ in results)
+
+
+def test_batch_falls_back_to_single_calls_for_unparsed_items():
+    """Items missing from the batch answer are classified one by one"""
+    classifier = make_classifier(["1. safe\n3. toxic", "spam"], batch_size=3)
+    results = asyncio.run(classifier.classify_batch(["hello", "buy now", "you idiot"]))
+    assert [label for label, _, _ in results] == ["safe", "spam", "toxic"]
+
+
+def test_batch_splits_by_batch_size():
+    """Inputs larger than batch_size are split across several calls"""
+    classifier = make_classifier(["1. safe\n2. safe", "1. spam\n2. spam", "toxic"], batch_size=2)
+    results = asyncio.run(classifier.classify_batch(["a", "b", "c", "d", "e"]))
+    assert len(results) == 5
+    assert {label for label, _, _ in results} <= {"safe", "spam", "toxic"}
+
+
+def test_cache_serves_normalized_repeats():
+    """Repeats that differ only in case/whitespace skip the LLM"""
+    from app.services.cache import ClassificationCache
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    classifier = make_classifier(["spam", "safe"], cache=ClassificationCache(), telemetry=telemetry)
+
+    async def run():
+        first = await classifier.classify("Buy NOW  at cheap-pills.example")
+        second = await classifier.classify("buy now at cheap-pills.example")
+        other_prompt = await classifier.classify("buy now at cheap-pills.example", prompt_type="baseline")
+        return first, second, other_prompt
+
+    first, second, other_prompt = asyncio.run(run())
+    assert first[0] == second[0] == "spam"
+    assert other_prompt[0] == "safe"
+    assert telemetry.get_metrics()["cache"]["hits"] == 1
+    assert telemetry.get_metrics()["cache"]["misses"] == 2
+
+
+def test_cache_ttl_and_sqlite_tier(tmp_path):
+    """Expired entries are dropped and the SQLite tier survives a new instance"""
+    from app.services.cache import ClassificationCache
+
+    db_path = str(tmp_path / "cache.db")
+
+    async def run():
+        cache = ClassificationCache(max_size=1, db_path=db_path)
+        await cache.set("a", "spam")
+        await cache.set("b", "safe")  # evicts "a" from memory, still on disk
+        assert len(cache) == 1
+        assert await cache.get("a") == "spam"
+        cache.close()
+
+        reopened = ClassificationCache(db_path=db_path)
+        assert await reopened.get("b") == "safe"
+        reopened.close()
+
+        expiring = ClassificationCache(ttl_seconds=0.01)
+        await expiring.set("c", "toxic")
+        await asyncio.sleep(0.02)
+        assert await expiring.get("c") is None
+
+    asyncio.run(run())
+
+
+def test_concurrent_identical_requests_share_one_llm_call():
+    """A burst of identical texts results in a single LLM call"""
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    llm = FakeListChatModel(responses=["spam", "safe"], sleep=0.05)
+    classifier = TextClassifier(llm=llm, telemetry=telemetry)
+
+    async def run():
+        return await asyncio.gather(*(classifier.classify("FREE iPhone, click now") for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert {label for label, _, _ in results} == {"spam"}
+    assert llm.i == 1
+    assert telemetry.get_metrics()["coalesced_requests"] == 19
+
+
+def test_coalesced_failure_reaches_every_caller():
+    """Followers see the leader's error instead of hanging"""
+    import pytest
+    from app.services.coalescing import SingleFlight
+
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert len(flight) == 0
+
+
+def test_batch_sends_duplicate_texts_once():
+    """Duplicates inside one batch share a slot in the packed prompt"""
+    llm = FakeListChatModel(responses=["1. spam\n2. safe", "unused"])
+    classifier = TextClassifier(llm=llm, batch_size=10)
+    results = asyncio.run(classifier.classify_batch(["win $$$", "hello", "win $$$"]))
+    assert [label for label, _, _ in results] == ["spam", "safe", "spam"]
+    assert llm.i == 1
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    """Requests arriving inside the window go out as one batch call"""
+    from app.services.batcher import MicroBatcher
+
+    calls = []
+
+    async def fake_batch(texts, prompt_type):
+        calls.append(list(texts))
+        return [("spam" if "buy" in text else "safe", prompt_type, 1) for text in texts]
+
+    batcher = MicroBatcher(fake_batch, max_batch_size=3, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(text) for text in ["hi", "buy now", "yo", "buy more", "ok"]))
+
+    results = asyncio.run(run())
+    assert [label for label, _, _ in results] == ["safe", "spam", "safe", "spam", "safe"]
+    assert calls == [["hi", "buy now", "yo"], ["buy more", "ok"]]
+
+
+def test_micro_batch_isolates_a_text_that_fails():
+    """A text whose own fallback call is refused fails its caller only, not the whole window"""
+    from langchain_core.messages import AIMessage
+    from app.services.batcher import MicroBatcher
+    from app.services.llm_client import LLMClient
+
+    class RefusingLLM:
+        """Skips the second text of the packed answer and refuses it when asked alone"""
+
+        calls = 0
+
+        async def ainvoke(self, messages):
+            self.calls += 1
+            if self.calls == 1:
+                return AIMessage(content="1. safe\n3. spam")
+            raise ProviderError(400)
+
+    classifier = TextClassifier(client=LLMClient(RefusingLLM()), batch_size=3)
+    batcher = MicroBatcher(classifier.classify_batch, max_batch_size=3, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.submit(text) for text in ["hello there", "blocked text", "buy my stuff"]), return_exceptions=True
+        )
+
+    first, second, third = asyncio.run(run())
+    assert first[0] == "safe" and third[0] == "spam"
+    assert isinstance(second, Exception)
+
+
+def test_prefilter_answers_obvious_spam_without_llm():
+    """Confident local matches short-circuit the LLM and report their tier"""
+    from app.services.prefilter import HeuristicPreClassifier
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    llm = FakeListChatModel(responses=["safe", "safe"])
+    classifier = TextClassifier(llm=llm, prefilter=HeuristicPreClassifier(threshold=0.9), telemetry=telemetry)
+
+    spam = asyncio.run(classifier.classify("Buy cheap pills now! Click here!"))
+    ordinary = asyncio.run(classifier.classify("Thanks for the helpful tutorial"))
+
+    assert spam[:2] == ("spam", "local_prefilter")
+    assert ordinary[:2] == ("safe", "advanced")
+    assert llm.i == 1
+    assert telemetry.get_metrics()["prefilter"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_prefilter_defers_ambiguous_text():
+    """Weak or mixed signals are left to the LLM"""
+    from app.services.prefilter import HeuristicPreClassifier
+
+    prefilter = HeuristicPreClassifier(threshold=0.9)
+    assert prefilter.predict("Check out my blog at example.com") is None
+    assert prefilter.predict("I disagree with your opinion but respect it") is None
+    assert prefilter.predict("You're an idiot and should die")[0] == "toxic"
+
+
+def test_prefilter_needs_more_than_one_weak_phrase():
+    """A lone threat-like phrase or harmless links and calls to action are left to the LLM"""
+    from app.services.prefilter import SPAM_RULES, TOXIC_RULES, HeuristicPreClassifier
+
+    assert all(weight < 0.9 for _, weight in SPAM_RULES + TOXIC_RULES)
+    prefilter = HeuristicPreClassifier(threshold=0.9)
+    assert prefilter.predict("Internet Explorer should die already") is None
+    assert prefilter.predict("Let that old habit go die") is None
+    assert prefilter.predict("I read about a kys meme") is None
+    assert prefilter.predict("Read the docs: click here https://docs.python.org and subscribe now") is None
+
+
+class FlakyLLM:
+    """Chat model stand-in that fails with the given errors before answering"""
+
+    def __init__(self, errors, answer="safe"):
+        self.errors = list(errors)
+        self.answer = answer
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content=self.answer)
+
+
+class ProviderError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+def test_llm_client_retries_throttling_and_backs_off_rate():
+    """429s are retried with backoff and halve the token-bucket rate"""
+    from app.services.llm_client import LLMClient
+
+    llm = FlakyLLM([ProviderError(429), ProviderError(503)], answer="spam")
+    client = LLMClient(llm, rate_per_s=40, backoff_base_s=0.001)
+    classifier = TextClassifier(client=client)
+
+    result = asyncio.run(classifier.classify("hello"))
+    assert result[0] == "spam"
+    assert llm.calls == 3
+    assert client.stats["retries"] == 2
+    assert client.bucket.rate < 40
+
+
+def test_llm_client_gives_up_with_retry_after():
+    """Exhausted retries surface as LLMUnavailableError, other errors are not retried"""
+    import pytest
+    from app.services.llm_client import LLMClient, LLMUnavailableError
+
+    client = LLMClient(FlakyLLM([ProviderError(429)] * 5), max_retries=2, backoff_base_s=0.001)
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        asyncio.run(TextClassifier(client=client).classify("hello"))
+    assert excinfo.value.retry_after >= 1
+    assert client.llm.calls == 3
+
+    bad_request = FlakyLLM([ProviderError(400)])
+    with pytest.raises(Exception) as excinfo:
+        asyncio.run(TextClassifier(client=LLMClient(bad_request)).classify("hello"))
+    assert not isinstance(excinfo.value, LLMUnavailableError)
+    assert bad_request.calls == 1
+
+
+class ScriptedLLM:
+    """Chat model stand-in whose calls take the given delays (seconds) in order"""
+
+    def __init__(self, delays, answer="safe"):
+        self.delays = list(delays)
+        self.answer = answer
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return AIMessage(content=self.answer)
+
+
+def test_llm_stage_times_the_provider_call_apart_from_queueing_and_backoff():
+    """"llm" covers only the provider call; waiting for a slot and retry sleeps are their own stages"""
+    from langchain_core.messages import AIMessage
+    from app.services.llm_client import LLMClient
+    from app.telemetry.telemetry import TelemetryService
+
+    class SlowLLM(FlakyLLM):
+        async def ainvoke(self, messages):
+            await asyncio.sleep(0.05)
+            return await super().ainvoke(messages)
+
+    telemetry = TelemetryService()
+    client = LLMClient(SlowLLM([ProviderError(429)]), max_in_flight=1, backoff_base_s=0.001)
+    classifier = TextClassifier(client=client, telemetry=telemetry)
+
+    async def run():
+        await asyncio.gather(classifier.classify("first text"), classifier.classify("second text"))
+
+    asyncio.run(run())
+    stages = telemetry.state.stage_latency
+    assert stages[("llm", "advanced", "ok")].count == 2
+    assert stages[("llm", "advanced", "error")].count == 1
+    # Each call takes ~50 ms; the call that waited for the single slot waited for the others
+    assert stages[("llm", "advanced", "ok")].summary()["max_ms"] < 90
+    assert stages[("llm_queue", "advanced", "ok")].summary()["max_ms"] >= 40
+    assert stages[("llm_backoff", "advanced", "ok")].count == 1
+
+
+def test_slow_call_is_hedged_after_running_percentile():
+    """A call slower than the running p95 gets a second copy and the faster answer wins"""
+    from app.services.llm_client import LLMClient
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    llm = ScriptedLLM([0.001] * 5 + [1.0, 0.001], answer="spam")
+    classifier = TextClassifier(
+        client=LLMClient(llm), hedge_percentile=95, hedge_min_delay_ms=10, hedge_min_samples=5, telemetry=telemetry
+    )
+
+    async def run():
+        for i in range(5):
+            await classifier.classify(f"warm up {i}")
+        return await classifier.classify("the slow one")
+
+    label, _, latency_ms = asyncio.run(run())
+    assert label == "spam"
+    assert latency_ms < 500
+    assert llm.calls == 7
+    assert telemetry.get_metrics()["resilience"]["hedged_requests"] == 1
+
+
+def test_packed_calls_stay_out_of_the_hedge_latencies():
+    """Only the single-text calls that get hedged feed the percentile their hedge delay comes from"""
+    classifier = make_classifier(["1. safe\n2. spam", "safe"], batch_size=2)
+
+    async def run():
+        await classifier.classify_batch(["hello", "buy now"])
+        assert len(classifier.latencies) == 0
+        await classifier.classify("something else")
+
+    asyncio.run(run())
+    assert len(classifier.latencies) == 1
+
+
+def test_circuit_breaker_fails_fast_and_falls_back():
+    """Once the failure rate trips the breaker, calls skip the provider and use the degraded classifier"""
+    import pytest
+    from app.services.llm_client import LLMClient
+    from app.services.prefilter import HeuristicPreClassifier
+    from app.services.resilience import CircuitBreaker, CircuitOpenError
+
+    llm = FlakyLLM([ProviderError(500)] * 100)
+    breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_calls=4, open_seconds=60)
+    client = LLMClient(llm, max_retries=0)
+    strict = TextClassifier(client=client, breaker=breaker)
+
+    async def run():
+        for i in range(4):
+            with pytest.raises(Exception):
+                await strict.classify(f"text {i}")
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            await strict.classify("another text")
+
+        degraded = TextClassifier(client=client, breaker=breaker, fallback=HeuristicPreClassifier())
+        return await degraded.classify("Buy cheap pills now! Click here!")
+
+    label, prompt_used, _ = asyncio.run(run())
+    assert (label, prompt_used) == ("spam", "degraded_fallback")
+    assert llm.calls == 4
+
+
+def test_fake_llm_answers_single_and_batch_prompts():
+    """The load-test model labels both prompt shapes and fails at the configured rate"""
+    from app.services.fake_llm import FakeChatModel
+    from app.services.llm_client import LLMClient, LLMUnavailableError
+
+    llm = FakeChatModel(latency_ms=1, latency_sigma=0, seed=3)
+    classifier = TextClassifier(llm=llm, batch_size=3)
+    label, _, _ = asyncio.run(classifier.classify("Buy cheap viagra now! www.pills.ru", "advanced"))
+    assert label == "spam"
+    results = asyncio.run(classifier.classify_batch(
+        ["Thanks, that helped", "Click here now! www.free-money.biz", "Shut up you stupid moron, go die"]
+    ))
+    assert [label for label, _, _ in results] == ["safe", "spam", "toxic"]
+
+    failing = TextClassifier(client=LLMClient(FakeChatModel(latency_ms=1, error_rate=1.0), max_retries=0))
+    try:
+        asyncio.run(failing.classify("hello", "baseline"))
+        assert False, "expected the injected 503 to surface"
+    except LLMUnavailableError:
+        pass
+
+
+def test_parse_classification_ignores_negated_labels():
+    """Whole-word, non-negated matches only: "not toxic" is no longer toxic"""
+    classifier = make_classifier(["unused", "unused"])
+    assert classifier._parse_classification("Toxic") == "toxic"
+    assert classifier._parse_classification("Not toxic, this is safe.") == "safe"
+    assert classifier._parse_classification("non-toxic spam") == "spam"
+    assert classifier._parse_classification("It isn't toxic") == "safe"
+    assert classifier._parse_classification("This is not a toxic message") == "safe"
+    assert classifier._parse_classification("not really toxic") == "safe"
+    assert classifier._parse_classification("Never toxic; spam") == "spam"
+    assert classifier._parse_classification("No doubt, this is toxic") == "toxic"
+
+
+def test_scores_mode_returns_confidence_per_label():
+    """One JSON call scores every label (extra ones included), results are cached"""
+    from app.services.cache import ClassificationCache
+
+    classifier = make_classifier(
+        ['```json\n{"toxic": 0.7, "Spam": 0.05, "safe": 0.2, "harassment": 0.85}\n```', "Not toxic, safe"],
+        cache=ClassificationCache(max_size=10),
+    )
+    labels = ["toxic", "spam", "safe", "harassment"]
+    scores, prompt_used, _ = asyncio.run(classifier.classify_with_scores("you people are the worst", labels))
+    assert scores == {"toxic": 0.7, "spam": 0.05, "safe": 0.2, "harassment": 0.85}
+    assert prompt_used == "scores"
+
+    cached, _, _ = asyncio.run(classifier.classify_with_scores("You people are the WORST", labels))
+    assert cached == scores
+
+    # A plain-text answer still yields usable (one-hot) scores
+    fallback, _, _ = asyncio.run(classifier.classify_with_scores("something else", labels))
+    assert fallback == {"toxic": 0.0, "spam": 0.0, "safe": 1.0, "harassment": 0.0}
+
+
+class PromptRecordingLLM:
+    """Chat model stand-in that answers per prompt kind and remembers which prompts it saw"""
+
+    def __init__(self, baseline_answers, advanced_answer="toxic"):
+        self.baseline_answers = list(baseline_answers)
+        self.advanced_answer = advanced_answer
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        content = messages[-1].content
+        advanced = "expert content moderator" in content
+        self.prompts.append("advanced" if advanced else "baseline")
+        if advanced:
+            return AIMessage(content=self.advanced_answer)
+        return AIMessage(content=self.baseline_answers.pop(0))
+
+
+def test_cascade_escalates_only_unclear_or_flagged_answers():
+    """Clean baseline answers stop there; garbled or flagged ones go on to the advanced prompt"""
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    llm = PromptRecordingLLM(["Safe", "I think it could be toxic or spam", "spam"])
+    classifier = TextClassifier(llm=llm, cascade_escalate_labels=["spam"], telemetry=telemetry)
+
+    async def run():
+        return [await classifier.classify(text, "cascade") for text in ("hi there", "hmm", "buy")]
+
+    results = asyncio.run(run())
+    assert [(label, prompt_used) for label, prompt_used, _ in results] == [
+        ("safe", "baseline"), ("toxic", "advanced"), ("toxic", "advanced"),
+    ]
+    assert llm.prompts == ["baseline", "baseline", "advanced", "baseline", "advanced"]
+    metrics = telemetry.get_metrics()
+    assert metrics["routing"] == {"baseline": {"confident": 1}, "advanced": {"unparsed": 1, "flagged": 1}}
+    # Estimated spend per call: the few-shot prompt is several times the baseline one
+    assert metrics["tokens"]["advanced"]["input"] / 2 > 3 * metrics["tokens"]["baseline"]["input"] / 3
+
+
+def test_cascade_cache_hits_report_the_prompt_that_answered():
+    """A cached cascade answer keeps the prompt it ended up with, for single and batch calls"""
+    from app.services.cache import ClassificationCache
+
+    llm = PromptRecordingLLM(["Safe", "I think it could be toxic or spam"])
+    classifier = TextClassifier(llm=llm, cache=ClassificationCache())
+
+    async def run():
+        first = [await classifier.classify(text, "cascade") for text in ("hi there", "hmm")]
+        again = [await classifier.classify(text, "cascade") for text in ("hi there", "hmm")]
+        return first, again, await classifier.classify_batch(["hi there", "hmm"], "cascade")
+
+    first, again, batch = asyncio.run(run())
+    expected = [("safe", "baseline"), ("toxic", "advanced")]
+    assert [result[:2] for result in first] == [result[:2] for result in again] == [result[:2] for result in batch] == expected
+    assert len(llm.prompts) == 3
+
+
+def test_cascade_batch_escalates_missing_lines():
+    """Packed cascade calls re-send only the texts the baseline answer didn't settle"""
+    llm = PromptRecordingLLM(["1. safe\n2. ???\n3. safe"], advanced_answer="spam")
+    classifier = TextClassifier(llm=llm, batch_size=3)
+    results = asyncio.run(classifier.classify_batch(["a", "b", "c"], "cascade"))
+    assert [(label, prompt_used) for label, prompt_used, _ in results] == [
+        ("safe", "baseline"), ("spam", "advanced"), ("safe", "baseline"),
+    ]
+    assert llm.prompts == ["baseline", "advanced"]
+
+
+def test_token_budget_downgrades_then_sheds():
+    """A spent advanced budget moves requests to baseline; once that is spent too they are refused"""
+    import pytest
+    from app.services.budget import TokenBudget, TokenBudgetExceededError
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService(price_input_per_1m=1.0, price_output_per_1m=2.0)
+    llm = PromptRecordingLLM(["safe"])
+    budget = TokenBudget({"advanced": 1, "baseline": 1}, window_s=60)
+    classifier = TextClassifier(llm=llm, budget=budget, telemetry=telemetry)
+
+    async def run():
+        first = await classifier.classify("one", "advanced")
+        second = await classifier.classify("two", "advanced")
+        with pytest.raises(TokenBudgetExceededError) as shed:
+            await classifier.classify("three", "advanced")
+        return first, second, shed.value
+
+    first, second, error = asyncio.run(run())
+    assert (first[:2], second[:2]) == (("toxic", "advanced"), ("safe", "baseline"))
+    assert llm.prompts == ["advanced", "baseline"]
+    assert error.retry_after >= 1
+
+    metrics = telemetry.get_metrics()
+    assert metrics["budget"] == {"downgraded": 1, "shed": 1}
+    advanced = metrics["tokens"]["advanced"]
+    assert advanced["cost_usd"] == round((advanced["input"] + 2 * advanced["output"]) / 1_000_000, 6)
+    assert metrics["llm_spend"]["cost_usd"] == round(sum(spend["cost_usd"] for spend in metrics["tokens"].values()), 6)
+    assert budget.get_stats()["advanced"]["remaining"] == 0
+
+
+def test_near_duplicates_reuse_earlier_labels():
+    """Campaign copies that only swap amounts, links or emoji get the stored label without an LLM call"""
+    from app.services.near_duplicate import NearDuplicateIndex
+    from app.telemetry.telemetry import TelemetryService
+
+    telemetry = TelemetryService()
+    llm = PromptRecordingLLM(["spam"], advanced_answer="spam")
+    classifier = TextClassifier(llm=llm, near_duplicates=NearDuplicateIndex(max_size=2), telemetry=telemetry)
+
+    async def run():
+        return [
+            await classifier.classify("Make $5000/week working from home, visit http://cash-fast.example now"),
+            await classifier.classify("Make $3,000/week working from home, visit www.easy-money.biz now 🤑"),
+            await classifier.classify("Make $3000/week working from home, visit http://x.example now", "baseline"),
+        ]
+
+    results = asyncio.run(run())
+    assert [(label, prompt_used) for label, prompt_used, _ in results] == [
+        ("spam", "advanced"), ("spam", "near_duplicate"), ("spam", "baseline"),
+    ]
+    # Labels are kept per prompt type, so the baseline request still went to the LLM
+    assert llm.prompts == ["advanced", "baseline"]
+    assert telemetry.get_metrics()["near_duplicate"]["hits"] == 1
+
+    index = NearDuplicateIndex(max_size=2)
+    texts = [f"{word} is the word of the day for everyone here" for word in ("alpha", "beta", "gamma")]
+    for text in texts:
+        index.add(text, "safe")
+    assert len(index) == 2
+    assert index.lookup(texts[0]) is None and index.lookup(texts[2]) == ("safe", 0)
+    # Too short to fingerprint reliably
+    index.add("hi there", "safe")
+    assert index.lookup("hi there") is None
+
+
+def test_dynamic_prompt_retrieves_similar_examples(tmp_path):
+    """The dynamic prompt carries the nearest labelled examples; the index snapshot is reused and
+    picks up feedback added since"""
+    import numpy as np
+    from langchain_core.messages import AIMessage
+    from app.prompts.prompt_library import ADVANCED_EXAMPLES
+    from app.services.examples import build_example_index
+
+    datasets = tmp_path / "datasets"
+    datasets.mkdir()
+    (datasets / "eval.jsonl").write_text(
+        '{"text": "Claim your free crypto giveaway before midnight", "label": "spam"}\n'
+        '{"text": "The library opens at nine on weekdays", "label": "safe"}\n'
+    )
+    feedback = [{"text": "those refund links are phishing", "predicted": "safe", "correct": "spam"}]
+    index_dir = str(tmp_path / "index")
+    index = build_example_index(index_dir, 256, ADVANCED_EXAMPLES, str(datasets), lambda: feedback)
+    assert len(index) == len(ADVANCED_EXAMPLES) + 3
+
+    # Restart: vectors are memory-mapped and only the new feedback record gets embedded
+    feedback.append({"text": "The library opens at nine on weekdays", "predicted": "safe", "correct": "spam"})
+    index = build_example_index(index_dir, 256, ADVANCED_EXAMPLES, str(datasets), lambda: feedback)
+    assert isinstance(index._base, np.memmap) and index._tail_size == 0
+    assert index.search("when does the library open?", 1)[0][:2] == ("The library opens at nine on weekdays", "spam")
+    # A text is never shown its own answer
+    assert all(text != "The library opens at nine on weekdays" for text, _, _ in index.search("The library opens at nine on weekdays", 3))
+
+    class CapturingLLM:
+        prompts = []
+
+        async def ainvoke(self, messages):
+            self.prompts.append(messages[-1].content)
+            return AIMessage(content="spam")
+
+    llm = CapturingLLM()
+    classifier = TextClassifier(llm=llm, examples=index, examples_k=2)
+    label, prompt_used, _ = asyncio.run(classifier.classify("free crypto giveaway, claim before midnight!", "dynamic"))
+    assert (label, prompt_used) == ("spam", "dynamic")
+    prompt = llm.prompts[0]
+    assert 'Text: "Claim your free crypto giveaway before midnight"\nClassification: spam' in prompt
+    assert prompt.count("Classification:") == 3  # two examples plus the answer slot
+
+
+def test_example_snapshot_keeps_every_workers_feedback(tmp_path):
+    """Workers share one feedback log but index only their own corrections live; whichever
+    snapshot is saved last, the next startup still picks up every record of the log"""
+    from app.prompts.prompt_library import ADVANCED_EXAMPLES
+    from app.services.examples import build_example_index
+
+    index_dir = str(tmp_path / "index")
+    log = [{"text": "first correction here", "correct": "spam"}]
+    build = lambda: build_example_index(index_dir, 256, ADVANCED_EXAMPLES, None, lambda: log)
+    first, second = build(), build()
+
+    for worker, text in ((first, "refund links are phishing"), (second, "that joke was harmless"), (first, "win a prize now")):
+        log.append({"text": text, "correct": "spam"})
+        worker.add_many([(text, "spam")])
+    first.save(index_dir)
+    second.save(index_dir)  # saved last, without the first worker's two corrections
+
+    restarted = build()
+    for record in log:
+        assert restarted.search(record["text"] + " again", 1)[0][:2] == (record["text"], "spam")
+
+    # A rewritten log no longer starts with what the snapshot indexed: rebuild from it
+    log[:] = [{"text": "only record left", "correct": "safe"}]
+    rebuilt = build()
+    assert len(rebuilt) == len(ADVANCED_EXAMPLES) + 1
+
+
+def test_long_texts_are_classified_as_chunks():
+    """Long texts are split into overlapping chunks classified concurrently; the combine rule
+    picks the label and texts over the hard limit are rejected before any call"""
+    import pytest
+    from langchain_core.messages import AIMessage
+    from app.services.chunking import InputTooLongError, split_chunks
+
+    class ContentLLM:
+        prompts = []
+
+        async def ainvoke(self, messages):
+            # Only the text under classification, not the prompt's own examples
+            text = messages[-1].content.rsplit("Text:", 1)[-1]
+            self.prompts.append(text)
+            if '"toxic"' in messages[-1].content:
+                return AIMessage(content='{"toxic": 0.9, "spam": 0.1, "safe": 0.2}' if "idiot" in text else '{"toxic": 0.0, "spam": 0.3, "safe": 0.8}')
+            return AIMessage(content="toxic" if "idiot" in text else "safe")
+
+    text = " ".join(f"sentence number {i} about the weather." for i in range(60)) + " you are an idiot"
+    chunks = split_chunks(text, 50, 10)
+    assert len(chunks) > 3 and "you are an idiot" in chunks[-1]
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # Neighbouring chunks share their boundary words
+    assert chunks[1].split()[0] in chunks[0]
+
+    llm = ContentLLM()
+    classifier = TextClassifier(llm=llm, chunk_tokens=50, chunk_overlap_tokens=10, max_input_tokens=1000)
+    label, prompt_used, _, count = asyncio.run(classifier.classify_long(text, "baseline"))
+    assert (label, prompt_used, count) == ("toxic", "baseline", len(chunks))
+    assert len(llm.prompts) == len(chunks)
+    assert asyncio.run(classifier.classify_long("short and sweet", "baseline"))[3] == 1
+
+    classifier.chunk_combine = "majority"
+    assert asyncio.run(classifier.classify_long(text, "advanced"))[0] == "safe"
+    classifier.chunk_combine = "max_confidence"
+    assert asyncio.run(classifier.classify_long(text))[:2] == ("toxic", "scores")
+
+    calls = len(llm.prompts)
+    with pytest.raises(InputTooLongError):
+        asyncio.run(classifier.classify_long(text * 5))
+    assert len(llm.prompts) == calls
@@ -0,0 +1,126 @@
+import sys
+import os
+import asyncio
+import json
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from app.eval.evalution import ModelEvaluator
+from app.services.classifier import TextClassifier
+
+
+class KeywordLLM:
+    """Deterministic chat model stand-in that counts calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        self.calls += 1
+        await asyncio.sleep(0.001)
+        text = messages[-1].content.lower().split("text to classify:")[-1].split("now classify this text:")[-1]
+        return AIMessage(content="spam" if "buy" in text else "safe")
+
+
+def write_dataset(path, rows):
+    with open(path, "w") as f:
+        for text, label in rows:
+            f.write(json.dumps({"text": text, "label": label}) + "\n")
+
+
+def test_evaluation_scores_all_prompts_concurrently_from_jsonl(tmp_path):
+    """Every prompt type is scored over the streamed dataset"""
+    dataset = tmp_path / "labelled.jsonl"
+    write_dataset(dataset, [(f"buy thing {i}", "spam") if i % 2 else (f"hello {i}", "safe") for i in range(40)])
+    llm = KeywordLLM()
+    evaluator = ModelEvaluator(
+        classifier=TextClassifier(llm=llm), dataset_path=str(dataset), concurrency=8, prediction_cache_path=None
+    )
+
+    result = asyncio.run(evaluator.run_full_evaluation())
+    assert result["dataset_info"]["total_examples"] == 40
+    assert result["baseline_results"]["accuracy"] == 1.0
+    assert result["advanced_results"]["true_labels"][:2] == ["safe", "spam"]
+    assert llm.calls == 80
+
+
+def test_malformed_dataset_fails_without_leaving_workers_behind(tmp_path):
+    """A line that isn't JSON fails the evaluation and its worker tasks are cancelled with it"""
+    import pytest
+
+    dataset = tmp_path / "labelled.jsonl"
+    write_dataset(dataset, [("buy thing", "spam"), ("hello", "safe")])
+    with open(dataset, "a") as f:
+        f.write('{"text": "torn\n')
+    evaluator = ModelEvaluator(
+        classifier=TextClassifier(llm=KeywordLLM()), dataset_path=str(dataset), concurrency=4, prediction_cache_path=None
+    )
+
+    async def run():
+        with pytest.raises(ValueError):
+            await evaluator.evaluate_prompts(["baseline"])
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+
+
+def test_prediction_cache_only_repays_changed_prompts(tmp_path):
+    """A second run reuses cached predictions instead of calling the LLM"""
+    dataset = tmp_path / "labelled.csv"
+    dataset.write_text("text,label\nbuy pills,spam\nnice post,safe\n")
+    cache_path = str(tmp_path / "predictions.db")
+
+    def run():
+        llm = KeywordLLM()
+        evaluator = ModelEvaluator(
+            classifier=TextClassifier(llm=llm), dataset_path=str(dataset), prediction_cache_path=cache_path
+        )
+        results = asyncio.run(evaluator.evaluate_prompts(["baseline"]))
+        evaluator.prediction_cache.close()
+        return llm.calls, results["baseline"]
+
+    first_calls, first = run()
+    second_calls, second = run()
+    assert first_calls == 2 and second_calls == 0
+    assert second["cached_predictions"] == 2
+    assert second["predictions"] == first["predictions"] == ["spam", "safe"]
+
+
+def test_evaluation_jobs_run_in_background_and_survive_restart(tmp_path):
+    """Jobs report progress while running and their results are reloaded after a restart"""
+    from app.eval.jobs import EvaluationJobManager
+
+    dataset = tmp_path / "labelled.jsonl"
+    write_dataset(dataset, [("buy now", "spam"), ("hello", "safe")] * 5)
+    results_dir = str(tmp_path / "results")
+
+    def factory(dataset_path, on_progress):
+        classifier = TextClassifier(llm=KeywordLLM())
+        return ModelEvaluator(classifier=classifier, dataset_path=dataset_path, concurrency=2,
+                              prediction_cache_path=None, on_progress=on_progress)
+
+    async def run():
+        manager = EvaluationJobManager(factory, results_dir=results_dir)
+        await manager.start()
+        job = manager.submit(str(dataset))
+        snapshots = [snapshot async for snapshot in manager.events(job["id"])]
+        result = await manager.result(job["id"])
+        await manager.stop()
+
+        restarted = EvaluationJobManager(factory, results_dir=results_dir)
+        await restarted.start()
+        reloaded = await restarted.result(job["id"])
+        await restarted.stop()
+        return snapshots, result, reloaded, restarted.get(job["id"])
+
+    snapshots, result, reloaded, job = asyncio.run(run())
+    assert snapshots[-1]["status"] == "completed"
+    assert snapshots[-1]["progress"]["done"] == snapshots[-1]["progress"]["total"]
+    assert result["dataset_info"]["total_examples"] == 10
+    assert reloaded == result
+    assert job["status"] == "completed"
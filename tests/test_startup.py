@@ -0,0 +1,46 @@
+import sys
+import os
+import json
+import subprocess
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+# Importing app.main must stay well under this (it took ~2 s with the eager imports)
+IMPORT_BUDGET_S = 1.5
+HEAVY_MODULES = ("sklearn", "langchain_google_genai", "langchain_core", "google.ai.generativelanguage_v1beta")
+
+STARTUP_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+heavy = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    status = client.post("/classify", json={{"text": "hello there"}}).status_code
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy, "status": status}}))
+"""
+
+
+def test_import_is_cheap_and_clients_start_in_lifespan(tmp_path):
+    """Importing the app loads no ML/LLM SDKs, creates no log file and needs no API key"""
+    env = {key: value for key, value in os.environ.items() if key != "GOOGLE_API_KEY"}
+    env.update({
+        "PYTHONPATH": project_root,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": "1",
+        "DATA_DIR": str(tmp_path / "data"),
+    })
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    assert result["heavy"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_S
+    assert result["status"] == 200
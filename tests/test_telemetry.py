@@ -0,0 +1,259 @@
+import sys
+import os
+import random
+
+import pytest
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.telemetry.histogram import LatencyHistogram
+from app.telemetry.telemetry import TelemetryService
+
+
+def test_histogram_quantiles_within_relative_accuracy():
+    """Reported percentiles stay within ~1% of the exact ones"""
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5.5, 0.7) for _ in range(20000)]
+    histogram = LatencyHistogram(relative_accuracy=0.01)
+    for value in values:
+        histogram.record(value)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(histogram.quantile(q) - exact) / exact < 0.02
+    assert histogram.max == max(values)
+
+
+def test_histogram_memory_is_fixed_and_mergeable():
+    """Bucket storage doesn't grow with samples, and merged histograms add up"""
+    first, second = LatencyHistogram(), LatencyHistogram()
+    size = len(first._buckets)
+    for value in range(0, 50000):
+        first.record(value % 900)
+        second.record(1000 + value % 100)
+    assert len(first._buckets) == size
+
+    first.merge(second)
+    assert first.count == 100000
+    assert first.quantile(0.99) > 1000
+    assert first.zero_count > 0  # the 0 ms samples
+
+
+def test_metrics_report_percentiles_per_prompt_and_class():
+    """get_metrics exposes p50/p95/p99 overall, per prompt type and per class"""
+    telemetry = TelemetryService()
+    for latency in range(1, 101):
+        telemetry.record_classification("safe", latency, "advanced")
+    telemetry.record_classification("spam", 0, "local_prefilter")
+
+    metrics = telemetry.get_metrics()
+    assert metrics["total_requests"] == 101
+    assert 93 <= metrics["latency"]["p95_ms"] <= 97
+    assert metrics["latency"]["max_ms"] == 100
+    assert metrics["latency_by_prompt"]["local_prefilter"]["p99_ms"] == 0
+    assert metrics["latency_by_class"]["safe"]["count"] == 100
+
+
+def test_feedback_is_appended_by_background_writer(tmp_path):
+    """Feedback goes to an append-only JSONL log and is on disk after shutdown"""
+    import asyncio
+    from app.telemetry.feedback_store import FeedbackStore
+
+    path = str(tmp_path / "feedback.jsonl")
+
+    async def run():
+        telemetry = TelemetryService(feedback_store=FeedbackStore(path, fsync_interval_s=0.05))
+        await telemetry.feedback_store.start()
+        for i in range(100):
+            telemetry.record_feedback(f"text {i}", "safe", "spam" if i % 4 == 0 else "safe")
+        await telemetry.feedback_store.stop()
+        return telemetry
+
+    telemetry = asyncio.run(run())
+    records = list(FeedbackStore(path).iter_records())
+    assert [record["text"] for record in records] == [f"text {i}" for i in range(100)]
+    assert telemetry.get_metrics()["feedback_counts"] == {"positive": 75, "negative": 25}
+
+
+def test_feedback_store_migrates_legacy_json_and_writes_without_a_loop(tmp_path):
+    """The old JSON array is imported once; sync callers (Streamlit) still persist"""
+    import json
+    from app.telemetry.feedback_store import FeedbackStore
+
+    legacy = tmp_path / "feedback_data.json"
+    legacy.write_text(json.dumps([{"text": "old", "predicted": "safe", "correct": "safe"}]))
+    path = str(tmp_path / "feedback.jsonl")
+
+    store = FeedbackStore(path, legacy_json_path=str(legacy))
+    TelemetryService(feedback_store=store).record_feedback("new", "spam", "spam")
+    store.close()
+    with open(path, "a") as f:
+        f.write('{"text": "torn')  # crash mid-write
+
+    assert [record["text"] for record in FeedbackStore(path).iter_records()] == ["old", "new"]
+
+
+def test_openmetrics_exposes_stage_histograms(tmp_path):
+    """Stage timings are labelled by prompt type and outcome and exported as cumulative buckets"""
+    import re
+    from app.telemetry.feedback_store import FeedbackStore
+
+    telemetry = TelemetryService(feedback_store=FeedbackStore(str(tmp_path / "feedback.jsonl")))
+    for latency in (0.2, 3, 40, 700):
+        telemetry.record_stage("llm", latency, "advanced", "ok")
+    try:
+        with telemetry.time_stage("parse", "advanced"):
+            raise ValueError("garbled")
+    except ValueError:
+        pass
+    telemetry.record_classification("spam", 120, "advanced")
+    telemetry.record_feedback("text", "safe", "spam")
+
+    text = telemetry.render_openmetrics(gauges={
+        "llm_in_flight": ("calls in flight", 2),
+        "token_budget_remaining": ("tokens left", [({"budget": "advanced"}, 900), ({"budget": "cascade"}, 40)]),
+    })
+    assert text.endswith("# EOF\n")
+    assert 'textclf_classifications_total{class="spam"} 1' in text
+    assert 'textclf_stage_duration_seconds_count{stage="parse",prompt_type="advanced",outcome="error"} 1' in text
+    assert 'textclf_stage_duration_seconds_count{stage="feedback_io",prompt_type="",outcome="ok"} 1' in text
+    assert "textclf_llm_in_flight 2" in text
+    # Labelled values share one family
+    assert text.count("# TYPE textclf_token_budget_remaining gauge") == 1
+    assert 'textclf_token_budget_remaining{budget="advanced"} 900' in text
+    assert 'textclf_token_budget_remaining{budget="cascade"} 40' in text
+
+    llm_buckets = re.findall(r'textclf_stage_duration_seconds_bucket\{stage="llm",prompt_type="advanced",outcome="ok",le="([^"]+)"\} (\d+)', text)
+    counts = dict(llm_buckets)
+    assert counts["0.001"] == "1" and counts["0.005"] == "2" and counts["0.05"] == "3" and counts["+Inf"] == "4"
+    values = [int(count) for _, count in llm_buckets]
+    assert values == sorted(values)
+
+
+def test_sqlite_backend_merges_workers(tmp_path):
+    """Each worker publishes a snapshot; any of them reports the summed counters and histograms"""
+    import asyncio
+    from app.telemetry.aggregation import SQLiteAggregator
+    from app.telemetry.feedback_store import FeedbackStore
+
+    db = str(tmp_path / "telemetry.db")
+
+    def worker(name):
+        return TelemetryService(
+            feedback_store=FeedbackStore(str(tmp_path / f"{name}.jsonl")),
+            aggregator=SQLiteAggregator(db, group="run-1", worker_id=name),
+        )
+
+    async def run():
+        stale = SQLiteAggregator(db, group="run-0", worker_id="old")
+        stale.publish(TelemetryService(feedback_store=FeedbackStore(str(tmp_path / "old.jsonl"))).state.to_dict())
+        first, second = worker("a"), worker("b")
+        await first.start()
+        await second.start()
+        for latency in range(1, 101):
+            first.record_classification("safe", latency, "advanced")
+        for latency in range(1001, 1101):
+            second.record_classification("spam", latency, "advanced")
+        second.record_cache_lookup(True)
+        await first.publish()
+        await second.publish()
+        merged = first.get_metrics(await first.collect_state())
+        text = second.render_openmetrics(state=await second.collect_state())
+        await first.stop()
+        await second.stop()
+        return merged, text
+
+    merged, text = asyncio.run(run())
+    assert merged["workers"] == 2
+    assert merged["total_requests"] == 200
+    assert merged["class_distribution"] == {"toxic": 0, "spam": 100, "safe": 100}
+    assert merged["cache"]["hits"] == 1
+    assert merged["latency_by_prompt"]["advanced"]["count"] == 200
+    assert merged["latency"]["p99_ms"] > 1000
+    assert 'textclf_request_duration_seconds_count{prompt_type="advanced"} 200' in text
+    assert "textclf_telemetry_workers 2" in text
+
+
+def test_sqlite_backend_forgets_earlier_runs_on_restart(tmp_path):
+    """Restarting a worker from the same parent (no run id) doesn't keep counting the runs before
+    it; with a run id, a new run drops the old one's snapshots straight away"""
+    import asyncio
+    import time
+    from app.telemetry.aggregation import SQLiteAggregator
+    from app.telemetry.feedback_store import FeedbackStore
+
+    db = str(tmp_path / "telemetry.db")
+
+    async def run_worker(run, **aggregator_kwargs):
+        service = TelemetryService(
+            feedback_store=FeedbackStore(str(tmp_path / f"{run}.jsonl")),
+            aggregator=SQLiteAggregator(db, worker_id=run, **aggregator_kwargs),
+        )
+        await service.start()
+        service.record_classification("safe", 10, "advanced")
+        metrics = service.get_metrics(await service.collect_state())
+        await service.stop()
+        return metrics
+
+    for run in ("first", "second", "third"):
+        metrics = asyncio.run(run_worker(run, group="shell-pid", stale_after_s=0.05))
+        time.sleep(0.1)
+    assert metrics["workers"] == 1
+    assert metrics["total_requests"] == 1
+
+    asyncio.run(run_worker("run-a", group="run-a"))
+    metrics = asyncio.run(run_worker("run-b", group="run-b"))
+    assert metrics["workers"] == 1
+    assert metrics["total_requests"] == 1
+
+
+def test_incomplete_aggregator_fails_at_construction():
+    """A backend missing publish or collect is rejected when built, not at its first publish"""
+    from app.telemetry.aggregation import TelemetryAggregator
+
+    class PublishOnly(TelemetryAggregator):
+        def publish(self, snapshot):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+
+def test_queue_logging_rotates_and_samples_success_logs(tmp_path):
+    """Records reach a size-rotated file via the writer thread; sampled events are thinned out"""
+    import logging
+    import structlog
+    from app.telemetry.custom_logger import SuccessSampler, rotating_file_handler, start_queue_logging
+
+    path = str(tmp_path / "app.log")
+    file_handler = rotating_file_handler(path, max_bytes=2000, backup_count=2)
+    queue_handler, listener = start_queue_logging([file_handler], queue_size=10000)
+    logger = logging.getLogger("test_queue_logging")
+    logger.propagate = False
+    logger.addHandler(queue_handler)
+    try:
+        for i in range(200):
+            logger.warning(f"record {i:04d} " + "x" * 40)
+    finally:
+        listener.stop()
+        file_handler.close()
+    with open(path) as f:
+        assert f.read().splitlines()[-1].startswith("record 0199")
+    assert os.path.exists(path + ".1") and os.path.exists(path + ".2")
+    assert not os.path.exists(path + ".3")
+    assert queue_handler.dropped == 0
+
+    sampler = SuccessSampler(rate=0.1)
+    kept = 0
+    for _ in range(2000):
+        try:
+            event = sampler(None, "info", {"event": "classification has done", "sampled": True})
+            assert "sampled" not in event
+            kept += 1
+        except structlog.DropEvent:
+            pass
+    assert 100 < kept < 300
+    assert sampler(None, "error", {"event": "failed"}) == {"event": "failed"}